@@ -0,0 +1,120 @@
+"""
+Benchmark of the time to the first spoken word of the ChatGPT command.
+
+Runs the ChatGPT command through CommandExecutor against a local fake OpenAI-compatible server,
+with the blocking request and with the response streamed into the TTS sentence by sentence.
+The speech is not played: the TTS stub spends --synthesis-rate seconds per character
+on the first chunk and records when it would be heard. The last run asks the variations
+of the same questions with the response cache and reports its hit rate.
+
+Usage: python -m benchmarks.chatgpt --token-delay 0.05 --repeat 5 --output chatgpt.json
+"""
+
+import argparse
+import logging
+import time
+from typing import Iterable, Optional
+
+import config
+from benchmarks.openai_server import DEFAULT_ANSWER, FakeOpenAIServer
+from benchmarks.utils import latency_stats, write_report
+from commands.chat_client import ChatClient, ResponseCache
+from commands.command_types import CommandChatGPT
+from commands.conversation import ConversationStore
+from commands.executor import CommandExecutor
+from core.text_to_speech import TTS
+
+
+class FirstWordTTS:
+    """
+    TTS stub recording when the first chunk of the response would start playing
+    """
+
+    is_speaking = False
+
+    def __init__(self, synthesis_rate: float):
+        self.synthesis_rate = synthesis_rate
+        self.first_word_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def _play(self, chunks: Iterable[str]) -> str:
+        spoken = []
+        for chunk in chunks:
+            if not spoken:
+                time.sleep(len(chunk) * self.synthesis_rate)
+                self.first_word_at = time.perf_counter()
+            spoken.append(chunk)
+        self.finished_at = time.perf_counter()
+        return " ".join(spoken)
+
+    def speak(self, phrase: str) -> None:
+        self._play(TTS.split_phrase(phrase) if config.TTS_STREAMING else [phrase])
+
+    def speak_stream(self, parts: Iterable[str]) -> str:
+        return self._play(TTS.split_stream(parts))
+
+    def cancel(self) -> None:
+        pass
+
+
+QUESTIONS = ["how far is the moon", "How far is the Moon?", "how far is  the moon!"]
+
+
+def measure(streaming: bool, repeat: int, synthesis_rate: float, cache_size: int = 0) -> dict:
+    """
+    Ask the ChatGPT command several times
+    :param streaming: Stream the response into the TTS
+    :param repeat: Number of the requests
+    :param synthesis_rate: Seconds of the synthesis per character
+    :param cache_size: Size of the response cache. The cache is disabled by default
+    :return: The time to the first word and to the end of the response, the client stats
+    """
+    config.CHATGPT_STREAMING = streaming
+    command = CommandChatGPT(name="chat_gpt", action="chat_gpt")
+    command.chat = ChatClient(ResponseCache(max_items=cache_size, db_path=None))
+    command.conversations = ConversationStore()
+    tts = FirstWordTTS(synthesis_rate)
+    executor = CommandExecutor({"chat_gpt": command}, tts)
+
+    first_word, full_response = [], []
+    for number in range(repeat):
+        # Every question starts a new conversation, so the requests are the same
+        command.conversations.get().clear()
+        started = time.perf_counter()
+        executor.execute_cmd("chat_gpt", QUESTIONS[number % len(QUESTIONS)].split())
+        first_word.append(tts.first_word_at - started)
+        full_response.append(tts.finished_at - started)
+    return {
+        "time_to_first_word": latency_stats(first_word),
+        "full_response": latency_stats(full_response),
+        "client": command.chat.stats,
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--token-delay", type=float, default=0.05, help="Seconds between words")
+    parser.add_argument("--first-token-delay", type=float, default=0.3, help="Seconds")
+    parser.add_argument("--synthesis-rate", type=float, default=0.002, help="Seconds per char")
+    parser.add_argument("--answer", default=DEFAULT_ANSWER)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Path to the JSON report. Printed to stdout if omitted")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    server = FakeOpenAIServer(args.answer, args.token_delay, args.first_token_delay).start()
+    config.OPENAI_BASE_URL = server.base_url
+    try:
+        results = {
+            "blocking": measure(False, args.repeat, args.synthesis_rate),
+            "streaming": measure(True, args.repeat, args.synthesis_rate),
+            "streaming_cached": measure(True, args.repeat, args.synthesis_rate, cache_size=16),
+        }
+    finally:
+        server.stop()
+
+    write_report({"benchmark": "chatgpt", "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
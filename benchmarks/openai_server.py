@@ -0,0 +1,153 @@
+"""
+Local fake of the OpenAI chat completions API for the benchmarks.
+
+Answers every request with the same text, word by word with a fixed delay, both as a whole
+and as a server-sent events stream, the same way as the OpenAI API does.
+
+Usage: python -m benchmarks.openai_server --port 8765 --token-delay 0.05
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+DEFAULT_ANSWER = (
+    "The Moon is about three hundred eighty four thousand kilometers away from the Earth. "
+    "Its light reaches us in a little more than one second. "
+    "It always shows the same side to us, because its rotation is locked to its orbit. "
+    "The far side is not dark, it gets as much sunlight as the near one."
+)
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """
+    HTTP server answering the chat completions requests in a background thread
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        answer: str = DEFAULT_ANSWER,
+        token_delay: float = 0.05,
+        first_token_delay: float = 0.3,
+        port: int = 0,
+    ):
+        """
+        :param answer: The text of every answer
+        :param token_delay: Seconds between the words of the answer
+        :param first_token_delay: Seconds before the first word, e.g. the prompt processing
+        :param port: The port to listen to. A free one by default
+        """
+        super().__init__(("127.0.0.1", port), FakeOpenAIHandler)
+        self.tokens = re.findall(r"\S+\s*", answer)
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.requests = 0
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    server: FakeOpenAIServer
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        self.server.requests += 1
+        time.sleep(self.server.first_token_delay)
+        if request.get("stream"):
+            self._stream(request["model"])
+        else:
+            self._complete(request["model"])
+
+    def _complete(self, model: str) -> None:
+        time.sleep(self.server.token_delay * (len(self.server.tokens) - 1))
+        text = "".join(self.server.tokens).strip()
+        body = json.dumps(
+            {
+                "id": f"chatcmpl-{self.server.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": text},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 0,
+                    "completion_tokens": len(self.server.tokens),
+                    "total_tokens": len(self.server.tokens),
+                },
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, model: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for number, token in enumerate(self.server.tokens):
+            if number:
+                time.sleep(self.server.token_delay)
+            self._send_event(model, {"content": token}, None)
+        self._send_event(model, {}, "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_event(self, model: str, delta: dict, finish_reason: Optional[str]) -> None:
+        event = {
+            "id": f"chatcmpl-{self.server.requests}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+        self.wfile.flush()
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--token-delay", type=float, default=0.05, help="Seconds")
+    parser.add_argument("--first-token-delay", type=float, default=0.3, help="Seconds")
+    parser.add_argument("--answer", default=DEFAULT_ANSWER)
+    args = parser.parse_args(argv)
+
+    server = FakeOpenAIServer(args.answer, args.token_delay, args.first_token_delay, args.port)
+    print(f"Serving the fake OpenAI API at {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Microbenchmark of the PCM conversion of the audio frames before the speech recognition.
+
+Compares CPU time per second of audio of the previous struct.pack conversion of every frame
+with packing to the preallocated buffer aggregating the frames into chunks. With --model the frames
+are also fed to a Vosk recognizer, otherwise only the conversion is measured.
+
+Usage: python -m benchmarks.pcm --seconds 60 --output pcm.json
+"""
+
+import argparse
+import random
+import struct
+import time
+from typing import Callable, Optional
+
+from benchmarks.utils import write_report
+from core.pipeline import PcmBuffer
+
+SAMPLE_RATE = 16000
+FRAME_LENGTH = 512
+
+
+def make_frames(seconds: float, seed: int) -> list[list[int]]:
+    """
+    Make random audio frames as they are returned by the recorder
+    :param seconds: Duration of the audio
+    :param seed: Random seed
+    :return: The frames with int samples
+    """
+    rng = random.Random(seed)
+    count = int(seconds * SAMPLE_RATE / FRAME_LENGTH)
+    return [[rng.randint(-3000, 3000) for _ in range(FRAME_LENGTH)] for _ in range(count)]
+
+
+def struct_pack_path(accept: Callable) -> Callable:
+    def process(frame: list[int]) -> None:
+        accept(struct.pack("h" * len(frame), *frame))
+
+    return process
+
+
+def pcm_buffer_path(accept: Callable, frames_per_chunk: int, wrap: Callable) -> Callable:
+    pcm = PcmBuffer(FRAME_LENGTH, frames_per_chunk)
+    chunk = wrap(pcm.data)
+
+    def process(frame: list[int]) -> None:
+        if pcm.append(frame):
+            accept(chunk)
+            pcm.clear()
+
+    return process
+
+
+def measure(process: Callable, frames: list[list[int]], seconds: float) -> dict:
+    """
+    Measure the CPU time of processing the frames
+    :param process: The function processing a frame
+    :param frames: The audio frames
+    :param seconds: Duration of the audio
+    :return: CPU and wall time per second of audio
+    """
+    cpu_started, wall_started = time.process_time(), time.perf_counter()
+    for frame in frames:
+        process(frame)
+    cpu, wall = time.process_time() - cpu_started, time.perf_counter() - wall_started
+    return {
+        "cpu_ms_per_audio_s": cpu / seconds * 1000,
+        "wall_ms_per_audio_s": wall / seconds * 1000,
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--chunk-frames", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--model", help="Path to a Vosk model to include the recognition cost")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path to the JSON report. Printed to stdout if omitted")
+    args = parser.parse_args(argv)
+
+    frames = make_frames(args.seconds, args.seed)
+    make_accept, wrap = (lambda: lambda data: None), memoryview
+    if args.model:
+        import vosk
+        from vosk.vosk_cffi import ffi
+
+        model = vosk.Model(model_path=args.model)
+        make_accept = lambda: vosk.KaldiRecognizer(model, SAMPLE_RATE).AcceptWaveform  # noqa: E731
+        wrap = ffi.from_buffer
+
+    results = {"struct_pack": measure(struct_pack_path(make_accept()), frames, args.seconds)}
+    for frames_per_chunk in args.chunk_frames:
+        process = pcm_buffer_path(make_accept(), frames_per_chunk, wrap)
+        results[f"pcm_buffer_{frames_per_chunk}"] = measure(process, frames, args.seconds)
+
+    write_report({"benchmark": "pcm", "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
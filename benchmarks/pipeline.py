@@ -0,0 +1,225 @@
+"""
+End-to-end benchmark of the voice pipeline on recorded or generated audio.
+
+Replays WAV/raw PCM files (or generated noise) through STT.va_listen and
+CommandProcessor.respond without audio hardware. The responses are not played.
+Without --model the speech recognizer is replaced with a stub returning --phrases
+at a fixed pace, so the benchmark measures the pipeline overhead in CI. The generated noise
+is silence for the voice activity detector, so use --no-vad to pass it to the stub.
+Reports the real-time factor, CPU time, the latency of the command handling
+and the timing of the pipeline stages.
+
+Usage: python -m benchmarks.pipeline --audio session.wav --model vosk-model --realtime
+"""
+
+import argparse
+import json
+import logging
+import random
+import time
+from typing import Optional
+
+import config
+from benchmarks.utils import latency_stats, write_report
+from commands.processor import CommandProcessor
+from core.audio_source import FileSource, GeneratorSource
+from core.metrics import metrics
+from core.speech_to_text import STT
+
+FRAME_LENGTH = 512
+
+
+class WakeWordAt:
+    """
+    Wake word stub detecting the keyword at the given audio positions
+    """
+
+    frame_length = FRAME_LENGTH
+
+    def __init__(self, positions: list[float], sample_rate: int):
+        self.frames = {int(position * sample_rate / FRAME_LENGTH) for position in positions}
+        self.processed = 0
+
+    def process(self, frame: list[int]) -> int:
+        detected = self.processed in self.frames
+        self.processed += 1
+        return 0 if detected else -1
+
+
+class ScriptedRecognizer:
+    """
+    Speech recognizer stub returning the phrases one by one after every `every` seconds of audio.
+    The words of the phrase appear in the partial result until PARTIAL_COMPLETE_AT of its audio,
+    the rest is the trailing silence waited for by the endpointing
+    """
+
+    PARTIAL_COMPLETE_AT = 0.7
+
+    def __init__(self, phrases: list[str], every: float, sample_rate: int):
+        self.phrases = phrases
+        self.bytes_per_phrase = int(every * sample_rate) * 2
+        self.received = 0
+        self.emitted = 0
+
+    @property
+    def phrase(self) -> str:
+        return self.phrases[self.emitted % len(self.phrases)]
+
+    def _heard_words(self) -> list[str]:
+        words = self.phrase.split()
+        heard = len(words) * self.received / (self.bytes_per_phrase * self.PARTIAL_COMPLETE_AT)
+        return words[: min(int(heard), len(words))]
+
+    def _next_phrase(self) -> None:
+        self.emitted += 1
+        self.received = 0
+
+    def AcceptWaveform(self, data) -> bool:
+        self.received += len(data)
+        return self.received >= self.bytes_per_phrase
+
+    def Result(self) -> str:
+        text = self.phrase
+        self._next_phrase()
+        return json.dumps({"text": text})
+
+    def FinalResult(self) -> str:
+        return json.dumps({"text": ""})
+
+    def PartialResult(self) -> str:
+        return json.dumps({"partial": " ".join(self._heard_words())})
+
+    def Reset(self) -> None:
+        # The phrase is skipped when it was taken from the partial result
+        if self._heard_words() == self.phrase.split():
+            self._next_phrase()
+        self.received = 0
+
+
+class SilentTTS:
+    """
+    TTS stub recording the phrases instead of playing them
+    """
+
+    is_speaking = False
+
+    def __init__(self):
+        self.spoken = []
+
+    def speak(self, phrase: str) -> None:
+        self.spoken.append((time.perf_counter(), phrase))
+
+    def cancel(self) -> None:
+        pass
+
+
+def noise_blocks(seconds: float, sample_rate: int, seed: int):
+    rng = random.Random(seed)
+    for _ in range(int(seconds * sample_rate / FRAME_LENGTH)):
+        yield [rng.randint(-500, 500) for _ in range(FRAME_LENGTH)]
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--audio", nargs="*", default=[], help="WAV or raw PCM files to replay")
+    parser.add_argument("--seconds", type=float, default=30, help="Generated audio without --audio")
+    parser.add_argument("--realtime", action="store_true", help="Replay at the microphone pace")
+    parser.add_argument("--model", help="Path to a Vosk model. A scripted stub is used if omitted")
+    parser.add_argument("--phrases", nargs="+", default=["what time is it"])
+    parser.add_argument("--phrase-every", type=float, default=2.0, help="Seconds, for the stub")
+    parser.add_argument("--wake-at", type=float, nargs="+", default=[0.0], help="Seconds")
+    parser.add_argument(
+        "--vad",
+        action=argparse.BooleanOptionalAction,
+        default=config.VAD_ENABLED,
+        help="Skip the silence before the speech recognizer",
+    )
+    parser.add_argument(
+        "--early",
+        action=argparse.BooleanOptionalAction,
+        default=config.CMD_EARLY_DISPATCH,
+        help="Execute the commands without arguments from the partial results",
+    )
+    parser.add_argument("--commands-dir", help="Commands directory. The project one by default")
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path to the JSON report. Printed to stdout if omitted")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    tts = SilentTTS()
+    processor = CommandProcessor(args.commands_dir, tts=tts)
+
+    recognizer, model = None, None
+    if args.model:
+        import vosk
+
+        model = vosk.Model(model_path=args.model)
+
+    results = []
+    sources = args.audio or [None]
+    for path in sources:
+        if path:
+            source = FileSource(path, FRAME_LENGTH, args.realtime, args.sample_rate)
+        else:
+            blocks = noise_blocks(args.seconds, args.sample_rate, args.seed)
+            source = GeneratorSource(blocks, FRAME_LENGTH, args.realtime, args.sample_rate)
+        if model:
+            recognizer = vosk.KaldiRecognizer(model, args.sample_rate)
+        else:
+            recognizer = ScriptedRecognizer(args.phrases, args.phrase_every, args.sample_rate)
+
+        stt = STT(
+            source=source,
+            wake_word=WakeWordAt(args.wake_at, args.sample_rate),
+            recognizer=recognizer,
+        )
+        if not args.vad:
+            stt.vad = None
+        handled = []
+
+        # The handled phrases and the source of this run are bound, not looked up when called
+        def respond(text: str, handled=handled, source=source) -> bool:
+            started = time.perf_counter()
+            recognized = processor.respond(text)
+            handled.append(
+                {
+                    "text": text,
+                    "audio_position_s": source.position,
+                    "respond_s": time.perf_counter() - started,
+                }
+            )
+            return recognized
+
+        spoken_before = len(tts.spoken)
+        metrics.reset()
+        cpu_started, wall_started = time.process_time(), time.perf_counter()
+        stt.va_listen(respond, on_partial=processor.partial_matcher.update if args.early else None)
+        wall = time.perf_counter() - wall_started
+        cpu = time.process_time() - cpu_started
+
+        results.append(
+            {
+                "audio": path or f"noise {args.seconds} s",
+                "audio_s": source.position,
+                "wall_s": wall,
+                "cpu_s": cpu,
+                "real_time_factor": wall / source.position,
+                "cpu_real_time_factor": cpu / source.position,
+                "dropped_frames": stt.q.dropped,
+                "phrases": len(handled),
+                "responses": len(tts.spoken) - spoken_before,
+                "respond": latency_stats([phrase["respond_s"] for phrase in handled]),
+                "stages": metrics.stats,
+                "transcript": [
+                    {"text": phrase["text"], "audio_position_s": phrase["audio_position_s"]}
+                    for phrase in handled
+                ],
+            }
+        )
+
+    write_report({"benchmark": "pipeline", "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Benchmark of the command recognition on synthetic command catalogs.
+
+Generates `commands/*/config.json` trees of different sizes and utterance corpora with noise
+and argument suffixes, then drives the same code as the assistant does on startup and on every
+recognized phrase. No audio hardware is needed. The memory of the loaded catalog and the memory
+allocated while responding to a phrase are traced with tracemalloc.
+
+Usage: python -m benchmarks.recognizer --sizes 10 100 1000 10000 --output recognizer.json
+"""
+
+import argparse
+import json
+import logging
+import random
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Optional
+
+from benchmarks.utils import latency_stats, write_report
+from commands.creator import CommandCreator
+from commands.processor import CommandProcessor
+from commands.recognizer import CommandRecognizer
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "ze", "po", "da", "gu", "he", "ly"]
+ARGUMENT_WORDS = ["about", "the", "weather", "news", "music", "today", "tomorrow", "cats", "moon"]
+
+
+def make_vocabulary(size: int, rng: random.Random) -> list[str]:
+    """
+    Make a vocabulary of unique pseudo-words built from syllables
+    :param size: Number of the words
+    :param rng: Random generator
+    :return: The vocabulary
+    """
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return sorted(words)
+
+
+def generate_catalog(
+    root: Path,
+    commands: int,
+    aliases_per_command: int,
+    commands_per_config: int,
+    rng: random.Random,
+) -> dict[str, list[str]]:
+    """
+    Write a synthetic commands tree: one directory with a config.json per group of commands
+    :param root: The directory to write the tree to
+    :param commands: Number of the commands
+    :param aliases_per_command: Number of the aliases of every command
+    :param commands_per_config: Number of the commands in every config.json
+    :param rng: Random generator
+    :return: The aliases of every command
+    """
+    vocabulary = make_vocabulary(max(commands, 50), rng)
+    used_aliases = set()
+    catalog = {}
+    for number in range(commands):
+        aliases = []
+        while len(aliases) < aliases_per_command:
+            alias = " ".join(rng.sample(vocabulary, rng.randint(2, 4)))
+            if alias not in used_aliases:
+                used_aliases.add(alias)
+                aliases.append(alias)
+        catalog[f"command_{number}"] = aliases
+
+    names = list(catalog)
+    for start in range(0, len(names), commands_per_config):
+        group = names[start : start + commands_per_config]
+        config = {
+            "commands": [
+                {"name": name, "action": "voice", "aliases": catalog[name], "responses": [name]}
+                for name in group
+            ]
+        }
+        command_dir = root / group[0]
+        command_dir.mkdir(parents=True)
+        (command_dir / "config.json").write_text(json.dumps(config))
+    return catalog
+
+
+def add_noise(text: str, noise: float, rng: random.Random) -> str:
+    """
+    Add recognition-like noise to the text: dropped, replaced and duplicated characters
+    :param text: The clean text
+    :param noise: Probability of every character to be changed
+    :param rng: Random generator
+    :return: The noisy text
+    """
+    chars = []
+    for char in text:
+        if char == " " or rng.random() >= noise:
+            chars.append(char)
+            continue
+        mutation = rng.choice(("drop", "replace", "duplicate"))
+        if mutation == "replace":
+            chars.append(rng.choice("abcdefghijklmnopqrstuvwxyz"))
+        elif mutation == "duplicate":
+            chars.append(char * 2)
+    return "".join(chars)
+
+
+def generate_utterances(
+    catalog: dict[str, list[str]],
+    count: int,
+    noise: float,
+    arguments_rate: float,
+    rng: random.Random,
+) -> list[dict]:
+    """
+    Generate the utterances with the ground truth
+    :param catalog: The aliases of every command
+    :param count: Number of the utterances
+    :param noise: Probability of every alias character to be changed
+    :param arguments_rate: Share of the utterances with an argument suffix
+    :param rng: Random generator
+    :return: The utterances with the expected command name and arguments
+    """
+    names = list(catalog)
+    utterances = []
+    for _ in range(count):
+        name = rng.choice(names)
+        text = add_noise(rng.choice(catalog[name]), noise, rng)
+        arguments = []
+        if rng.random() < arguments_rate:
+            arguments = rng.sample(ARGUMENT_WORDS, rng.randint(1, 3))
+            text = f"{text} {' '.join(arguments)}"
+        utterances.append({"text": text, "cmd_name": name, "arguments": arguments})
+    return utterances
+
+
+class SilentTTS:
+    """
+    TTS stub, so the responses of the commands are not synthesized
+    """
+
+    is_speaking = False
+
+    def speak(self, phrase: str) -> None:
+        pass
+
+    def cancel(self) -> None:
+        pass
+
+
+def trace_respond(processor: CommandProcessor, utterances: list[dict]) -> dict:
+    """
+    Trace the memory allocated while responding to every utterance
+    :param processor: The command processor
+    :param utterances: The utterances
+    :return: The mean and the max of the peak allocation per utterance in bytes
+    """
+    peaks = []
+    tracemalloc.start()
+    for utterance in utterances:
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        processor.respond(utterance["text"])
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    return {"mean_bytes": sum(peaks) / len(peaks), "max_bytes": max(peaks)}
+
+
+def run_size(commands: int, args: argparse.Namespace) -> dict:
+    """
+    Run the benchmark for the catalog of the given size
+    :param commands: Number of the commands in the catalog
+    :param args: The command line arguments
+    :return: The benchmark results
+    """
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir)
+        catalog = generate_catalog(root, commands, args.aliases, args.commands_per_config, rng)
+        utterances = generate_utterances(
+            catalog, args.utterances, args.noise, args.arguments_rate, rng
+        )
+
+        started = time.perf_counter()
+        CommandCreator(tmp_dir).parse_configs()
+        parse_configs_s = time.perf_counter() - started
+
+        snapshot_path = str(root / "commands.pickle")
+        tracemalloc.start()
+        CommandProcessor(tmp_dir, snapshot_path=snapshot_path)
+        catalog_memory_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        started = time.perf_counter()
+        processor = CommandProcessor(tmp_dir, SilentTTS(), snapshot_path=snapshot_path)
+        snapshot_load_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        aliases = processor.read_commands_aliases()
+        read_aliases_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        recognizer = CommandRecognizer(aliases)
+        index_build_s = time.perf_counter() - started
+
+    respond_allocation = trace_respond(processor, utterances)
+    latencies = []
+    correct = correct_arguments = 0
+    for utterance in utterances:
+        started = time.perf_counter()
+        cmd = recognizer.detect_cmd(utterance["text"])
+        latencies.append(time.perf_counter() - started)
+        if cmd.get("recognized") and cmd["cmd_name"] == utterance["cmd_name"]:
+            correct += 1
+            correct_arguments += cmd["arguments"] == utterance["arguments"]
+
+    return {
+        "commands": commands,
+        "aliases": len(aliases),
+        "utterances": len(utterances),
+        "parse_configs_s": parse_configs_s,
+        "snapshot_load_s": snapshot_load_s,
+        "read_commands_aliases_s": read_aliases_s,
+        "index_build_s": index_build_s,
+        "catalog_memory_bytes": catalog_memory_bytes,
+        "respond_allocation": respond_allocation,
+        "detect_cmd": latency_stats(latencies),
+        "throughput_per_s": len(latencies) / sum(latencies),
+        "accuracy": correct / len(utterances),
+        "arguments_accuracy": correct_arguments / len(utterances),
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--aliases", type=int, default=3, help="Aliases per command")
+    parser.add_argument("--commands-per-config", type=int, default=1)
+    parser.add_argument("--utterances", type=int, default=1000)
+    parser.add_argument("--noise", type=float, default=0.05, help="Per-character noise rate")
+    parser.add_argument("--arguments-rate", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path to the JSON report. Printed to stdout if omitted")
+    args = parser.parse_args(argv)
+
+    # Per-phrase logging would dominate the measured latency
+    logging.disable(logging.INFO)
+    report = {
+        "benchmark": "recognizer",
+        "params": vars(args),
+        "results": [run_size(size, args) for size in args.sizes],
+    }
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Capacity benchmark of the server mode.
+
+Starts the server in the process and streams the audio of several concurrent clients
+to it at the microphone pace. Reports the lag between receiving a frame and handling it
+for every number of the sessions, and the capacity: the most sessions handled with
+the 95th percentile of the lag under --max-lag.
+Without --model the speech recognizer of every session is a scripted stub, and the responses
+are not synthesized.
+
+Usage: python -m benchmarks.server --sessions 1 4 16 --workers 4 --model vosk-model
+"""
+
+import argparse
+import logging
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from benchmarks.pipeline import FRAME_LENGTH, ScriptedRecognizer, noise_blocks
+from benchmarks.utils import percentile, write_report
+from commands.processor import CommandProcessor
+from core.audio_source import FileSource, GeneratorSource
+from core.server import AssistantServer, SessionClient
+
+
+class SilentSynthesizer:
+    """
+    TTS stub returning a short silence for every response
+    """
+
+    def synthesize(self, phrase: str) -> np.ndarray:
+        return np.zeros(100, dtype=np.float32)
+
+
+def stream_client(address: tuple, number: int, args: argparse.Namespace, results: list) -> None:
+    """
+    Stream the audio of a client at the microphone pace
+    :param address: The server address
+    :param number: The number of the client
+    :param args: The command line arguments
+    :param results: The list to put the events of the session to
+    :return:
+    """
+    client = SessionClient(*address, session_id=f"client-{number}")
+    if args.audio:
+        source = FileSource(args.audio, FRAME_LENGTH, realtime=True)
+    else:
+        blocks = noise_blocks(args.seconds, args.sample_rate, args.seed + number)
+        source = GeneratorSource(blocks, FRAME_LENGTH, realtime=True)
+    source.start()
+    try:
+        while True:
+            client.send_audio(source.read())
+    except EOFError:
+        pass
+    results.append(client.finish(timeout=args.seconds + 60))
+
+
+def run_sessions(server: AssistantServer, sessions: int, args: argparse.Namespace) -> dict:
+    """
+    Stream the audio of the concurrent clients
+    :param server: The running server
+    :param sessions: Number of the clients
+    :param args: The command line arguments
+    :return: The lag and the phrases of the sessions
+    """
+    server.finished_sessions.clear()
+    results = []
+    clients = [
+        threading.Thread(target=stream_client, args=(server.address, number, args, results))
+        for number in range(sessions)
+    ]
+    cpu_started, wall_started = time.process_time(), time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    cpu = time.process_time() - cpu_started
+    wall = time.perf_counter() - wall_started
+
+    stats = [event["stats"] for events in results for event in events if event["event"] == "end"]
+    lags = [session["frame_lag_p95_ms"] or 0.0 for session in stats]
+    return {
+        "sessions": sessions,
+        "completed": len(stats),
+        "refused": sum(event["event"] == "refused" for events in results for event in events),
+        "phrases": sum(session["phrases"] for session in stats),
+        "frame_lag_p95_ms": max(lags, default=None),
+        "frame_lag_p95_ms_median_session": percentile(lags, 50) if lags else None,
+        "frame_lag_mean_ms": (
+            sum(session["frame_lag_mean_ms"] or 0.0 for session in stats) / len(stats)
+            if stats
+            else None
+        ),
+        "cpu_s": cpu,
+        "cpu_per_audio_s": cpu / (wall * sessions),
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--audio", help="WAV file streamed by every client. Noise if omitted")
+    parser.add_argument("--seconds", type=float, default=10, help="Generated audio without --audio")
+    parser.add_argument("--model", help="Path to a Vosk model. A scripted stub is used if omitted")
+    parser.add_argument("--phrases", nargs="+", default=["what time is it"])
+    parser.add_argument("--phrase-every", type=float, default=2.0, help="Seconds, for the stub")
+    parser.add_argument("--max-lag", type=float, default=250, help="Milliseconds, p95 frame lag")
+    parser.add_argument("--commands-dir", help="Commands directory. The project one by default")
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path to the JSON report. Printed to stdout if omitted")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    if args.model:
+        import vosk
+
+        model = vosk.Model(model_path=args.model)
+
+        def recognizer_factory():
+            return vosk.KaldiRecognizer(model, args.sample_rate)
+
+    else:
+
+        def recognizer_factory():
+            return ScriptedRecognizer(args.phrases, args.phrase_every, args.sample_rate)
+
+    processor = CommandProcessor(args.commands_dir, SilentSynthesizer(), snapshot_path=None)
+    server = AssistantServer(
+        processor,
+        recognizer_factory,
+        SilentSynthesizer(),
+        port=0,
+        workers=args.workers,
+        max_sessions=max(args.sessions),
+    ).start()
+    try:
+        results = [run_sessions(server, sessions, args) for sessions in args.sessions]
+    finally:
+        server.stop()
+
+    within_limit = [
+        result["sessions"]
+        for result in results
+        if result["completed"] == result["sessions"]
+        and result["frame_lag_p95_ms"] is not None
+        and result["frame_lag_p95_ms"] <= args.max_lag
+    ]
+    report = {
+        "benchmark": "server",
+        "params": vars(args),
+        "capacity_sessions": max(within_limit, default=0),
+        "results": results,
+    }
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
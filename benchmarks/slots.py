@@ -0,0 +1,153 @@
+"""
+Throughput benchmark of the argument extraction and the slot filling.
+
+Generates the utterances of the commands with the slots: an alias, possibly misrecognized,
+followed by the numbers in digits or words, the URLs with the spoken or written dots and
+the filler words. Reports the utterances handled per second and the accuracy of the extracted
+arguments and the filled values, for the slot filling alone and with the alias extraction.
+
+Usage: python -m benchmarks.slots --utterances 10000 --noise 0.05
+"""
+
+import argparse
+import logging
+import random
+import time
+from typing import Optional
+
+from benchmarks.recognizer import add_noise
+from benchmarks.utils import write_report
+from commands.recognizer import CommandRecognizer
+from commands.slots import UNITS, SlotSchema
+
+TENS_WORDS = ["twenty", "thirty", "forty", "fifty"]
+FILLERS = ["for", "the", "please", "pasta", "eggs", "now", "quickly", "tea"]
+DOMAINS = ["youtube", "github", "wikipedia", "google", "news dot bbc"]
+
+COMMANDS = {
+    "timer": {
+        "aliases": ["set a timer", "start the countdown"],
+        "slots": {"minutes": {"type": "number"}, "label": {"type": "text"}},
+    },
+    "open_site": {
+        "aliases": ["open website", "go to the page"],
+        "slots": {"url": {"type": "url"}},
+    },
+    "alarm": {
+        "aliases": ["wake me up at", "set an alarm for"],
+        "slots": {"hours": {"type": "number"}, "minutes": {"type": "number", "default": 0}},
+    },
+}
+
+
+def spoken_number(rng: random.Random) -> tuple[str, int]:
+    """
+    Generate a number in digits or in words
+    :param rng: Random generator
+    :return: The text and the value
+    """
+    value = rng.randint(1, 59)
+    if rng.random() < 0.3:
+        return str(value), value
+    units = list(UNITS)
+    if value < 20:
+        return units[value], value
+    text = TENS_WORDS[value // 10 - 2]
+    return (f"{text} {units[value % 10]}" if value % 10 else text), value
+
+
+def generate_utterances(count: int, noise: float, rng: random.Random) -> list[dict]:
+    """
+    Generate the utterances with the ground truth
+    :param count: Number of the utterances
+    :param noise: Probability of every alias character to be changed
+    :param rng: Random generator
+    :return: The utterances with the expected command, arguments and params
+    """
+    utterances = []
+    for _ in range(count):
+        name = rng.choice(list(COMMANDS))
+        alias = rng.choice(COMMANDS[name]["aliases"])
+        if name == "timer":
+            number, minutes = spoken_number(rng)
+            label = rng.sample(FILLERS, rng.randint(1, 2))
+            arguments = ["for", *number.split(), "minutes", *label]
+            params = {"minutes": minutes, "label": " ".join(["for", "minutes", *label])}
+        elif name == "open_site":
+            domain = rng.choice(DOMAINS)
+            spoken = rng.random() < 0.5
+            url = f"{domain} dot com" if spoken else f"{domain.replace(' dot ', '.')}.com"
+            arguments = url.split()
+            params = {"url": f"https://{domain.replace(' dot ', '.')}.com"}
+        else:
+            hours_text, hours = spoken_number(rng)
+            minutes_text, minutes = spoken_number(rng)
+            arguments = [*hours_text.split(), "and", *minutes_text.split()]
+            params = {"hours": hours, "minutes": minutes}
+        text = f"{add_noise(alias, noise, rng)} {' '.join(arguments)}"
+        utterances.append({"text": text, "alias": alias, "arguments": arguments, "params": params})
+    return utterances
+
+
+def measure(handle, utterances: list[dict], key: str) -> dict:
+    """
+    Run the handler over the utterances
+    :param handle: The function handling an utterance
+    :param utterances: The utterances with the ground truth
+    :param key: The key of the ground truth compared with the result
+    :return: The throughput and the accuracy
+    """
+    results = []
+    started = time.perf_counter()
+    for utterance in utterances:
+        results.append(handle(utterance))
+    elapsed = time.perf_counter() - started
+    correct = sum(result == utterance[key] for result, utterance in zip(results, utterances))
+    return {
+        "utterances_per_s": len(utterances) / elapsed,
+        "mean_us": elapsed / len(utterances) * 1e6,
+        "accuracy": correct / len(utterances),
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--utterances", type=int, default=10000)
+    parser.add_argument("--noise", type=float, default=0.05, help="Per-character noise rate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path to the JSON report. Printed to stdout if omitted")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    rng = random.Random(args.seed)
+    utterances = generate_utterances(args.utterances, args.noise, rng)
+    aliases = tuple((name, alias) for name, spec in COMMANDS.items() for alias in spec["aliases"])
+    slots = {name: SlotSchema(spec["slots"]) for name, spec in COMMANDS.items()}
+    alias_slots = {alias: slots[name] for name, alias in aliases}
+    recognizer = CommandRecognizer(aliases, slots)
+
+    report = {
+        "benchmark": "slots",
+        "params": vars(args),
+        "fill": measure(
+            lambda u: alias_slots[u["alias"]].fill(" ".join(u["arguments"])), utterances, "params"
+        ),
+        "split_arguments": measure(
+            lambda u: recognizer.split_arguments(u["text"], u["alias"]), utterances, "arguments"
+        ),
+        "split_and_fill": measure(
+            lambda u: alias_slots[u["alias"]].fill(
+                " ".join(recognizer.split_arguments(u["text"], u["alias"]))
+            ),
+            utterances,
+            "params",
+        ),
+        "detect_cmd": measure(
+            lambda u: recognizer.detect_cmd(u["text"])["params"], utterances, "params"
+        ),
+    }
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
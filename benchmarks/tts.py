@@ -0,0 +1,150 @@
+"""
+Benchmark of the speech synthesis under concurrent callers.
+
+Several callers synthesize sentences at the same time, e.g. the sessions of the server mode
+or the chunks of long answers, with and without coalescing the requests of the same sentence.
+A share of the sentences is common to the callers, like the responses of the same commands.
+The cache is disabled, so every request reaches the model. Without --silero the model is a stub
+spending --call-overhead seconds per call and --char-rate seconds per character.
+
+Usage: python -m benchmarks.tts --callers 1 4 16 --sentences 20 --silero
+"""
+
+import argparse
+import logging
+import random
+import threading
+import time
+from typing import Optional
+
+from benchmarks.utils import latency_stats, write_report
+from core.audio_cache import AudioCache
+from core.text_to_speech import TTS
+
+SENTENCES = [
+    "The weather is fine today.",
+    "It is twenty past ten.",
+    "Opening the browser.",
+    "The moon is about three hundred eighty thousand kilometers away.",
+    "I have set the timer for five minutes.",
+    "Playing your favourite music.",
+]
+
+
+class StubModel:
+    """
+    Silero model stub. The time is spent in sleep, which releases the GIL like the torch ops
+    """
+
+    def __init__(self, call_overhead: float, char_rate: float):
+        self.call_overhead = call_overhead
+        self.char_rate = char_rate
+
+    def apply_tts(self, text: str, speaker: str, sample_rate: int):
+        import torch
+
+        time.sleep(self.call_overhead + len(text) * self.char_rate)
+        return torch.zeros(len(text) * sample_rate // 15)
+
+
+def make_workload(callers: int, sentences: int, shared: float, seed: int) -> list[list[str]]:
+    """
+    Make the sentences of every caller
+    :param callers: Number of the callers
+    :param sentences: Sentences of every caller
+    :param shared: Share of the sentences common to the callers
+    :param seed: Random seed
+    :return: The sentences of every caller
+    """
+    rng = random.Random(seed)
+    workload = []
+    for caller in range(callers):
+        texts = []
+        for number in range(sentences):
+            text = rng.choice(SENTENCES)
+            if rng.random() >= shared:
+                text = f"{text} Request {number} of caller {caller}."
+            texts.append(text)
+        workload.append(texts)
+    return workload
+
+
+def run(tts: TTS, workload: list[list[str]]) -> dict:
+    """
+    Synthesize the sentences of the concurrent callers
+    :param tts: The TTS
+    :param workload: The sentences of every caller
+    :return: The throughput and the latency of the sentences
+    """
+    latencies = []
+    lock = threading.Lock()
+
+    def caller(texts: list[str]) -> None:
+        for text in texts:
+            started = time.perf_counter()
+            tts.synthesize(text)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=caller, args=(texts,)) for texts in workload]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    return {
+        "sentences": len(latencies),
+        "sentences_per_s": len(latencies) / wall,
+        "latency": latency_stats(latencies),
+    }
+
+
+def make_tts(model, coalesce: bool) -> TTS:
+    """
+    Make the TTS without the cache
+    :param model: The model
+    :param coalesce: Synthesize the same sentence of the concurrent callers once
+    :return: The TTS
+    """
+    tts = TTS()
+    tts._model = model
+    tts.cache = AudioCache(max_items=0, cache_dir=None)
+    if not coalesce:
+        tts.coalescer = None
+    return tts
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--callers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--sentences", type=int, default=10, help="Sentences of every caller")
+    parser.add_argument("--shared", type=float, default=0.5, help="Share of common sentences")
+    parser.add_argument("--silero", action="store_true", help="Use the Silero model from .env")
+    parser.add_argument("--call-overhead", type=float, default=0.02, help="Seconds, for the stub")
+    parser.add_argument("--char-rate", type=float, default=0.0005, help="Seconds, for the stub")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path to the JSON report. Printed to stdout if omitted")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    model = TTS().load() if args.silero else StubModel(args.call_overhead, args.char_rate)
+    # Torch is imported and the model is warmed up before the measurements
+    make_tts(model, False).run_model(SENTENCES[0])
+    results = []
+    for callers in args.callers:
+        workload = make_workload(callers, args.sentences, args.shared, args.seed)
+        coalesced = make_tts(model, True)
+        results.append(
+            {
+                "callers": callers,
+                "per_phrase": run(make_tts(model, False), workload),
+                "coalesced": run(coalesced, workload),
+                "coalescer": coalesced.coalescer.stats,
+            }
+        )
+    write_report({"benchmark": "tts", "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
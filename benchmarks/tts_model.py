@@ -0,0 +1,124 @@
+"""
+Benchmark of the optimized variants of the TTS model against the stock one.
+
+Every variant is measured in a fresh process: the load time, the resident memory added by
+the model, the size on the disk and the real-time factor of the synthesis, the seconds spent
+per second of the audio, so below 1 is faster than the playback.
+The variants are exported with python -m core.tts_model, the stock model is loaded by torch.hub.
+
+Usage: python -m benchmarks.tts_model --models models/silero-frozen models/silero-int8
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import resource
+import time
+from pathlib import Path
+from typing import Optional
+
+import config
+from benchmarks.tts import SENTENCES
+from benchmarks.utils import latency_stats, write_report
+
+STOCK = "stock"
+
+
+def rss_mb() -> Optional[float]:
+    """
+    Get the resident memory of the process
+    :return: Megabytes or None if it is unknown on the platform
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except OSError:
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def size_mb(path: str) -> float:
+    return sum(file.stat().st_size for file in Path(path).rglob("*") if file.is_file()) / 2**20
+
+
+def measure(variant: str, repeats: int, threads: int) -> dict:
+    """
+    Load the variant and synthesize the sentences
+    :param variant: The directory of the variant or STOCK
+    :param repeats: Times every sentence is synthesized
+    :param threads: Torch threads, 0 keeps the torch default
+    :return: The measurements
+    """
+    import torch
+
+    from core.tts_model import load_model
+
+    logging.disable(logging.INFO)
+    if threads > 0:
+        torch.set_num_threads(threads)
+    memory_before = rss_mb()
+    started = time.perf_counter()
+    if variant == STOCK:
+        model, _ = torch.hub.load(
+            repo_or_dir="snakers4/silero-models",
+            model="silero_tts",
+            language=config.LANGUAGE,
+            speaker=config.MODEL_ID,
+            trust_repo=True,
+        )
+        model.to(config.TTS_DEVICE)
+    else:
+        model = load_model(variant, config.TTS_DEVICE)
+    load_s = time.perf_counter() - started
+    memory_after = rss_mb()
+
+    def synthesize(text: str) -> float:
+        with torch.inference_mode():
+            audio = model.apply_tts(
+                text=text, speaker=config.SPEAKER, sample_rate=config.TTS_SAMPLE_RATE
+            )
+        return len(audio) / config.TTS_SAMPLE_RATE
+
+    # The first call compiles the TorchScript graphs
+    synthesize(SENTENCES[0])
+    latencies, audio_s = [], 0.0
+    for _ in range(repeats):
+        for text in SENTENCES:
+            started = time.perf_counter()
+            audio_s += synthesize(text)
+            latencies.append(time.perf_counter() - started)
+    return {
+        "variant": variant,
+        "load_s": load_s,
+        "model_rss_mb": None if memory_before is None else memory_after - memory_before,
+        # Kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "size_mb": None if variant == STOCK else size_mb(variant),
+        "rtf": sum(latencies) / audio_s,
+        "latency": latency_stats(latencies),
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--models", nargs="*", default=[], help="Directories of the variants")
+    parser.add_argument("--no-stock", action="store_true", help="Skip the stock model")
+    parser.add_argument("--repeats", type=int, default=3, help="Times every sentence is spoken")
+    parser.add_argument("--threads", type=int, default=config.TTS_THREADS)
+    parser.add_argument("--output", help="Path to the JSON report. Printed to stdout if omitted")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    variants = ([] if args.no_stock else [STOCK]) + args.models
+    # A fresh process for every variant, so the load and the memory of the others don't count
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for variant in variants:
+        with context.Pool(1) as pool:
+            results.append(pool.apply(measure, (variant, args.repeats, args.threads)))
+    write_report({"benchmark": "tts_model", "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
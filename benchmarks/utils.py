@@ -0,0 +1,53 @@
+"""Helpers shared by the benchmarks"""
+
+import json
+import math
+import statistics
+from typing import Optional
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Get the percentile of the values using the nearest-rank method
+    :param values: The measured values
+    :param q: The percentile, from 0 to 100
+    :return: The percentile value
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def latency_stats(latencies: list[float]) -> dict:
+    """
+    Summarize the latencies measured in seconds
+    :param latencies: The latencies in seconds
+    :return: The latency percentiles in milliseconds
+    """
+    if not latencies:
+        return {"count": 0}
+    return {
+        "count": len(latencies),
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000,
+    }
+
+
+def write_report(report: dict, output: Optional[str] = None) -> None:
+    """
+    Write the benchmark report as JSON to the file or to the stdout
+    :param report: The benchmark report
+    :param output: Path to the output file
+    :return:
+    """
+    content = json.dumps(report, indent=2)
+    if output is None:
+        print(content)
+        return
+    with open(output, "w") as f:
+        f.write(content)
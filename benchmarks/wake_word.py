@@ -0,0 +1,169 @@
+"""
+Benchmark of the wake word detectors on recorded audio.
+
+Every engine runs alone and behind the energy gate over the same frames. Reports the frames
+processed per second of CPU time, the CPU time per second of audio, the share of the frames
+reaching the engine behind the gate, and the detections: the hit rate on the --positives
+recordings, each with the wake word spoken once, and the false accepts per hour
+on the --negatives recordings without it.
+Without --negatives, generated audio with a quiet noise and bursts of loud noise every few
+seconds is used. The stub engine spends --stub-cost-ms of CPU per frame and detects nothing,
+so the gate can be measured without the keyword models.
+
+Usage: python -m benchmarks.wake_word --engines porcupine vosk --positives hey*.wav
+    --negatives tv.wav
+"""
+
+import argparse
+import logging
+import time
+from typing import Optional
+
+import numpy as np
+
+import config
+from benchmarks.utils import write_report
+from core.audio_source import EndOfStream, FileSource
+from core.vad import VoiceActivityDetector
+from core.wake_word import (
+    FRAME_LENGTH,
+    EnergyGatedDetector,
+    PorcupineDetector,
+    VoskKeywordDetector,
+    WakeWordDetector,
+)
+
+
+class StubDetector(WakeWordDetector):
+    """
+    Detector spending the CPU time of a keyword model on every frame and detecting nothing
+    """
+
+    def __init__(self, cost: float):
+        super().__init__()
+        self.cost = cost
+
+    def _process(self, frame: list[int]) -> int:
+        deadline = time.process_time() + self.cost
+        while time.process_time() < deadline:
+            pass
+        return -1
+
+
+def make_detector(engine: str, args: argparse.Namespace) -> WakeWordDetector:
+    if engine == "porcupine":
+        return PorcupineDetector()
+    if engine == "vosk":
+        return VoskKeywordDetector(args.phrase, model_path=args.model, sample_rate=args.sample_rate)
+    return StubDetector(args.stub_cost_ms / 1000)
+
+
+def read_frames(path: str, sample_rate: int) -> list[list[int]]:
+    source = FileSource(path, FRAME_LENGTH, sample_rate=sample_rate)
+    frames = []
+    try:
+        while True:
+            frames.append(source.read())
+    except EndOfStream:
+        return frames
+
+
+def generated_frames(seconds: float, sample_rate: int, seed: int) -> list[list[int]]:
+    """
+    Generate a quiet noise with a second of a loud noise every four seconds
+    :param seconds: Length of the audio
+    :param sample_rate: The sample rate
+    :param seed: Random seed
+    :return: The frames
+    """
+    rng = np.random.default_rng(seed)
+    samples = rng.integers(-30, 30, int(seconds * sample_rate), dtype=np.int16)
+    for start in range(sample_rate, len(samples), 4 * sample_rate):
+        burst = samples[start : start + sample_rate]
+        burst[:] = rng.integers(-3000, 3000, len(burst), dtype=np.int16)
+    usable = len(samples) - len(samples) % FRAME_LENGTH
+    return samples[:usable].reshape(-1, FRAME_LENGTH).tolist()
+
+
+def run(detector: WakeWordDetector, recordings: list[list[list[int]]]) -> tuple[float, list[int]]:
+    """
+    Pass the recordings through the detector
+    :param detector: The detector
+    :param recordings: The frames of every recording
+    :return: The CPU seconds and the detections in every recording
+    """
+    cpu, detections = 0.0, []
+    for frames in recordings:
+        detector.reset()
+        detected = 0
+        started = time.process_time()
+        for frame in frames:
+            if detector.process(frame) >= 0:
+                detected += 1
+        cpu += time.process_time() - started
+        detections.append(detected)
+    return cpu, detections
+
+
+def measure(detector: WakeWordDetector, positives: list, negatives: list, sample_rate: int) -> dict:
+    """
+    Measure the detector on the recordings
+    :param detector: The detector
+    :param positives: The frames of the recordings with the wake word
+    :param negatives: The frames of the recordings without it
+    :param sample_rate: The sample rate
+    :return: The measurements
+    """
+    negative_cpu, false_accepts = run(detector, negatives)
+    positive_cpu, hits = run(detector, positives)
+    frames = sum(map(len, positives)) + sum(map(len, negatives))
+    negative_hours = sum(map(len, negatives)) * FRAME_LENGTH / sample_rate / 3600
+    cpu = negative_cpu + positive_cpu
+    return {
+        "frames_per_cpu_s": frames / cpu if cpu else None,
+        "cpu_per_audio_s": cpu / (frames * FRAME_LENGTH / sample_rate) if frames else None,
+        "idle_cpu_per_audio_s": (negative_cpu / (negative_hours * 3600) if negative_hours else None),
+        "hit_rate": sum(hit > 0 for hit in hits) / len(hits) if hits else None,
+        "false_accepts": sum(false_accepts),
+        "false_accepts_per_hour": sum(false_accepts) / negative_hours if negative_hours else None,
+        "detector": detector.stats,
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--engines", nargs="+", choices=["porcupine", "vosk", "stub"], default=["stub"]
+    )
+    parser.add_argument("--positives", nargs="*", default=[], help="Recordings with the wake word")
+    parser.add_argument("--negatives", nargs="*", default=[], help="Recordings without it")
+    parser.add_argument("--seconds", type=float, default=60, help="Generated audio, no --negatives")
+    parser.add_argument("--phrase", default=config.WAKE_WORD_PHRASE, help="Wake phrase of vosk")
+    parser.add_argument(
+        "--model", default=config.WAKE_WORD_MODEL_PATH or config.MODEL_PATH, help="Vosk model"
+    )
+    parser.add_argument("--stub-cost-ms", type=float, default=0.5, help="CPU per frame, for stub")
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path to the JSON report. Printed to stdout if omitted")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    positives = [read_frames(path, args.sample_rate) for path in args.positives]
+    negatives = [read_frames(path, args.sample_rate) for path in args.negatives] or [
+        generated_frames(args.seconds, args.sample_rate, args.seed)
+    ]
+    results = []
+    for engine in args.engines:
+        for gated in (False, True):
+            detector = make_detector(engine, args)
+            if gated:
+                detector = EnergyGatedDetector(detector, VoiceActivityDetector(args.sample_rate))
+            result = measure(detector, positives, negatives, args.sample_rate)
+            results.append({"engine": engine, "gated": gated, **result})
+            detector.delete()
+    write_report({"benchmark": "wake_word", "params": vars(args), "results": results}, args.output)
+
+
+if __name__ == "__main__":
+    main()
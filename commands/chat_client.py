@@ -0,0 +1,300 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Iterator, Optional
+
+import config
+
+# Number of the last requests kept for the latency percentiles
+LATENCY_WINDOW = 256
+
+
+class ResponseCache:
+    """
+    Cache of the ChatGPT responses keyed by the model and the normalized messages,
+    so the questions differing only in case, punctuation and spaces share the response.
+    The responses expire after the TTL. The recently used ones are kept in memory,
+    and the optional SQLite database keeps them across restarts
+    """
+
+    def __init__(
+        self,
+        max_items: int = config.CHATGPT_CACHE_SIZE,
+        ttl: float = config.CHATGPT_CACHE_TTL,
+        db_path: Optional[str] = config.CHATGPT_CACHE_DB,
+    ):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.items: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db = self._open_db(db_path) if db_path and max_items > 0 else None
+
+    def _open_db(self, db_path: str) -> Optional[sqlite3.Connection]:
+        """
+        Open the database and drop the expired responses
+        :param db_path: Path to the database file
+        :return: The connection or None if the database can't be opened
+        """
+        try:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            db = sqlite3.connect(db_path, check_same_thread=False)
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+            db.commit()
+            return db
+        except sqlite3.Error as e:
+            logging.error(f"Error opening the ChatGPT cache {db_path}: {e}")
+            return None
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        Normalize the text of the message
+        :param text: The text to normalize
+        :return: Lowercase text without punctuation and with collapsed whitespaces
+        """
+        return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+    @classmethod
+    def make_key(cls, model: str, messages: list[dict]) -> str:
+        """
+        Make the cache key of the request
+        :param model: The model name
+        :param messages: The messages of the request
+        :return: The key digest
+        """
+        normalized = [(message["role"], cls.normalize(message["content"])) for message in messages]
+        return hashlib.sha256(json.dumps([model, normalized]).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Get the response from the memory or from the database
+        :param key: The cache key
+        :return: The response or None if it is not cached or expired
+        """
+        expires_after = time.time() - self.ttl
+        with self.lock:
+            item = self.items.get(key)
+            if item is not None and item[0] >= expires_after:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            self.items.pop(key, None)
+
+            item = self._read(key, expires_after)
+            if item is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, *item)
+            return item[1]
+
+    def put(self, key: str, response: str) -> None:
+        """
+        Put the response to the cache and to the database
+        :param key: The cache key
+        :param response: The response
+        :return:
+        """
+        if self.max_items <= 0:
+            return
+        created = time.time()
+        with self.lock:
+            self._remember(key, created, response)
+            if self.db is None:
+                return
+            try:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, created) VALUES (?, ?, ?)",
+                    (key, response, created),
+                )
+                self.db.commit()
+            except sqlite3.Error as e:
+                logging.error(f"Error writing the ChatGPT cache: {e}")
+
+    def _remember(self, key: str, created: float, response: str) -> None:
+        """
+        Put the response to the memory and evict the least recently used one
+        :param key: The cache key
+        :param created: The time the response was received
+        :param response: The response
+        :return:
+        """
+        self.items[key] = (created, response)
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+
+    def _read(self, key: str, expires_after: float) -> Optional[tuple[float, str]]:
+        """
+        Read the response from the database
+        :param key: The cache key
+        :param expires_after: The responses received earlier are expired
+        :return: The time the response was received and the response, or None
+        """
+        if self.db is None:
+            return None
+        try:
+            return self.db.execute(
+                "SELECT created, response FROM responses WHERE key = ? AND created >= ?",
+                (key, expires_after),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logging.error(f"Error reading the ChatGPT cache: {e}")
+            return None
+
+    @property
+    def stats(self) -> dict:
+        """
+        Get the cache counters
+        :return: Number of the cache hits, misses, the hit rate and the responses in memory
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "cached": len(self.items),
+        }
+
+
+class ChatClient:
+    """
+    Client of the ChatGPT API shared by all the chat commands, so the connections
+    of the single OpenAI client are reused between the requests.
+    The responses are answered from the cache when possible
+    """
+
+    def __init__(self, cache: Optional[ResponseCache] = None):
+        self._client = None
+        self.client_lock = threading.Lock()
+        self.cache = cache or ResponseCache()
+        self.requests = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.first_token_latencies = deque(maxlen=LATENCY_WINDOW)
+
+    @property
+    def client(self):
+        """
+        The OpenAI client is created on the first request, so loading the commands
+        doesn't import the OpenAI package
+        :return: The OpenAI client
+        """
+        with self.client_lock:
+            if self._client is None:
+                from openai import OpenAI
+
+                self._client = OpenAI(
+                    api_key=config.OPENAI_API_KEY,
+                    base_url=config.OPENAI_BASE_URL,
+                )
+        return self._client
+
+    def complete(self, model: str, messages: list[dict]) -> str:
+        """
+        Get the response to the messages
+        :param model: The model name
+        :param messages: The messages of the request
+        :return: The response
+        """
+        key = self.cache.make_key(model, messages)
+        response = self.cache.get(key)
+        if response is not None:
+            logging.info("ChatGPT response is taken from the cache")
+            return response
+
+        started = time.perf_counter()
+        try:
+            completion = self.client.chat.completions.create(model=model, messages=messages)
+        except Exception:
+            self.errors += 1
+            raise
+        response = str(completion.choices[0].message.content)
+        self._record(started)
+        self.cache.put(key, response)
+        return response
+
+    def stream(self, model: str, messages: list[dict]) -> Iterator[str]:
+        """
+        Get the response to the messages while it is generated.
+        The response is cached only when it is received completely
+        :param model: The model name
+        :param messages: The messages of the request
+        :return: The parts of the response
+        """
+        key = self.cache.make_key(model, messages)
+        response = self.cache.get(key)
+        if response is not None:
+            logging.info("ChatGPT response is taken from the cache")
+            yield response
+            return
+
+        started = time.perf_counter()
+        parts = []
+        try:
+            events = self.client.chat.completions.create(model=model, messages=messages, stream=True)
+        except Exception:
+            self.errors += 1
+            raise
+        try:
+            for event in events:
+                if event.choices and event.choices[0].delta.content:
+                    if not parts:
+                        self.first_token_latencies.append(time.perf_counter() - started)
+                    parts.append(event.choices[0].delta.content)
+                    yield parts[-1]
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            events.close()
+        self._record(started)
+        if parts:
+            self.cache.put(key, "".join(parts))
+
+    def _record(self, started: float) -> None:
+        """
+        Record the latency of the request
+        :param started: The time the request was sent
+        :return:
+        """
+        self.requests += 1
+        self.latencies.append(time.perf_counter() - started)
+        logging.info(f"ChatGPT request took {self.latencies[-1]:.3f} s: {self.stats}")
+
+    @staticmethod
+    def _percentile_ms(latencies: deque, q: float) -> Optional[float]:
+        if not latencies:
+            return None
+        ordered = sorted(latencies)
+        return ordered[min(int(q / 100 * len(ordered)), len(ordered) - 1)] * 1000
+
+    @property
+    def stats(self) -> dict:
+        """
+        Get the request counters and the latency of the last requests
+        :return: Number of the requests, errors, the cache counters and the latency percentiles
+        """
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "cache": self.cache.stats,
+            "latency_p50_ms": self._percentile_ms(self.latencies, 50),
+            "latency_p95_ms": self._percentile_ms(self.latencies, 95),
+            "first_token_p50_ms": self._percentile_ms(self.first_token_latencies, 50),
+        }
+
+
+chat_client = ChatClient()
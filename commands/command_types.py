@@ -1,24 +1,98 @@
-import importlib.util
 import logging
 import random
+import sys
 from types import ModuleType
-from typing import Optional
-
-from openai import OpenAI
+from typing import Iterable, Iterator, Optional
 
 import config
+from commands.chat_client import chat_client
+from commands.conversation import DEFAULT_SESSION, conversations
+from commands.loader import script_loader
+from commands.slots import SlotSchema
+from core.metrics import metrics
 
 
 class CommandBase:
-    def __init__(self, *args, **kwargs):
-        self.name = None
-        self.action = None
-        self.aliases = []
-        self.responses = []
-        self.script_path = None
-        self.depends_on = None
-        self.params = {}
-        self.arguments = []
+    """
+    Record of a command read from the config. The commands are created once per catalog
+    and are shared by all the phrases, so they have fixed slots instead of a dictionary
+    """
+
+    __slots__ = (
+        "name",
+        "action",
+        "aliases",
+        "responses",
+        "script_path",
+        "depends_on",
+        "params",
+        "slots",
+    )
+    # Slots that are not saved to the catalog snapshot
+    TRANSIENT_SLOTS: tuple[str, ...] = ()
+
+    def __init__(
+        self,
+        name: Optional[str] = None,
+        action: Optional[str] = None,
+        aliases: Iterable[str] = (),
+        responses: Optional[list[str]] = None,
+        script_path: Optional[str] = None,
+        depends_on=None,
+        params: Optional[dict] = None,
+        slots: Optional[dict[str, dict]] = None,
+    ):
+        """
+        :param name: Name of the command
+        :param action: Action to execute
+        :param aliases: Aliases of the command
+        :param responses: Responses of the command
+        :param script_path: Path to the script of the command
+        :param depends_on: The command or the name of the command this command depends on
+        :param params: Parameters of the command (read from the config)
+        :param slots: Specs of the slots filled from the user input (read from the config)
+        :raises ValueError: If the slots are invalid
+        """
+        self.name = name
+        self.action = action
+        # Interned, so the same alias text is stored once by the commands and the recognizer
+        self.aliases = tuple(sys.intern(alias) for alias in aliases)
+        self.responses = responses or []
+        self.script_path = script_path
+        self.depends_on = depends_on
+        self.params = params or {}
+        self.slots = SlotSchema(slots) if slots else None
+
+    def __getstate__(self) -> dict:
+        return {
+            slot: getattr(self, slot)
+            for cls in type(self).__mro__
+            for slot in getattr(cls, "__slots__", ())
+            if slot not in self.TRANSIENT_SLOTS and hasattr(self, slot)
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        for slot, value in state.items():
+            setattr(self, slot, value)
+        self.aliases = tuple(sys.intern(alias) for alias in self.aliases)
+
+    def __copy__(self) -> "CommandBase":
+        # The transient slots are copied too, unlike in the snapshot
+        clone = object.__new__(type(self))
+        for cls in type(self).__mro__:
+            for slot in getattr(cls, "__slots__", ()):
+                if hasattr(self, slot):
+                    setattr(clone, slot, getattr(self, slot))
+        return clone
+
+    @property
+    def takes_arguments(self) -> bool:
+        """
+        Commands taking the arguments from the user input wait for the end of the phrase,
+        the others can be executed as soon as their alias is recognized
+        :return: True if the command has slots, otherwise the "arguments" param, True by default
+        """
+        return self.slots is not None or bool(self.params.get("arguments", True))
 
 
 class CommandVoice(CommandBase):
@@ -26,6 +100,12 @@ class CommandVoice(CommandBase):
     Simple commands that only require a voice response
     """
 
+    __slots__ = ()
+
+    @property
+    def takes_arguments(self) -> bool:
+        return False
+
     def execute(self, *args, **kwargs) -> str:
         return random.choice(self.responses)
 
@@ -35,8 +115,33 @@ class CommandScript(CommandBase):
     Commands that require a script to be executed
     """
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+    __slots__ = ()
+    # Params that control the execution and are not passed to the script
+    EXECUTION_PARAMS = ("timeout", "background", "arguments")
+
+    @property
+    def timeout(self) -> float:
+        """
+        Seconds to wait for the script result
+        :return: The timeout from the params or the default one
+        """
+        return float(self.params.get("timeout", config.SCRIPT_TIMEOUT))
+
+    @property
+    def background(self) -> bool:
+        """
+        Background scripts are fire-and-forget: they have no timeout and no response is expected
+        :return: True if the script runs in the background
+        """
+        return bool(self.params.get("background", False))
+
+    @property
+    def script_params(self) -> dict:
+        """
+        Get the params that are passed to the script
+        :return: The params without the execution ones
+        """
+        return {k: v for k, v in self.params.items() if k not in self.EXECUTION_PARAMS}
 
     def get_script_path(self) -> str:
         """
@@ -48,33 +153,45 @@ class CommandScript(CommandBase):
             return self.depends_on.script_path
         return self.script_path
 
-    def get_result_from_script(self, script_module: ModuleType) -> Optional[str]:
+    def get_result_from_script(
+        self,
+        script_module: ModuleType,
+        arguments: Iterable[str] = (),
+        params: Optional[dict] = None,
+    ) -> Optional[str]:
         """
-        Get the result from the script module
+        Get the result from the script module.
+        The script gets the argument words and the params of the config updated
+        with the slots filled from the user input
         :param script_module: The script module
+        :param arguments: The argument words from the user input
+        :param params: The typed values of the slots
         :return: The result
         """
         try:
-            result = script_module.script(*self.arguments, **self.params)
+            result = script_module.script(*arguments, **{**self.script_params, **(params or {})})
         except Exception as e:
             logging.error(f"Error executing the script: {e}", exc_info=True)
             return None
         return result
 
-    def execute(self, *args, **kwargs) -> Optional[str]:
+    @metrics.timed("cmd_script")
+    def execute(
+        self, arguments: Iterable[str] = (), params: Optional[dict] = None, **kwargs
+    ) -> Optional[str]:
         """
         Execute the script. The script should be placed in the same directory as the command config
-        and has a name "script.py"
+        and has a name "script.py". The script module is loaded once and cached by the script loader
+        :param arguments: The argument words from the user input
+        :param params: The typed values of the slots
         :return:
         """
-        spec = importlib.util.spec_from_file_location("script", self.get_script_path())
-        script_module = importlib.util.module_from_spec(spec)
-        try:
-            spec.loader.exec_module(script_module)
-        except FileNotFoundError as e:
-            logging.error(f"Script file {self.script_path} not found for command {self.name}: {e}")
+        script_module = script_loader.get(self.get_script_path())
+        if script_module is None:
+            logging.error(f"Script file {self.get_script_path()} not found for command {self.name}")
+            return None
 
-        result = self.get_result_from_script(script_module)
+        result = self.get_result_from_script(script_module, arguments, params)
 
         return result
 
@@ -84,30 +201,61 @@ class CommandChatGPT(CommandBase):
     Commands that require a request to the ChatGPT API
     """
 
+    __slots__ = ("chat", "conversations")
+    # The shared client and conversations are attached again when the snapshot is loaded
+    TRANSIENT_SLOTS = ("chat", "conversations")
+    MODEL = "gpt-3.5-turbo"
+    SYSTEM_PROMPT = "You are a helpful assistant."
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.client = OpenAI(
-            api_key=config.OPENAI_API_KEY,
-        )
+        # All the chat commands share the client, its connections and the response cache
+        self.chat = chat_client
+        self.conversations = conversations
+
+    def __setstate__(self, state: dict) -> None:
+        super().__setstate__(state)
+        self.chat = chat_client
+        self.conversations = conversations
 
+    @metrics.timed("cmd_chatgpt")
     def execute(self, *args, **kwargs) -> str:
         """
         Get the voice input and send a request to the ChatGPT API
+        with the history of the conversation
         :param args: list of words from the user input
-        :param kwargs: The keyword arguments
+        :param kwargs: The keyword arguments. "session" selects the conversation
         :return: The response from the ChatGPT API
         """
-        self.arguments = " ".join(args[0])
-        logging.info(f"Executing ChatGPT command with arguments: {self.arguments}")
-        response = self.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": " ".join(self.arguments)},
-            ],
+        question = " ".join(args[0])
+        logging.info(f"Executing ChatGPT command with the question: {question}")
+        conversation = self.conversations.get(kwargs.get("session", DEFAULT_SESSION))
+        response = self.chat.complete(
+            self.MODEL, conversation.get_messages(self.SYSTEM_PROMPT, question)
         )
-        logging.info(f"ChatGPT response: {response.choices[0].message.content}")
-        return str(response.choices[0].message.content)
+        logging.info(f"ChatGPT response: {response}")
+        conversation.add(question, response)
+        return response
+
+    @metrics.timed_stream("cmd_chatgpt")
+    def stream(self, *args, **kwargs) -> Iterator[str]:
+        """
+        Send a request to the ChatGPT API and get the response while it is generated.
+        The response is added to the conversation when it is received completely
+        :param args: list of words from the user input
+        :param kwargs: The keyword arguments. "session" selects the conversation
+        :return: The parts of the response from the ChatGPT API
+        """
+        question = " ".join(args[0])
+        logging.info(f"Streaming ChatGPT command with the question: {question}")
+        conversation = self.conversations.get(kwargs.get("session", DEFAULT_SESSION))
+        parts = []
+        for part in self.chat.stream(
+            self.MODEL, conversation.get_messages(self.SYSTEM_PROMPT, question)
+        ):
+            parts.append(part)
+            yield part
+        conversation.add(question, "".join(parts))
 
 
 COMMAND_TYPES = {
@@ -0,0 +1,142 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+
+import config
+
+# Tokens added by the API to every message
+MESSAGE_TOKENS = 4
+# Share of the budget left after trimming the history. The history is trimmed by large steps,
+# so the same prefix of the messages is sent with several next requests
+TRIM_TO = 0.5
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+DEFAULT_SESSION = "default"
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimate the number of the tokens in the text: a word or a punctuation mark is a token,
+    which is close to the tokenizers of the GPT models for the English text
+    :param text: The text
+    :return: The number of the tokens
+    """
+    return len(TOKEN_PATTERN.findall(text)) + MESSAGE_TOKENS
+
+
+@dataclass
+class Turn:
+    """
+    A question of the user and the answer of the assistant
+    """
+
+    question: str
+    answer: str
+    tokens: int
+
+
+class Conversation:
+    """
+    History of the conversation with ChatGPT, so the follow-up questions have the context.
+    The history is bounded by the number of the tokens and of the turns: the oldest turns
+    are dropped when it doesn't fit the budget. The conversation starts over after a timeout
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = config.CHATGPT_HISTORY_TOKENS,
+        max_turns: int = config.CHATGPT_HISTORY_TURNS,
+        timeout: float = config.CHATGPT_HISTORY_TIMEOUT,
+    ):
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.turns: deque[Turn] = deque(maxlen=max_turns)
+        self.tokens = 0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _expire(self) -> None:
+        """
+        Forget the history if the conversation was idle for longer than the timeout
+        :return:
+        """
+        if self.turns and time.monotonic() - self.updated > self.timeout:
+            logging.info("The conversation is expired")
+            self.turns.clear()
+            self.tokens = 0
+
+    def get_messages(self, system_prompt: str, question: str) -> list[dict]:
+        """
+        Get the messages of the request: the system prompt, the history and the question
+        :param system_prompt: The system prompt
+        :param question: The question of the user
+        :return: The messages
+        """
+        messages = [{"role": "system", "content": system_prompt}]
+        with self.lock:
+            self._expire()
+            for turn in self.turns:
+                messages.append({"role": "user", "content": turn.question})
+                messages.append({"role": "assistant", "content": turn.answer})
+        messages.append({"role": "user", "content": question})
+        return messages
+
+    def add(self, question: str, answer: str) -> None:
+        """
+        Add the turn to the history and trim the history to the budget
+        :param question: The question of the user
+        :param answer: The answer of the assistant
+        :return:
+        """
+        turn = Turn(question, answer, count_tokens(question) + count_tokens(answer))
+        with self.lock:
+            self._expire()
+            if len(self.turns) == self.turns.maxlen:
+                self.tokens -= self.turns[0].tokens
+            self.turns.append(turn)
+            self.tokens += turn.tokens
+            self.updated = time.monotonic()
+            if self.tokens > self.max_tokens:
+                while self.turns and self.tokens > self.max_tokens * TRIM_TO:
+                    self.tokens -= self.turns.popleft().tokens
+                logging.info(
+                    f"Conversation history is trimmed to {len(self.turns)} turns, "
+                    f"{self.tokens} tokens"
+                )
+
+    def clear(self) -> None:
+        with self.lock:
+            self.turns.clear()
+            self.tokens = 0
+
+
+class ConversationStore:
+    """
+    Conversations of the sessions, e.g. of the rooms served by the assistant.
+    The least recently used conversations are dropped when there are too many of them
+    """
+
+    def __init__(self, max_sessions: int = config.CHATGPT_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self.conversations: OrderedDict[str, Conversation] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session: str = DEFAULT_SESSION) -> Conversation:
+        """
+        Get the conversation of the session, starting a new one if needed
+        :param session: The session id
+        :return: The conversation
+        """
+        with self.lock:
+            conversation = self.conversations.get(session)
+            if conversation is None:
+                conversation = self.conversations[session] = Conversation()
+            self.conversations.move_to_end(session)
+            while len(self.conversations) > self.max_sessions:
+                self.conversations.popitem(last=False)
+            return conversation
+
+
+conversations = ConversationStore()
@@ -1,3 +1,4 @@
+import copy
 import json
 import logging
 import os
@@ -12,9 +13,11 @@ class CommandCreator:
     Class to create the command classes from the json configs
     """
 
-    def __init__(self):
-        self.commands_dir = os.path.join(os.path.dirname(__file__))
+    def __init__(self, commands_dir: Optional[str] = None):
+        self.commands_dir = commands_dir or os.path.join(os.path.dirname(__file__))
         self.commands = {}
+        # Commands of every config file with its modification time and size
+        self.configs: dict[Path, tuple[tuple[int, int], dict]] = {}
 
     @staticmethod
     def create_command_class(
@@ -25,9 +28,10 @@ class CommandCreator:
         script_path: Optional[str] = None,
         depends_on: str = None,
         params: Optional[dict] = None,
-    ) -> type:
+        slots: Optional[dict] = None,
+    ) -> command_types.CommandBase:
         """
-        Create a new command class and set default attributes
+        Create a new command of the action type
         :param name: Name of the command
         :param action: Action to execute
         :param aliases: List of aliases for the command
@@ -35,48 +39,110 @@ class CommandCreator:
         :param script_path: Path to the script for the command
         :param depends_on: Name of the command this command depends on
         :param params: Parameters for the command (read from the config)
-        :param arguments: Arguments for the command (recognized from the user input)
-        :return: New command class
+        :param slots: Slots of the command filled from the user input (read from the config)
+        :return: New command
+        :raises ValueError: If the action is unknown or the slots are invalid
         """
-        command = command_types.COMMAND_TYPES.get(action)()
-        # Set attributes to the class
-        args = locals().copy()
-        for attr in args:
-            try:
-                setattr(command, attr, args[attr])
-            except AttributeError as e:
-                logging.error(f"Error setting the attribute {attr} to the command class: {e}")
-        return command
+        command_type = command_types.COMMAND_TYPES.get(action)
+        if command_type is None:
+            raise ValueError(f"Unknown action {action!r} of the command {name}")
+        return command_type(
+            name=name,
+            action=action,
+            aliases=aliases,
+            responses=responses,
+            script_path=script_path,
+            depends_on=depends_on,
+            params=params,
+            slots=slots,
+        )
 
     def parse_configs(self) -> dict[str, command_types.CommandBase]:
         """
         Parse the all the configs and create the command classes
         :return: Dictionary of the command classes
         """
-        command_dir_path = Path(self.commands_dir)
-        for config_file in command_dir_path.rglob("config.json"):
-            with open(config_file, "r") as f:
-                logging.info(f"Reading the command config: {config_file}")
-                commands = self.create_commands(f.read())
-                self.commands.update(commands)
-        self.create_command_dependencies()
+        self.refresh()
         logging.info(f"Commands created: {self.commands}")
         return self.commands
 
+    def refresh(self) -> bool:
+        """
+        Parse the new and changed configs and drop the commands of the removed ones.
+        The configs are compared by the modification time and size, so only the changed ones
+        are read. The commands of a config that can't be parsed are kept until it is fixed.
+        The commands dictionary is replaced, not modified, so the previous one can still be used
+        :return: True if the commands were changed
+        """
+        configs = {}
+        changed = False
+        for config_file in Path(self.commands_dir).rglob("config.json"):
+            try:
+                stat = config_file.stat()
+            except OSError:
+                continue
+            signature = (stat.st_mtime_ns, stat.st_size)
+            previous = self.configs.get(config_file)
+            if previous is not None and previous[0] == signature:
+                configs[config_file] = previous
+                continue
+            commands = self.read_config(config_file)
+            if commands is None:
+                commands = previous[1] if previous is not None else {}
+            else:
+                changed = True
+            configs[config_file] = (signature, commands)
+
+        if not changed and configs.keys() == self.configs.keys():
+            self.configs = configs
+            return False
+        self.configs = configs
+        self.commands = {
+            name: command for _, commands in configs.values() for name, command in commands.items()
+        }
+        self.create_command_dependencies()
+        return True
+
+    def read_config(self, config_file: Path) -> Optional[dict[str, command_types.CommandBase]]:
+        """
+        Read the config file and create its commands
+        :param config_file: Path to the config file
+        :return: The commands or None if the config can't be read
+        """
+        logging.info(f"Reading the command config: {config_file}")
+        try:
+            with open(config_file, "r") as f:
+                cmd_json = json.load(f)
+            return self.create_commands_from_json(cmd_json)
+        except (OSError, ValueError) as e:
+            logging.error(f"Error parsing the command config {config_file}: {e}", exc_info=True)
+            return None
+
     def create_commands(self, config: str) -> dict[str, command_types.CommandBase]:
         """
         Create commands from the config
         :param config: The command config as a string in JSON format
         :return:
         """
-        commands = {}
         try:
-            cmd_json = json.loads(config)
-        except json.JSONDecodeError as e:
+            return self.create_commands_from_json(json.loads(config))
+        except ValueError as e:
             logging.error(f"Error parsing the command config: {e}", exc_info=True)
             return self.commands
 
+    def create_commands_from_json(self, cmd_json: dict) -> dict[str, command_types.CommandBase]:
+        """
+        Create commands from the parsed config
+        :param cmd_json: The command config
+        :return:
+        :raises ValueError: If the config has no list of commands or a command is invalid
+        """
+        if not isinstance(cmd_json, dict) or not isinstance(cmd_json.get("commands"), list):
+            raise ValueError('The config should have a "commands" list')
+        commands = {}
         for command_data in cmd_json["commands"]:
+            if not isinstance(command_data, dict):
+                raise ValueError(f"The command should be an object, not {command_data!r}")
             command_name = command_data.get("name")
             action = command_data.get("action")
             command_aliases = command_data.get("aliases", [])
@@ -87,6 +153,7 @@ class CommandCreator:
             )
             depends_on = command_data.get("depends_on")
             params = command_data.get("params", {})
+            slots = command_data.get("slots")
 
             command = self.create_command_class(
                 command_name,
@@ -96,6 +163,7 @@ class CommandCreator:
                 script_path,
                 depends_on,
                 params,
+                slots,
             )
             commands[command_name] = command
 
@@ -104,15 +172,43 @@ class CommandCreator:
     def create_command_dependencies(self) -> None:
         """
         Create the command dependencies after all the commands are created
-        When a command depends on another command, set the dependency
+        When a command depends on another command, set the dependency.
+        The dependencies that are already set are resolved again by the name,
+        because the command they depend on could be re-created. Such a command can still be
+        used by the previous catalog, so it is rebound on a copy, which replaces it
         :return:
         """
-        for command_name, command in self.commands.items():
-            if command.depends_on:
-                depends_on = self.commands.get(command.depends_on)
+        # Commands bound by the previous refresh, which can be used by the previous catalog
+        shared = {
+            id(command)
+            for command in self.commands.values()
+            if command.depends_on and not isinstance(command.depends_on, str)
+        }
+        # Copies of the commands by the ids of the replaced ones
+        copies: dict[int, command_types.CommandBase] = {}
+        rebound = True
+        # A copy changes the dependency of the commands depending on it, so repeat until stable
+        while rebound:
+            rebound = False
+            for command_name, command in list(self.commands.items()):
+                if not command.depends_on:
+                    continue
+                name = getattr(command.depends_on, "name", command.depends_on)
+                depends_on = self.commands.get(name)
                 if depends_on is None:
-                    logging.error(
-                        f"Command {command_name} depends on {command.depends_on} which does not exist."
-                    )
+                    logging.error(f"Command {command_name} depends on {name} which does not exist.")
+                    continue
+                if command.depends_on is depends_on:
                     continue
+                if id(command) in shared:
+                    shared.discard(id(command))
+                    clone = copy.copy(command)
+                    copies[id(command)] = clone
+                    self.commands[command_name] = command = clone
                 command.depends_on = depends_on
+                rebound = True
+        if copies:
+            self.configs = {
+                config_file: (signature, {n: copies.get(id(c), c) for n, c in commands.items()})
+                for config_file, (signature, commands) in self.configs.items()
+            }
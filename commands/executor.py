@@ -1,27 +1,102 @@
 import logging
+from typing import Iterable, Optional
 
-from core.text_to_speech import tts
+import config
+from commands.command_types import CommandBase, CommandChatGPT, CommandScript
+from commands.conversation import DEFAULT_SESSION
+from commands.workers import script_pool
 
 
 class CommandExecutor:
-    def __init__(self, commands: dict) -> None:
+    """
+    Executes the commands of a catalog and speaks their responses.
+    It is created once per catalog and reused for every phrase
+    """
+
+    def __init__(self, commands: dict, tts=None) -> None:
+        """
+        :param commands: The commands dictionary
+        :param tts: The text to speech engine. The shared Silero TTS by default
+        """
         self.commands = commands
-        self.tts = tts
+        self._tts = tts
+        self.pool = script_pool
+
+    @property
+    def tts(self):
+        """
+        The shared TTS is imported on the first response, so the commands package
+        can be used without loading the TTS model
+        :return: The text to speech engine
+        """
+        if self._tts is None:
+            from core.text_to_speech import tts
+
+            self._tts = tts
+        return self._tts
 
-    def execute_cmd(self, cmd_name: str, arguments: list) -> bool:
+    def execute_cmd(
+        self,
+        cmd_name: str,
+        arguments: list,
+        tts=None,
+        session: str = DEFAULT_SESSION,
+        params: Optional[dict] = None,
+    ) -> bool:
         """
-        Execute the command
+        Execute the command.
+        Script commands are dispatched to the worker pool, so the listening loop is not blocked
+        and their response is spoken when the script is finished
         :param cmd_name: The name of the command to execute
         :param arguments: The arguments for the command
-        :return: True if the command was executed, False otherwise
+        :param tts: The text to speech engine of the session. The executor one by default
+        :param session: The session the command came from, e.g. the room of the assistant
+        :param params: The typed values of the command slots filled from the user input
+        :return: True if the command was executed or dispatched, False otherwise
         """
+        tts = tts or self.tts
         command = self.commands.get(cmd_name) or self.commands.get("chat_gpt")
-        # TODO: fix the problem with script commands returning None (e.g. open_browser)
-        response = command.execute(arguments)
-        # If we have a response, speak it
+        if isinstance(command, CommandScript):
+            return self.pool.submit(
+                command,
+                arguments,
+                lambda cmd, result: self.speak_response(cmd, result, tts),
+                params,
+            )
+        if isinstance(command, CommandChatGPT) and config.CHATGPT_STREAMING:
+            return self.speak_stream(command, command.stream(arguments, session=session), tts)
+
+        response = command.execute(arguments, session=session)
+        return self.speak_response(command, response, tts)
+
+    def speak_stream(self, command: CommandBase, parts: Iterable[str], tts=None) -> bool:
+        """
+        Speak the response of the command while it is generated
+        :param command: The executed command
+        :param parts: The parts of the response
+        :param tts: The text to speech engine. The executor one by default
+        :return: True if the response was spoken, False otherwise
+        """
+        if (tts or self.tts).speak_stream(parts):
+            return True
+
+        logging.warning(f"Command {command.name} returned no response.")
+        return False
+
+    def speak_response(self, command: CommandBase, response: Optional[str], tts=None) -> bool:
+        """
+        Speak the response of the command
+        :param command: The executed command
+        :param response: The response of the command
+        :param tts: The text to speech engine. The executor one by default
+        :return: True if the response was spoken or not expected, False otherwise
+        """
         if response:
-            self.tts.speak(response)
+            (tts or self.tts).speak(response)
+            return True
+
+        if isinstance(command, CommandScript) and command.background:
             return True
 
-        logging.warning(f"Command {cmd_name} not found in the commands list.")
+        logging.warning(f"Command {command.name} returned no response.")
         return False
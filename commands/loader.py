@@ -0,0 +1,118 @@
+import hashlib
+import importlib.util
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from types import ModuleType
+from typing import Optional
+
+
+@dataclass
+class CachedScript:
+    module: ModuleType
+    mtime_ns: int
+    size: int
+    digest: str
+
+
+class ScriptLoader:
+    """
+    Cache of the loaded command scripts.
+    A script is compiled and executed once and then reused until the file changes.
+    The cache is keyed by the resolved script path, so the commands linked with `depends_on`
+    share the same module
+    """
+
+    def __init__(self):
+        self.scripts: dict[str, CachedScript] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    @staticmethod
+    def _digest(path: str) -> str:
+        """
+        Get the hash of the script file content
+        :param path: Path to the script
+        :return: The sha256 hex digest
+        """
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    @staticmethod
+    def _load(path: str) -> ModuleType:
+        """
+        Compile and execute the script module
+        :param path: Path to the script
+        :return: The script module
+        """
+        spec = importlib.util.spec_from_file_location("script", path)
+        script_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(script_module)
+        return script_module
+
+    def get(self, script_path: str) -> Optional[ModuleType]:
+        """
+        Get the script module from the cache or load it.
+        The script is reloaded when its modification time or size has changed
+        and the content hash differs from the cached one
+        :param script_path: Path to the script
+        :return: The script module or None if the script file is not found
+        """
+        path = str(Path(script_path).resolve())
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.invalidate(path)
+            return None
+
+        with self.lock:
+            cached = self.scripts.get(path)
+            if cached and (cached.mtime_ns, cached.size) == (stat.st_mtime_ns, stat.st_size):
+                self.hits += 1
+                return cached.module
+
+            digest = self._digest(path)
+            if cached and cached.digest == digest:
+                # The file was touched, but the content is the same
+                cached.mtime_ns, cached.size = stat.st_mtime_ns, stat.st_size
+                self.hits += 1
+                return cached.module
+
+            self.misses += 1
+            logging.info(f"Loading the script {path}")
+            module = self._load(path)
+            self.loads += 1
+            self.scripts[path] = CachedScript(module, stat.st_mtime_ns, stat.st_size, digest)
+            return module
+
+    def invalidate(self, script_path: Optional[str] = None) -> None:
+        """
+        Remove the script from the cache, or clear the whole cache
+        :param script_path: Path to the script. All the scripts are removed if not set
+        :return:
+        """
+        with self.lock:
+            if script_path is None:
+                self.scripts.clear()
+                return
+            self.scripts.pop(str(Path(script_path).resolve()), None)
+
+    @property
+    def stats(self) -> dict:
+        """
+        Get the cache counters
+        :return: Number of the cache hits, misses, loads and cached scripts
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "cached": len(self.scripts),
+        }
+
+
+script_loader = ScriptLoader()
@@ -1,31 +1,174 @@
 """Class to process commands from the user"""
 
 import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Optional
 
+import config
 from commands.command_types import CommandBase
+from commands.conversation import DEFAULT_SESSION
 from commands.creator import CommandCreator
 from commands.executor import CommandExecutor
-from commands.recognizer import CommandRecognizer
+from commands.recognizer import CommandRecognizer, PartialMatcher
+from commands.snapshot import CatalogSnapshot, fingerprint_configs, scan_configs
 
 logging.basicConfig(level=logging.INFO)
 
 
+@dataclass
+class Catalog:
+    """
+    The commands and the structures built from them.
+    A new catalog is built when the commands are changed and replaces the previous one at once,
+    so a phrase is always handled by a consistent set of them.
+    The recognizer and the executor live as long as the catalog and are shared by the phrases
+    """
+
+    commands: dict[str, CommandBase]
+    # Flat table of the (command name, alias) pairs
+    aliases: tuple[tuple[str, str], ...]
+    recognizer: CommandRecognizer
+    partial_matcher: PartialMatcher
+    version: int = 0
+    # Holds the TTS, so it is not saved to the snapshot and is attached by the processor
+    executor: Optional[CommandExecutor] = field(default=None, compare=False)
+
+    @classmethod
+    def build(cls, commands: dict[str, CommandBase], version: int = 0, tts=None) -> "Catalog":
+        """
+        Build the catalog of the commands
+        :param commands: The commands dictionary
+        :param version: The number of the catalog reloads
+        :param tts: The text to speech engine of the executor
+        :return: The catalog
+        """
+        aliases = tuple(
+            (command.name, alias) for command in commands.values() for alias in command.aliases
+        )
+        slots = {name: command.slots for name, command in commands.items() if command.slots}
+        recognizer = CommandRecognizer(aliases, slots)
+        partial_matcher = PartialMatcher(
+            recognizer,
+            {name for name, command in commands.items() if not command.takes_arguments},
+        )
+        executor = CommandExecutor(commands, tts)
+        return cls(commands, aliases, recognizer, partial_matcher, version, executor)
+
+    def __getstate__(self) -> dict:
+        return {**self.__dict__, "executor": None}
+
+
 class CommandProcessor:
     """
     Class to process commands from the user
     """
 
-    def __init__(self) -> None:
-        self.commands = self.read_commands_from_configs()
-        self.aliases = self.read_commands_aliases()
+    def __init__(
+        self,
+        commands_dir: Optional[str] = None,
+        tts=None,
+        snapshot_path: Optional[str] = config.CMD_SNAPSHOT_PATH,
+    ) -> None:
+        """
+        :param commands_dir: Directory with the commands configs. The package directory by default
+        :param tts: The text to speech engine to speak the responses. The Silero TTS by default
+        :param snapshot_path: Path to the catalog snapshot. The snapshot is not used if empty
+        """
+        self.tts = tts
+        self.creator = CommandCreator(commands_dir)
+        self.reload_lock = threading.Lock()
+        self.snapshot_path = snapshot_path
+        self.catalog = self.load_catalog()
+
+    def load_catalog(self) -> Catalog:
+        """
+        Load the catalog from the snapshot if it is up to date.
+        Otherwise build it from the configs and save the snapshot
+        :return: The catalog
+        """
+        if not self.snapshot_path:
+            return Catalog.build(self.creator.parse_configs(), tts=self.tts)
+
+        snapshot = CatalogSnapshot(self.snapshot_path, self.creator.commands_dir)
+        content = snapshot.load()
+        if content is not None:
+            catalog = content["catalog"]
+            catalog.executor = CommandExecutor(catalog.commands, self.tts)
+            self.creator.commands = catalog.commands
+            self.creator.configs = content["configs"]
+            return catalog
+
+        # Taken before reading, so a config changed meanwhile invalidates the snapshot
+        manifest = scan_configs(self.creator.commands_dir)
+        catalog = Catalog.build(self.creator.parse_configs(), tts=self.tts)
+        snapshot.save(
+            fingerprint_configs(self.creator.commands_dir, manifest),
+            catalog=catalog,
+            configs=self.creator.configs,
+        )
+        return catalog
+
+    def save_snapshot(self, path: Optional[str] = None) -> None:
+        """
+        Save the snapshot of the current catalog
+        :param path: Path to the snapshot. The processor one by default
+        :return:
+        """
+        snapshot = CatalogSnapshot(path or self.snapshot_path, self.creator.commands_dir)
+        with self.reload_lock:
+            snapshot.save(
+                fingerprint_configs(self.creator.commands_dir),
+                catalog=self.catalog,
+                configs=self.creator.configs,
+            )
+
+    @property
+    def commands(self) -> dict[str, CommandBase]:
+        return self.catalog.commands
+
+    @property
+    def aliases(self) -> tuple[tuple[str, str], ...]:
+        return self.catalog.aliases
+
+    @property
+    def recognizer(self) -> CommandRecognizer:
+        return self.catalog.recognizer
+
+    @property
+    def partial_matcher(self) -> PartialMatcher:
+        return self.catalog.partial_matcher
+
+    def reload(self) -> bool:
+        """
+        Re-read the changed commands configs and replace the catalog.
+        The phrases are handled by the current catalog while the new one is built
+        :return: True if the commands were changed
+        """
+        with self.reload_lock:
+            manifest = scan_configs(self.creator.commands_dir) if self.snapshot_path else None
+            if not self.creator.refresh():
+                return False
+            self.catalog = Catalog.build(self.creator.commands, self.catalog.version + 1, self.tts)
+            if self.snapshot_path:
+                CatalogSnapshot(self.snapshot_path, self.creator.commands_dir).save(
+                    fingerprint_configs(self.creator.commands_dir, manifest),
+                    catalog=self.catalog,
+                    configs=self.creator.configs,
+                )
+        logging.info(
+            f"Commands reloaded: version {self.catalog.version}, {len(self.commands)} commands"
+        )
+        return True
 
     @staticmethod
-    def read_commands_from_configs() -> dict[str, CommandBase]:
+    def read_commands_from_configs(commands_dir: Optional[str] = None) -> dict[str, CommandBase]:
         """
         Read the commands from the configs
+        :param commands_dir: Directory with the commands configs. The package directory by default
         :return: The commands dictionary
         """
-        return CommandCreator().parse_configs()
+        return CommandCreator(commands_dir).parse_configs()
 
     def read_commands_aliases(self):
         """
@@ -36,16 +179,34 @@ class CommandProcessor:
             (command.name, alias) for command in self.commands.values() for alias in command.aliases
         ]
 
-    def respond(self, raw_voice: str):
+    def read_commands_grammar(self) -> list[str]:
+        """
+        Read the phrases of the speech recognizer grammar from the commands aliases
+        :return: The unique lowercase aliases
+        """
+        return sorted({alias.lower() for _, alias in self.aliases})
+
+    def read_commands_responses(self) -> list[str]:
+        """
+        Read the responses of the voice commands
+        :return: The list of all the responses
+        """
+        return [
+            response for command in self.commands.values() for response in command.responses or []
+        ]
+
+    def respond(self, raw_voice: str, tts=None, session: str = DEFAULT_SESSION):
         """
         Respond to the user input.
         First, clean the user input, then recognize the command and execute it.
         :param raw_voice: The raw user input from the microphone
+        :param tts: The text to speech engine of the session. The processor one by default
+        :param session: The session the input came from
         :return: The response from the command
         """
         logging.info("Recognizing the command")
-        recognizer = CommandRecognizer(self.aliases)
-        cmd = recognizer.detect_cmd(raw_voice)
+        catalog = self.catalog
+        cmd = catalog.recognizer.detect_cmd(raw_voice)
 
         # TODO: refactor this solution
         if cmd["cmd_name"] == "":
@@ -54,9 +215,10 @@ class CommandProcessor:
 
         logging.info(f"Command recognized: {cmd}")
         logging.info("Executing the command")
-        # TODO: refactor to make the executor more readable
-        executor = CommandExecutor(self.commands)
-        return executor.execute_cmd(
+        return catalog.executor.execute_cmd(
             cmd_name=cmd["cmd_name"],
             arguments=cmd["arguments"],
+            tts=tts,
+            session=session,
+            params=cmd["params"],
         )
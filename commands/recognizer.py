@@ -1,19 +1,109 @@
+import heapq
 import logging
+from collections import defaultdict
+from typing import Optional
 
-from fuzzywuzzy import fuzz
+from fuzzywuzzy import fuzz, process
 
 import config
+from commands.slots import SlotSchema
+from core.metrics import metrics
 
 logging.basicConfig(level=logging.INFO)
 
 
+class AliasIndex:
+    """
+    Trigram inverted index over the commands aliases.
+    It is built once when the commands are loaded and is used to shortlist the aliases
+    that share the most character trigrams with the user input, so only a handful of them
+    have to be scored by the fuzzy matcher
+    """
+
+    def __init__(self, aliases: tuple, shortlist_size: int = config.CMD_INDEX_SHORTLIST_SIZE):
+        self.aliases = aliases
+        self.shortlist_size = shortlist_size
+        self.postings: dict[str, tuple[int, ...]] = {}
+        self.trigrams_count: tuple[int, ...] = ()
+        self._build()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        Normalize the text before splitting it into trigrams
+        :param text: The text to normalize
+        :return: Lowercase text with collapsed whitespaces
+        """
+        return " ".join(text.lower().split())
+
+    @classmethod
+    def trigrams(cls, text: str) -> set:
+        """
+        Split the text into character trigrams. The text is padded with spaces,
+        so words shorter than three characters still produce trigrams
+        :param text: The text to split
+        :return: The set of trigrams
+        """
+        text = cls.normalize(text)
+        if not text:
+            return set()
+        padded = f" {text} "
+        return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+    def _build(self) -> None:
+        """
+        Build the inverted index: trigram -> positions of the aliases containing it.
+        The index is read-only after the build, so it is stored in tuples
+        :return:
+        """
+        postings = defaultdict(list)
+        trigrams_count = []
+        for position, (_, alias) in enumerate(self.aliases):
+            alias_trigrams = self.trigrams(alias)
+            trigrams_count.append(len(alias_trigrams))
+            for trigram in alias_trigrams:
+                postings[trigram].append(position)
+        self.postings = {trigram: tuple(positions) for trigram, positions in postings.items()}
+        self.trigrams_count = tuple(trigrams_count)
+        logging.info(
+            f"Alias index built: {len(self.aliases)} aliases, {len(self.postings)} trigrams"
+        )
+
+    def shortlist(self, text_input: str) -> list[int]:
+        """
+        Get the positions of the aliases that are most likely to match the user input.
+        The candidates are ranked by the share of their trigrams found in the input
+        :param text_input: The user input
+        :return: Positions of the candidate aliases in the original order
+        """
+        input_trigrams = self.trigrams(text_input)
+        shared = defaultdict(int)
+        for trigram in input_trigrams:
+            for position in self.postings.get(trigram, ()):
+                shared[position] += 1
+
+        def coverage(position: int) -> float:
+            return shared[position] / min(self.trigrams_count[position], len(input_trigrams))
+
+        ranked = heapq.nsmallest(
+            self.shortlist_size, shared, key=lambda position: (-coverage(position), position)
+        )
+        return sorted(ranked)
+
+
 class CommandRecognizer:
     """
     Class to recognize the command from the user input
     """
 
-    def __init__(self, aliases: dict):
+    def __init__(self, aliases: tuple, slots: Optional[dict[str, SlotSchema]] = None):
+        """
+        :param aliases: The (command name, alias) pairs
+        :param slots: The slot schemas of the commands by their names
+        """
         self.aliases = aliases
+        self.slots = slots or {}
+        self.index = AliasIndex(aliases)
 
     @staticmethod
     def format_aliases(aliases: dict) -> list:
@@ -39,24 +129,125 @@ class CommandRecognizer:
 
         return text_input
 
+    @staticmethod
+    def split_arguments(text_input: str, alias: str) -> list[str]:
+        """
+        Get the words of the user input around the alias.
+        The alias is matched fuzzily and may be not in the input as is, so the span of the words
+        most similar to it is taken as the alias. The spans of one word shorter and longer
+        than the alias are tried too, for the words merged or split by the speech recognizer.
+        An input too short for these spans, e.g. the beginning of a partial result,
+        keeps the words that are not in the alias
+        :param text_input: The user input
+        :param alias: The recognized alias
+        :return: The argument words
+        """
+        words = text_input.split()
+        alias_words = alias.split()
+        size = len(alias_words)
+        for start in range(len(words) - size + 1):
+            if words[start : start + size] == alias_words:
+                return words[:start] + words[start + size :]
+
+        best_score, best_start, best_end = -1, 0, 0
+        for span in range(max(size - 1, 1), min(size + 1, len(words)) + 1):
+            for start in range(len(words) - span + 1):
+                score = fuzz.ratio(" ".join(words[start : start + span]), alias)
+                if score > best_score:
+                    best_score, best_start, best_end = score, start, start + span
+        if best_score < 0:
+            return [word for word in words if word not in alias_words]
+        return words[:best_start] + words[best_end:]
+
+    @metrics.timed("cmd_detect")
     def detect_cmd(self, text_input: str) -> dict:
         """
-        Recognize the command from the user input
+        Recognize the command from the user input.
+        Only the aliases shortlisted by the index are scored
         :param text_input: The user input
-        :return: The closet command and the percentage of the match
+        :return: The closet command, its matched alias, the percentage of the match,
+            the argument words and the params filled by the slots of the command
         """
-        best_match = {"cmd_name": "", "score": 0, "arguments": []}
-        best_alias = ""
+        best_match = {"cmd_name": "", "alias": "", "score": 0, "arguments": [], "params": {}}
         logging.info(f"Text input: {text_input}")
-        for cmd_name, alias in self.aliases:
-            current_score = fuzz.partial_ratio(text_input, alias)
-            if current_score > best_match["score"]:
-                best_match["score"] = current_score
-                best_match["cmd_name"] = cmd_name
-                best_alias = alias
+        candidates = {
+            position: self.aliases[position][1] for position in self.index.shortlist(text_input)
+        }
+        # Scores are computed on the raw strings, so they are the same as with a full scan
+        match = process.extractOne(
+            text_input, candidates, processor=None, scorer=fuzz.partial_ratio, score_cutoff=1
+        )
+        if match is None:
+            return best_match
+
+        best_alias, best_match["score"], position = match
+        best_match["cmd_name"] = self.aliases[position][0]
+        best_match["alias"] = best_alias
 
         if best_match["score"] > config.CMD_RECOGNITION_TRESHHOLD:
             best_match["recognized"] = True
-            args_str = text_input.replace(best_alias, "", 1).strip()
-            best_match["arguments"] = args_str.split() if args_str else []
+            best_match["arguments"] = self.split_arguments(text_input, best_alias)
+            slots = self.slots.get(best_match["cmd_name"])
+            if slots is not None:
+                best_match["params"] = slots.fill(" ".join(best_match["arguments"]))
         return best_match
+
+
+class PartialMatcher:
+    """
+    Class to recognize the command from the partial results of the speech recognition.
+    A command is complete when its alias is found in the growing text without any other words
+    on several consecutive partial results. Only the commands without arguments are matched,
+    the others need the whole phrase
+    """
+
+    def __init__(
+        self,
+        recognizer: CommandRecognizer,
+        commands: set[str],
+        stable_count: int = config.CMD_PARTIAL_STABLE_COUNT,
+    ):
+        """
+        :param recognizer: The command recognizer
+        :param commands: Names of the commands that can be executed before the end of the phrase
+        :param stable_count: Consecutive partial results that should match the command
+        """
+        self.recognizer = recognizer
+        self.commands = commands
+        self.stable_count = stable_count
+        self.cmd_name = ""
+        self.matches = 0
+
+    def reset(self) -> None:
+        self.cmd_name = ""
+        self.matches = 0
+
+    def update(self, partial: str) -> bool:
+        """
+        Match the next partial result
+        :param partial: The partial text. An empty text starts a new phrase
+        :return: True if the command is complete and can be executed
+        """
+        if not partial:
+            self.reset()
+            return False
+
+        match = self.recognizer.detect_cmd(partial)
+        if (
+            not match.get("recognized")
+            or match["arguments"]
+            or match["cmd_name"] not in self.commands
+            # The beginning of a longer phrase can be close to the alias, e.g. "what"
+            or not set(match["alias"].split()) <= set(partial.split())
+        ):
+            self.reset()
+            return False
+
+        if match["cmd_name"] != self.cmd_name:
+            self.cmd_name, self.matches = match["cmd_name"], 0
+        self.matches += 1
+        if self.matches < self.stable_count:
+            return False
+        logging.info(f"Command {self.cmd_name} is complete in the partial result: {partial}")
+        self.reset()
+        return True
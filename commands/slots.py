@@ -0,0 +1,155 @@
+"""Slots of the commands: typed arguments filled from the user input"""
+
+import functools
+import re
+from typing import Any, Callable
+
+SLOT_TYPES = ("number", "url", "text")
+
+UNITS = {
+    word: value
+    for value, word in enumerate(
+        "zero one two three four five six seven eight nine ten eleven twelve thirteen fourteen "
+        "fifteen sixteen seventeen eighteen nineteen".split()
+    )
+}
+TENS = {
+    word: value * 10
+    for value, word in enumerate(
+        "twenty thirty forty fifty sixty seventy eighty ninety".split(), start=2
+    )
+}
+SCALES = {"hundred": 100, "thousand": 1000, "million": 1000000}
+
+
+def _words(words) -> str:
+    # Longer words first, so "seventeen" is not matched as "seven"
+    return "|".join(sorted(words, key=len, reverse=True))
+
+
+# The number words are joined only by a tens or a scale word, so "one two three" is three numbers
+_BELOW_100 = rf"(?:(?:{_words(TENS)})(?:\s+(?:{_words(list(UNITS)[1:10])}))?|{_words(UNITS)})"
+# "and" is taken only after a scale, as in "one hundred and five"
+_BELOW_1000 = rf"(?:(?:{_BELOW_100}\s+)?hundred(?:\s+(?:and\s+)?{_BELOW_100})?|{_BELOW_100})"
+# A comma followed by three digits separates the thousands, otherwise it is the decimal point
+NUMBER_PATTERN = (
+    r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:[.,]\d+)?"
+    rf"|(?:{_BELOW_1000}|thousand|million)"
+    rf"(?:\s+(?:thousand|million)(?:\s+(?:and\s+)?{_BELOW_1000})?)*"
+)
+THOUSANDS = re.compile(r"\d{1,3}(?:,\d{3})+(?:\.\d+)?")
+# The speech recognizer spells the dots of the domains as words. A spoken dot should be followed
+# by a known top-level domain, so the phrases like "the dot product" are not taken as URLs
+SPOKEN_DOMAINS = "com|org|net|io|dev|app|info|edu|gov|me|tv|ru|uk|de"
+URL_PATTERN = (
+    r"(?:https?://)?[a-z0-9][a-z0-9-]*(?:(?:\.|\s+dot\s+)[a-z0-9][a-z0-9-]*)*"
+    rf"(?:\.[a-z]{{2,}}|\s+dot\s+(?:{SPOKEN_DOMAINS}))(?:/\S*)?"
+)
+# Typed slots in the order they are tried at every position: a URL can contain a number
+PATTERNS = {"url": URL_PATTERN, "number": NUMBER_PATTERN}
+SPOKEN_DOT = re.compile(r"\s+dot\s+")
+
+
+def parse_number(text: str) -> int | float:
+    """
+    Convert the number matched by NUMBER_PATTERN
+    :param text: The digits or the English number words
+    :return: The number
+    """
+    if text[0].isdigit():
+        text = text.replace(",", "") if THOUSANDS.fullmatch(text) else text.replace(",", ".")
+        return float(text) if "." in text else int(text)
+    total = current = 0
+    for word in text.lower().split():
+        if word in SCALES:
+            if SCALES[word] == 100:
+                current = max(current, 1) * 100
+            else:
+                total += max(current, 1) * SCALES[word]
+                current = 0
+        elif word != "and":
+            current += UNITS.get(word) or TENS.get(word, 0)
+    return total + current
+
+
+def parse_url(text: str) -> str:
+    """
+    Convert the URL matched by URL_PATTERN
+    :param text: The URL, possibly with the spoken dots
+    :return: The URL with the scheme
+    """
+    url = SPOKEN_DOT.sub(".", text)
+    return url if re.match(r"https?://", url) else f"https://{url}"
+
+
+CONVERTERS: dict[str, Callable[[str], Any]] = {"number": parse_number, "url": parse_url}
+
+
+@functools.lru_cache(maxsize=None)
+def compile_pattern(types: tuple[str, ...]) -> re.Pattern:
+    """
+    Compile the pattern finding the values of the slot types.
+    The commands with the same slot types share the pattern
+    :param types: The typed slot types
+    :return: The pattern with a named group of every type
+    """
+    alternatives = "|".join(f"(?P<{slot_type}>{PATTERNS[slot_type]})" for slot_type in types)
+    return re.compile(rf"\b(?:{alternatives})\b", re.IGNORECASE)
+
+
+class SlotSchema:
+    """
+    Slots of a command declared in its config, e.g.
+    {"minutes": {"type": "number"}, "label": {"type": "text", "default": "timer"}}.
+    The typed slots are found by a single precompiled pattern in one pass over the arguments.
+    The values of the same type fill the slots in the declaration order, and the words
+    that are not taken by them fill the text slot
+    """
+
+    def __init__(self, slots: dict[str, dict]):
+        """
+        :param slots: The specs of the slots by their names
+        :raises ValueError: If a slot type is unknown or there are several text slots
+        """
+        self.slots = slots
+        self.defaults = {name: spec["default"] for name, spec in slots.items() if "default" in spec}
+        # Names of the slots of every type in the declaration order
+        self.names: dict[str, list[str]] = {}
+        for name, spec in slots.items():
+            slot_type = spec.get("type", "text")
+            if slot_type not in SLOT_TYPES:
+                raise ValueError(f"Unknown type {slot_type} of the slot {name}")
+            self.names.setdefault(slot_type, []).append(name)
+        text_slots = self.names.pop("text", [])
+        if len(text_slots) > 1:
+            raise ValueError(f"Only one text slot is allowed, got {text_slots}")
+        self.text_slot = text_slots[0] if text_slots else None
+        types = tuple(slot_type for slot_type in PATTERNS if slot_type in self.names)
+        self.pattern = compile_pattern(types) if types else None
+
+    def fill(self, text: str) -> dict[str, Any]:
+        """
+        Fill the slots from the arguments of the command
+        :param text: The arguments
+        :return: The values of the filled slots and the defaults of the others
+        """
+        values = dict(self.defaults)
+        rest = []
+        position = 0
+        if self.pattern is not None:
+            filled = {slot_type: 0 for slot_type in self.names}
+            for match in self.pattern.finditer(text):
+                slot_type = match.lastgroup
+                names = self.names[slot_type]
+                if filled[slot_type] == len(names):
+                    continue
+                values[names[filled[slot_type]]] = CONVERTERS[slot_type](match.group())
+                filled[slot_type] += 1
+                rest.append(text[position : match.start()])
+                position = match.end()
+        if self.text_slot is not None:
+            rest.append(text[position:])
+            words = " ".join(rest).split()
+            if words:
+                values[self.text_slot] = " ".join(words)
+        return values
@@ -0,0 +1,189 @@
+"""
+Compiled snapshot of the command catalog for a fast start.
+
+The snapshot keeps the commands, the aliases and the recognizer index built from
+the commands configs, and is loaded with a single read instead of parsing the configs.
+The configs stay the source of truth: the snapshot is rebuilt when their content changes,
+or when the settings stored in the recognizer index and the partial matcher change.
+The configs are checked by their modification times and sizes, and their content is hashed
+only when those differ, so an up to date snapshot is loaded without reading the configs.
+
+Usage: python -m commands.snapshot --commands-dir commands
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+import config
+
+# Snapshots of other formats are ignored
+SNAPSHOT_FORMAT = 4
+# Settings stored in the snapshot objects, which are hashed with the configs
+SETTINGS = ("CMD_INDEX_SHORTLIST_SIZE", "CMD_PARTIAL_STABLE_COUNT")
+
+
+def read_settings() -> dict[str, Any]:
+    return {name: getattr(config, name) for name in SETTINGS}
+
+
+def scan_configs(commands_dir: str) -> dict[str, tuple[int, int]]:
+    """
+    Get the manifest of the commands configs without reading them
+    :param commands_dir: Directory with the commands configs
+    :return: The modification time and size of every config by its path in the directory
+    """
+    # os.walk is several times faster than Path.rglob on large trees
+    root = os.path.join(commands_dir, "")
+    manifest = {}
+    for directory, _, files in os.walk(root):
+        if "config.json" not in files:
+            continue
+        config_file = os.path.join(directory, "config.json")
+        try:
+            stat = os.stat(config_file)
+        except OSError:
+            continue
+        manifest[config_file[len(root) :]] = (stat.st_mtime_ns, stat.st_size)
+    return manifest
+
+
+def fingerprint_configs(
+    commands_dir: str, manifest: Optional[dict[str, tuple[int, int]]] = None
+) -> dict[str, Any]:
+    """
+    Get the settings, the manifest and the hash of the commands configs.
+    If a config is changed after the manifest is taken, the hash is left out,
+    so the snapshot doesn't match the configs and is rebuilt on the next start
+    :param commands_dir: Directory with the commands configs
+    :param manifest: The manifest taken before the configs were read. Taken now if None
+    :return: The fingerprint stored in the snapshot
+    """
+    if manifest is None:
+        manifest = scan_configs(commands_dir)
+    configs_hash = hash_configs(commands_dir)
+    if scan_configs(commands_dir) != manifest:
+        configs_hash = None
+    return {"settings": read_settings(), "manifest": manifest, "hash": configs_hash}
+
+
+def hash_configs(commands_dir: str) -> str:
+    """
+    Hash the content of the commands configs and the settings of the catalog
+    :param commands_dir: Directory with the commands configs
+    :return: The hex digest
+    """
+    digest = hashlib.sha256()
+    for name, value in read_settings().items():
+        digest.update(f"{name}={value}\0".encode())
+    root = Path(commands_dir)
+    for config_file in sorted(root.rglob("config.json")):
+        digest.update(str(config_file.relative_to(root)).encode())
+        digest.update(b"\0")
+        digest.update(config_file.read_bytes())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class CatalogSnapshot:
+    """
+    Snapshot file of the command catalog. It is a local cache written by the assistant itself,
+    so it is stored with pickle
+    """
+
+    def __init__(self, path: str, commands_dir: str):
+        """
+        :param path: Path to the snapshot file
+        :param commands_dir: Directory with the commands configs
+        """
+        self.path = path
+        self.commands_dir = os.path.abspath(commands_dir)
+
+    def load(self) -> Optional[dict[str, Any]]:
+        """
+        Load the snapshot if it is built from the current configs
+        :return: The snapshot content or None if it is missing or outdated
+        """
+        started = time.perf_counter()
+        try:
+            with open(self.path, "rb") as f:
+                snapshot = pickle.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Error loading the commands snapshot {self.path}: {e}")
+            return None
+
+        if (
+            not isinstance(snapshot, dict)
+            or snapshot.get("format") != SNAPSHOT_FORMAT
+            or snapshot.get("commands_dir") != self.commands_dir
+            or snapshot["fingerprint"]["settings"] != read_settings()
+        ):
+            logging.info("The commands snapshot is outdated")
+            return None
+        # The configs are hashed only if their manifest differs, e.g. they were touched
+        fingerprint = snapshot.pop("fingerprint")
+        manifest = scan_configs(self.commands_dir)
+        if manifest != fingerprint["manifest"]:
+            if fingerprint["hash"] != hash_configs(self.commands_dir):
+                logging.info("The commands snapshot is outdated")
+                return None
+            # The manifest was taken before the hash, so a config changed meanwhile doesn't match
+            content = {k: v for k, v in snapshot.items() if k not in ("format", "commands_dir")}
+            self.save({**fingerprint, "manifest": manifest}, **content)
+        logging.info(f"Commands snapshot loaded in {time.perf_counter() - started:.3f} s")
+        return snapshot
+
+    def save(self, fingerprint: dict[str, Any], **content) -> None:
+        """
+        Save the snapshot
+        :param fingerprint: The fingerprint of the configs the content is built from
+        :param content: The objects to save
+        :return:
+        """
+        snapshot = {
+            "format": SNAPSHOT_FORMAT,
+            "commands_dir": self.commands_dir,
+            "fingerprint": fingerprint,
+            **content,
+        }
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logging.error(f"Error saving the commands snapshot {self.path}: {e}")
+            return
+        logging.info(f"Commands snapshot saved to {self.path}")
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Rebuild the command catalog snapshot.")
+    parser.add_argument("--commands-dir", help="Commands directory. The project one by default")
+    parser.add_argument("--output", default=config.CMD_SNAPSHOT_PATH, help="Snapshot path")
+    args = parser.parse_args(argv)
+    if not args.output:
+        parser.error("the snapshot path is not set, pass --output or set CMD_SNAPSHOT_PATH")
+
+    from commands.processor import CommandProcessor
+
+    started = time.perf_counter()
+    processor = CommandProcessor(args.commands_dir, snapshot_path=None)
+    processor.save_snapshot(args.output)
+    print(
+        f"Snapshot of {len(processor.commands)} commands saved to {args.output} "
+        f"in {time.perf_counter() - started:.3f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
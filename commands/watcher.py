@@ -0,0 +1,42 @@
+import logging
+import threading
+from typing import Callable, Optional
+
+import config
+
+
+class CatalogWatcher(threading.Thread):
+    """
+    Watches the commands configs and reloads the changed ones in the background.
+    The configs are polled by their modification time, which needs no platform-specific APIs
+    """
+
+    def __init__(
+        self,
+        processor,
+        interval: float = config.CMD_RELOAD_INTERVAL,
+        on_reload: Optional[Callable[[], None]] = None,
+    ):
+        """
+        :param processor: The command processor to reload
+        :param interval: Seconds between the checks
+        :param on_reload: The function called when the commands are changed,
+            e.g. to rebuild the speech recognizer grammar
+        """
+        super().__init__(name="catalog_watcher", daemon=True)
+        self.processor = processor
+        self.interval = interval
+        self.on_reload = on_reload
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        logging.info(f"Watching the commands configs every {self.interval} s")
+        while not self.stopped.wait(self.interval):
+            try:
+                if self.processor.reload() and self.on_reload is not None:
+                    self.on_reload()
+            except Exception as e:
+                logging.error(f"An error occurred while reloading the commands: {e}", exc_info=True)
+
+    def stop(self) -> None:
+        self.stopped.set()
@@ -0,0 +1,127 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+import config
+from commands.command_types import CommandScript
+
+
+class ScriptWorkerPool:
+    """
+    Persistent pool of worker threads to run the script commands outside of the listening loop.
+    Scripts mostly wait for subprocesses or the network, so threads are enough and the cached
+    script modules are shared with the workers.
+    A thread can't be killed, so a timed out script keeps running in its thread. Its slot is
+    released at the timeout and the script is kept as abandoned until it returns, on one of
+    the spare threads, so the hung scripts don't block the next commands
+    """
+
+    def __init__(self, max_workers: int = config.SCRIPT_WORKERS):
+        self.max_workers = max_workers
+        # A spare thread for every slot released by an abandoned script
+        self.executor = ThreadPoolExecutor(max_workers=2 * max_workers, thread_name_prefix="script")
+        # Limits the number of running and queued scripts
+        self.slots = threading.BoundedSemaphore(max_workers)
+        # Futures of the timed out scripts still running, their slots are already released
+        self.abandoned: set[Future] = set()
+        self.lock = threading.Lock()
+
+    def submit(
+        self,
+        command: CommandScript,
+        arguments: list,
+        on_result: Callable[[CommandScript, Optional[str]], bool],
+        params: Optional[dict] = None,
+    ) -> bool:
+        """
+        Run the script command in the pool without waiting for the result.
+        The result is passed to the callback when the script is finished. If the script
+        does not finish in time, the timeout is logged and its late result is dropped.
+        Background scripts have no timeout
+        :param command: The script command to run
+        :param arguments: The arguments for the command
+        :param on_result: The function to call with the command and its result
+        :param params: The typed values of the command slots
+        :return: True if the command was accepted, False if all the workers are busy
+        """
+        if not self.slots.acquire(blocking=False):
+            logging.warning(
+                f"All {self.max_workers} script workers are busy, {command.name} skipped"
+            )
+            return False
+
+        expired = threading.Event()
+        try:
+            future = self.executor.submit(command.execute, arguments, params)
+        except RuntimeError as e:
+            self.slots.release()
+            logging.error(f"Command {command.name} is not submitted: {e}")
+            return False
+        timer = None
+        if not command.background:
+            timer = threading.Timer(command.timeout, self._expire, args=(command, future, expired))
+            timer.daemon = True
+            timer.start()
+
+        def done(finished: Future) -> None:
+            self._release(finished)
+            if timer:
+                timer.cancel()
+            if expired.is_set():
+                return
+            try:
+                result = finished.result()
+            except Exception as e:
+                logging.error(f"Error executing the command {command.name}: {e}", exc_info=True)
+                result = None
+            on_result(command, result)
+
+        future.add_done_callback(done)
+        return True
+
+    def _expire(self, command: CommandScript, future: Future, expired: threading.Event) -> None:
+        """
+        Mark the command as timed out if it is still running and release its slot
+        while there is a spare thread for it
+        :param command: The script command
+        :param future: The future of the running script
+        :param expired: The flag to drop the late result
+        :return:
+        """
+        with self.lock:
+            if future.done():
+                return
+            expired.set()
+            logging.warning(f"Command {command.name} timed out after {command.timeout} seconds")
+            if len(self.abandoned) >= self.max_workers:
+                logging.error(
+                    f"{len(self.abandoned)} timed out scripts are still running, "
+                    f"the slot of {command.name} is held until it returns"
+                )
+                return
+            self.abandoned.add(future)
+            self.slots.release()
+
+    def _release(self, future: Future) -> None:
+        """
+        Release the slot of the finished script unless it was released at the timeout
+        :param future: The future of the finished script
+        :return:
+        """
+        with self.lock:
+            if future in self.abandoned:
+                self.abandoned.discard(future)
+            else:
+                self.slots.release()
+
+    def shutdown(self, wait: bool = False) -> None:
+        """
+        Stop the workers
+        :param wait: Wait for the running scripts to finish
+        :return:
+        """
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+
+script_pool = ScriptWorkerPool()
@@ -3,7 +3,6 @@
 import os
 
 import dotenv
-import torch
 
 dotenv.load_dotenv()
 
@@ -15,7 +14,23 @@ LANGUAGE: str = os.getenv("LANGUAGE")
 MODEL_ID: str = os.getenv("MODEL_ID")
 SPEAKER: str = os.getenv("SPEAKER")
 TTS_SAMPLE_RATE = int(os.getenv("TTS_SAMPLE_RATE"))
-TTS_DEVICE = torch.device("cpu")
+TTS_DEVICE: str = os.getenv("TTS_DEVICE", "cpu")
+# Directory of the optimized model exported by core.tts_model, the stock one from torch.hub if empty
+TTS_MODEL_PATH: str = os.getenv("TTS_MODEL_PATH", "") and os.path.join(
+    os.path.dirname(__file__), os.getenv("TTS_MODEL_PATH")
+)
+# Speak long phrases chunk by chunk, synthesizing the next chunk while the current one is playing
+TTS_STREAMING: bool = os.getenv("TTS_STREAMING", "true").lower() == "true"
+TTS_CHUNK_CHARS: int = int(os.getenv("TTS_CHUNK_CHARS", "150"))
+# Threads of the torch operations, 0 keeps the torch default
+TTS_THREADS: int = int(os.getenv("TTS_THREADS", "0"))
+# Synthesized audio cache: number of phrases in memory and optional directory for the disk store
+TTS_CACHE_SIZE: int = int(os.getenv("TTS_CACHE_SIZE", "256"))
+TTS_CACHE_DIR: str = os.getenv("TTS_CACHE_DIR", "") and os.path.join(
+    os.path.dirname(__file__), os.getenv("TTS_CACHE_DIR")
+)
+TTS_CACHE_DTYPE: str = os.getenv("TTS_CACHE_DTYPE", "float32")
+TTS_CACHE_DISK_MB: float = float(os.getenv("TTS_CACHE_DISK_MB", "512"))
 
 # STT parameters
 PICOVOICE_API_KEY: str = os.getenv("PICOVOICE_API_KEY")
@@ -25,14 +40,93 @@ PICOVOICE_KEYWORD_PATH: str = os.path.join(
 STT_SAMPLE_RATE: int = int(os.getenv("STT_SAMPLE_RATE"))
 STT_DEVICE: int = int(os.getenv("STT_DEVICE"))
 MODEL_PATH: str = os.path.join(os.path.dirname(__file__), os.getenv("MODEL_PATH"))
+# Captured frames kept while the pipeline is busy (~32 ms each) and size of the stage queues
+STT_BUFFER_FRAMES: int = int(os.getenv("STT_BUFFER_FRAMES", "256"))
+STT_QUEUE_SIZE: int = int(os.getenv("STT_QUEUE_SIZE", "64"))
+# Frames passed to the speech recognizer at once
+STT_CHUNK_FRAMES: int = int(os.getenv("STT_CHUNK_FRAMES", "4"))
+# Decode the commands against the grammar of their aliases instead of the full language model.
+# Phrases with other words are decoded again without the grammar. Needs a small Vosk model.
+# The grammar is rebuilt when the commands are reloaded
+STT_GRAMMAR: bool = os.getenv("STT_GRAMMAR", "false").lower() == "true"
+# Voice activity detection: silent chunks are not passed to the speech recognizer,
+# and the phrase is finished after the hangover of silence
+VAD_ENABLED: bool = os.getenv("VAD_ENABLED", "true").lower() == "true"
+VAD_MARGIN_DB: float = float(os.getenv("VAD_MARGIN_DB", "10"))
+VAD_MIN_LEVEL_DB: float = float(os.getenv("VAD_MIN_LEVEL_DB", "-50"))
+VAD_MIN_SPEECH_MS: int = int(os.getenv("VAD_MIN_SPEECH_MS", "30"))
+VAD_HANGOVER_MS: int = int(os.getenv("VAD_HANGOVER_MS", "500"))
+# Wake word engine: porcupine or vosk, the offline keyword spotter of WAKE_WORD_PHRASE
+# with the Vosk model from WAKE_WORD_MODEL_PATH, or the speech recognition model if empty
+WAKE_WORD_ENGINE: str = os.getenv("WAKE_WORD_ENGINE", "porcupine")
+WAKE_WORD_SENSITIVITY: float = float(os.getenv("WAKE_WORD_SENSITIVITY", "1"))
+WAKE_WORD_PHRASE: str = os.getenv("WAKE_WORD_PHRASE", "")
+WAKE_WORD_MODEL_PATH: str = os.getenv("WAKE_WORD_MODEL_PATH", "") and os.path.join(
+    os.path.dirname(__file__), os.getenv("WAKE_WORD_MODEL_PATH")
+)
+# Run the wake word engine on the speech only, with the frames before the speech onset
+WAKE_WORD_GATE: bool = os.getenv("WAKE_WORD_GATE", "false").lower() == "true"
+WAKE_WORD_PRE_ROLL_FRAMES: int = int(os.getenv("WAKE_WORD_PRE_ROLL_FRAMES", "10"))
 
 # Other parameters
 KEYWORD_DETECTION_TIMEOUT: int = int(os.getenv("KEYWORD_DETECTION_TIMEOUT"))
 INITIAL_DETECTION_DELAY: int = int(os.getenv("INITIAL_DETECTION_DELAY"))
 CMD_RECOGNITION_TRESHHOLD: int = int(os.getenv("CMD_RECOGNITION_TRESHHOLD"))
+CMD_INDEX_SHORTLIST_SIZE: int = int(os.getenv("CMD_INDEX_SHORTLIST_SIZE", "25"))
+# Compiled snapshot of the commands to load them at once instead of parsing the configs
+CMD_SNAPSHOT_PATH: str = os.getenv("CMD_SNAPSHOT_PATH", "") and os.path.join(
+    os.path.dirname(__file__), os.getenv("CMD_SNAPSHOT_PATH")
+)
+# Seconds between the checks of the commands configs for changes. 0 disables the reloading
+CMD_RELOAD_INTERVAL: float = float(os.getenv("CMD_RELOAD_INTERVAL", "2"))
+# Commands without arguments are executed when the partial result matches them on
+# several consecutive chunks, without waiting for the end of the phrase
+CMD_EARLY_DISPATCH: bool = os.getenv("CMD_EARLY_DISPATCH", "true").lower() == "true"
+CMD_PARTIAL_STABLE_COUNT: int = int(os.getenv("CMD_PARTIAL_STABLE_COUNT", "2"))
 BROWSER_PATH: str = os.getenv("BROWSER_PATH")
 
+# Script commands execution
+SCRIPT_WORKERS: int = int(os.getenv("SCRIPT_WORKERS", "4"))
+SCRIPT_TIMEOUT: float = float(os.getenv("SCRIPT_TIMEOUT", "30"))
+
 OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY")
+# OpenAI-compatible API to use instead of the OpenAI one
+OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL") or None
+# Speak the ChatGPT response sentence by sentence while it is generated
+CHATGPT_STREAMING: bool = os.getenv("CHATGPT_STREAMING", "true").lower() == "true"
+# ChatGPT conversation history: tokens and turns kept, seconds of silence to start over,
+# and number of the conversations of different sessions
+CHATGPT_HISTORY_TOKENS: int = int(os.getenv("CHATGPT_HISTORY_TOKENS", "1000"))
+CHATGPT_HISTORY_TURNS: int = int(os.getenv("CHATGPT_HISTORY_TURNS", "10"))
+CHATGPT_HISTORY_TIMEOUT: float = float(os.getenv("CHATGPT_HISTORY_TIMEOUT", "120"))
+CHATGPT_MAX_SESSIONS: int = int(os.getenv("CHATGPT_MAX_SESSIONS", "16"))
+# ChatGPT responses cache: number of responses in memory, seconds to keep them
+# and optional SQLite database to keep them across restarts
+CHATGPT_CACHE_SIZE: int = int(os.getenv("CHATGPT_CACHE_SIZE", "128"))
+CHATGPT_CACHE_TTL: float = float(os.getenv("CHATGPT_CACHE_TTL", "86400"))
+CHATGPT_CACHE_DB: str = os.getenv("CHATGPT_CACHE_DB", "") and os.path.join(
+    os.path.dirname(__file__), os.getenv("CHATGPT_CACHE_DB")
+)
+
+# Server mode: the address to serve the audio streams on, the worker threads handling
+# the frames of the sessions, the concurrent sessions and the frames handled by a worker
+# before switching to another session
+SERVER_HOST: str = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT: int = int(os.getenv("SERVER_PORT", "8765"))
+SERVER_WORKERS: int = int(os.getenv("SERVER_WORKERS", "4"))
+SERVER_COMMAND_WORKERS: int = int(os.getenv("SERVER_COMMAND_WORKERS", "4"))
+SERVER_MAX_SESSIONS: int = int(os.getenv("SERVER_MAX_SESSIONS", "32"))
+SERVER_BATCH_FRAMES: int = int(os.getenv("SERVER_BATCH_FRAMES", "16"))
+
+# Timing of the pipeline stages: the histograms, the local endpoint in the Prometheus format
+# (0 disables it), seconds between the summaries in the log (0 disables them)
+# and the opt-in sampling profiler with seconds between the samples
+METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT: int = int(os.getenv("METRICS_PORT", "0"))
+METRICS_LOG_INTERVAL: float = float(os.getenv("METRICS_LOG_INTERVAL", "300"))
+PROFILER_ENABLED: bool = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+PROFILER_INTERVAL: float = float(os.getenv("PROFILER_INTERVAL", "0.01"))
 
 # TODO: Currently not used
 NAME_ALIAS = []
@@ -0,0 +1,211 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+import config
+
+DISK_DTYPES = {"float32": np.float32, "int16": np.int16}
+INT16_SCALE = 32767
+
+
+class AudioCache:
+    """
+    Cache of the synthesized audio keyed by (text, speaker, sample_rate, model_id, variant).
+    The recently used audio is kept in memory, and the optional disk store keeps raw PCM files
+    that are memory-mapped on load, so the cache survives restarts. The disk store is bounded
+    by size: the files are ordered by their mtime, which is updated on every read,
+    and the least recently used ones are removed first
+    """
+
+    def __init__(
+        self,
+        max_items: int = config.TTS_CACHE_SIZE,
+        cache_dir: Optional[str] = config.TTS_CACHE_DIR,
+        disk_dtype: str = config.TTS_CACHE_DTYPE,
+        max_disk_mb: float = config.TTS_CACHE_DISK_MB,
+    ):
+        self.max_items = max_items
+        self.cache_dir = cache_dir
+        self.disk_dtype = DISK_DTYPES[disk_dtype]
+        self.max_disk_bytes = int(max_disk_mb * 1024 * 1024)
+        self.items: OrderedDict[tuple, np.ndarray] = OrderedDict()
+        # Sizes of the PCM files from the least to the most recently used
+        self.files: OrderedDict[str, int] = OrderedDict()
+        self.disk_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._scan()
+
+    @staticmethod
+    def make_key(
+        text: str, speaker: str, sample_rate: int, model_id: str, variant: str = "float32"
+    ) -> tuple:
+        """
+        Make the cache key of the audio
+        :param variant: The precision of the model variant, see core.tts_model
+        :return: The key tuple
+        """
+        return text, speaker, sample_rate, model_id, variant
+
+    def _path(self, key: tuple) -> str:
+        """
+        Get the path of the PCM file for the key
+        :param key: The cache key
+        :return: The path inside the cache directory
+        """
+        digest = hashlib.sha256("\0".join(map(str, key)).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.{np.dtype(self.disk_dtype).name}.pcm")
+
+    def _scan(self) -> None:
+        """
+        Index the PCM files left by the previous runs and trim the store to its limit
+        :return:
+        """
+        files = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".pcm") and entry.is_file():
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.path, stat.st_size))
+        for _, path, size in sorted(files):
+            self.files[path] = size
+            self.disk_bytes += size
+        self._evict()
+
+    def get(self, key: tuple) -> Optional[np.ndarray]:
+        """
+        Get the audio from the memory or from the disk
+        :param key: The cache key
+        :return: The float32 audio samples or None if the audio is not cached
+        """
+        with self.lock:
+            audio = self.items.get(key)
+            if audio is not None:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return audio
+
+        audio = self._read(key)
+        with self.lock:
+            if audio is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, audio)
+        return audio
+
+    def put(self, key: tuple, audio: np.ndarray) -> None:
+        """
+        Put the audio to the cache and to the disk store
+        :param key: The cache key
+        :param audio: The float32 audio samples
+        :return:
+        """
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+        with self.lock:
+            self._remember(key, audio)
+        self._write(key, audio)
+
+    def _remember(self, key: tuple, audio: np.ndarray) -> None:
+        """
+        Put the audio to the memory and evict the least recently used one
+        :param key: The cache key
+        :param audio: The audio samples
+        :return:
+        """
+        self.items[key] = audio
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+
+    def _read(self, key: tuple) -> Optional[np.ndarray]:
+        """
+        Read the audio from the disk store
+        :param key: The cache key
+        :return: The float32 audio samples or None if the file does not exist
+        """
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return None
+        try:
+            audio = np.memmap(path, dtype=self.disk_dtype, mode="r")
+        except (OSError, ValueError) as e:
+            logging.error(f"Error reading the cached audio {path}: {e}")
+            return None
+        with self.lock:
+            if path in self.files:
+                self.files.move_to_end(path)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        if self.disk_dtype == np.int16:
+            return audio.astype(np.float32) / INT16_SCALE
+        return audio
+
+    def _write(self, key: tuple, audio: np.ndarray) -> None:
+        """
+        Write the audio to the disk store
+        :param key: The cache key
+        :param audio: The float32 audio samples
+        :return:
+        """
+        if not self.cache_dir:
+            return
+        if self.disk_dtype == np.int16:
+            audio = (np.clip(audio, -1, 1) * INT16_SCALE).astype(np.int16)
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            audio.tofile(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.error(f"Error writing the cached audio {path}: {e}")
+            return
+        with self.lock:
+            self.disk_bytes += audio.nbytes - self.files.pop(path, 0)
+            self.files[path] = audio.nbytes
+            self._evict()
+
+    def _evict(self) -> None:
+        """
+        Remove the least recently used files until the disk store fits its limit.
+        The most recent file is kept even if it is larger than the limit
+        :return:
+        """
+        while self.disk_bytes > self.max_disk_bytes and len(self.files) > 1:
+            path, size = self.files.popitem(last=False)
+            self.disk_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.error(f"Error removing the cached audio {path}: {e}")
+
+    @property
+    def stats(self) -> dict:
+        """
+        Get the cache counters
+        :return: Number of the cache hits, misses, the audio kept in memory and on the disk
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "cached": len(self.items),
+            "disk_files": len(self.files),
+            "disk_mb": self.disk_bytes / 1024 / 1024,
+            "disk_evictions": self.evictions,
+        }
@@ -0,0 +1,252 @@
+"""Sources of the audio frames for the speech to text"""
+
+import sys
+import threading
+import time
+import wave
+from array import array
+from collections import deque
+from typing import Iterable, Iterator, Optional
+
+from pvrecorder import PvRecorder
+
+import config
+
+
+class EndOfStream(EOFError):
+    """
+    Raised by the audio source when there are no more frames
+    """
+
+
+class AudioSource:
+    """
+    Base class of the audio sources. A source returns frames of int16 samples
+    of the fixed length, the same way as PvRecorder does
+    """
+
+    # Live sources can't wait for the pipeline, so their frames are dropped when it is busy
+    live = False
+    selected_device = None
+
+    def __init__(self, frame_length: int, sample_rate: int = config.STT_SAMPLE_RATE):
+        self.frame_length = frame_length
+        self.sample_rate = sample_rate
+        self.frames_read = 0
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def read(self) -> list[int]:
+        """
+        Read the next frame
+        :return: The audio samples
+        :raises EndOfStream: If the source has no more frames
+        """
+        raise NotImplementedError
+
+    @property
+    def position(self) -> float:
+        """
+        Seconds of audio read from the source
+        :return: The audio position
+        """
+        return self.frames_read * self.frame_length / self.sample_rate
+
+
+class RecorderSource(AudioSource):
+    """
+    Live microphone input
+    """
+
+    live = True
+
+    def __init__(self, frame_length: int, device_index: int = config.STT_DEVICE):
+        super().__init__(frame_length)
+        self.recorder = PvRecorder(device_index=device_index, frame_length=frame_length)
+
+    @property
+    def selected_device(self) -> str:
+        return self.recorder.selected_device
+
+    def start(self) -> None:
+        self.recorder.start()
+
+    def stop(self) -> None:
+        self.recorder.stop()
+
+    def read(self) -> list[int]:
+        self.frames_read += 1
+        return self.recorder.read()
+
+
+class GeneratorSource(AudioSource):
+    """
+    Audio from an iterable of int16 sample blocks of any length, e.g. generated in memory.
+    The blocks are split to the frames, the last frame is padded with silence.
+    With realtime=True the frames are returned at the pace of the live microphone,
+    otherwise as fast as they are read
+    """
+
+    def __init__(
+        self,
+        blocks: Iterable[Iterable[int]],
+        frame_length: int,
+        realtime: bool = False,
+        sample_rate: int = config.STT_SAMPLE_RATE,
+    ):
+        super().__init__(frame_length, sample_rate)
+        self.blocks = iter(blocks)
+        self.realtime = realtime
+        self.live = realtime
+        self.samples = array("h")
+        self.started_at: Optional[float] = None
+
+    def start(self) -> None:
+        self.started_at = time.perf_counter()
+        self.frames_read = 0
+
+    def _fill(self) -> bool:
+        """
+        Read the blocks until there are enough samples for a frame
+        :return: False if the blocks are exhausted
+        """
+        while len(self.samples) < self.frame_length:
+            block = next(self.blocks, None)
+            if block is None:
+                return False
+            self.samples.extend(block)
+        return True
+
+    def read(self) -> list[int]:
+        if not self._fill():
+            if not self.samples:
+                raise EndOfStream
+            self.samples.extend([0] * (self.frame_length - len(self.samples)))
+
+        frame = self.samples[: self.frame_length].tolist()
+        del self.samples[: self.frame_length]
+        self.frames_read += 1
+        if self.realtime:
+            delay = self.started_at + self.position - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        return frame
+
+
+class FileSource(GeneratorSource):
+    """
+    Audio from a WAV file or a file with raw int16 PCM in the native byte order.
+    The audio should be mono with the sample rate of the speech recognizer
+    """
+
+    BLOCK_FRAMES = 4096
+
+    def __init__(
+        self,
+        path: str,
+        frame_length: int,
+        realtime: bool = False,
+        sample_rate: int = config.STT_SAMPLE_RATE,
+    ):
+        self.path = path
+        super().__init__(self._read_blocks(sample_rate), frame_length, realtime, sample_rate)
+
+    def _read_blocks(self, sample_rate: int) -> Iterator[array]:
+        """
+        Read the file by blocks
+        :param sample_rate: The expected sample rate
+        :return: The blocks of samples
+        """
+        if not self.path.lower().endswith(".wav"):
+            with open(self.path, "rb") as f:
+                while data := f.read(self.BLOCK_FRAMES * 2):
+                    yield array("h", data[: len(data) // 2 * 2])
+            return
+
+        with wave.open(self.path, "rb") as wav:
+            if wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+                raise ValueError(f"{self.path}: only mono 16-bit WAV files are supported")
+            if wav.getframerate() != sample_rate:
+                raise ValueError(
+                    f"{self.path}: sample rate {wav.getframerate()} does not match {sample_rate}"
+                )
+            while data := wav.readframes(self.BLOCK_FRAMES):
+                block = array("h", data)
+                if sys.byteorder == "big":
+                    block.byteswap()
+                yield block
+
+
+class PushSource(AudioSource):
+    """
+    Audio pushed by its producer, e.g. received from a network client.
+    The bytes of little-endian int16 samples are split to the frames,
+    and the time every frame was received is kept to measure how long it waited
+    """
+
+    live = True
+
+    def __init__(self, frame_length: int, sample_rate: int = config.STT_SAMPLE_RATE):
+        super().__init__(frame_length, sample_rate)
+        self.samples = array("h")
+        self.frames: deque[tuple[list[int], float]] = deque()
+        self.changed = threading.Condition()
+        self.closed = False
+        # Odd byte of the last pushed data
+        self.remainder = b""
+
+    def push(self, data: bytes) -> None:
+        """
+        Add the audio
+        :param data: The int16 samples
+        :return:
+        """
+        data = self.remainder + data
+        size = len(data) // 2 * 2
+        self.remainder = data[size:]
+        block = array("h", data[:size])
+        if sys.byteorder == "big":
+            block.byteswap()
+        received = time.perf_counter()
+        with self.changed:
+            self.samples.extend(block)
+            while len(self.samples) >= self.frame_length:
+                self.frames.append((self.samples[: self.frame_length].tolist(), received))
+                del self.samples[: self.frame_length]
+            self.changed.notify_all()
+
+    def close(self) -> None:
+        """
+        Mark the end of the audio. The last frame is padded with silence
+        :return:
+        """
+        with self.changed:
+            if self.samples:
+                self.samples.extend([0] * (self.frame_length - len(self.samples)))
+                self.frames.append((self.samples.tolist(), time.perf_counter()))
+                del self.samples[:]
+            self.closed = True
+            self.changed.notify_all()
+
+    def available(self) -> int:
+        return len(self.frames)
+
+    def read_frame(self) -> tuple[list[int], float]:
+        """
+        Read the next frame, waiting for it
+        :return: The audio samples and the time they were received
+        :raises EndOfStream: If the source is closed and has no more frames
+        """
+        with self.changed:
+            self.changed.wait_for(lambda: self.frames or self.closed)
+            if not self.frames:
+                raise EndOfStream
+            self.frames_read += 1
+            return self.frames.popleft()
+
+    def read(self) -> list[int]:
+        return self.read_frame()[0]
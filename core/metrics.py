@@ -0,0 +1,430 @@
+"""Timing spans of the voice pipeline stages, their histograms and the metrics endpoint"""
+
+import bisect
+import functools
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator, Optional
+
+import config
+
+# Upper bounds of the histogram buckets in seconds, from an audio frame to a spoken answer
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+METRIC_NAME = "voice_assistant_stage_seconds"
+
+
+class Histogram:
+    """
+    Histogram of the durations with fixed buckets. Recording is a bisect and three additions,
+    so it is cheap enough for the stages running on every audio frame
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # The last count is for the values above the last bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.count = 0
+            self.sum = 0.0
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        Estimate the percentile by the upper bound of its bucket
+        :param q: The percentile, from 0 to 100
+        :return: The estimated value in seconds or None if nothing is recorded
+        """
+        with self.lock:
+            counts, count = list(self.counts), self.count
+        if not count:
+            return None
+        rank = q / 100 * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return self.buckets[min(index, len(self.buckets) - 1)]
+        return self.buckets[-1]
+
+    @property
+    def stats(self) -> dict:
+        """
+        Get the summary of the histogram
+        :return: Number of the values, the mean and the estimated percentiles in milliseconds
+        """
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            "count": self.count,
+            "mean_ms": self.sum / self.count * 1000 if self.count else None,
+            "p50_ms": None if p50 is None else p50 * 1000,
+            "p95_ms": None if p95 is None else p95 * 1000,
+        }
+
+
+class Span:
+    """
+    Timing span of a stage. The stage is also recorded as the current one of the thread,
+    so the profiler can tell which stage the sampled code belongs to
+    """
+
+    __slots__ = ("histogram", "name", "stack", "started")
+
+    def __init__(self, metrics: "Metrics", name: str):
+        self.histogram = metrics.histogram(name)
+        self.name = name
+        self.stack = metrics.stage_stack()
+
+    def __enter__(self) -> "Span":
+        self.stack.append(self.name)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.histogram.observe(time.perf_counter() - self.started)
+        self.stack.pop()
+
+
+class NullSpan:
+    """
+    Span that records nothing, used when the metrics are disabled
+    """
+
+    __slots__ = ()
+
+    def __enter__(self) -> "NullSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Metrics:
+    """
+    Registry of the stage histograms
+    """
+
+    def __init__(
+        self,
+        enabled: bool = config.METRICS_ENABLED,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.enabled = enabled
+        self.buckets = buckets
+        self.histograms: dict[str, Histogram] = {}
+        self.lock = threading.Lock()
+        # Stack of the running stages of every thread
+        self.stages: dict[int, list[str]] = {}
+
+    def histogram(self, name: str) -> Histogram:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram(self.buckets))
+        return histogram
+
+    def observe(self, name: str, seconds: float) -> None:
+        self.histogram(name).observe(seconds)
+
+    def stage_stack(self) -> list[str]:
+        """
+        Get the stack of the running stages of the current thread.
+        The stacks of the finished threads are dropped when a new thread gets its stack
+        :return: The stack
+        """
+        thread_id = threading.get_ident()
+        stack = self.stages.get(thread_id)
+        if stack is None:
+            with self.lock:
+                alive = {thread.ident for thread in threading.enumerate()}
+                for finished in [ident for ident in self.stages if ident not in alive]:
+                    del self.stages[finished]
+                stack = self.stages[thread_id] = []
+        return stack
+
+    def reset(self) -> None:
+        """
+        Reset the recorded values. The histograms are kept, because the timed functions hold them
+        :return:
+        """
+        for histogram in list(self.histograms.values()):
+            histogram.reset()
+
+    def span(self, name: str) -> Span | NullSpan:
+        """
+        Time the stage in the with block
+        :param name: The name of the stage
+        :return: The span context manager
+        """
+        return Span(self, name) if self.enabled else NULL_SPAN
+
+    def timed(self, name: str) -> Callable:
+        """
+        Decorator timing every call of the function as the stage
+        :param name: The name of the stage
+        :return: The decorator
+        """
+
+        def decorator(func: Callable) -> Callable:
+            histogram = self.histogram(name)
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                stack = self.stage_stack()
+                stack.append(name)
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started)
+                    stack.pop()
+
+            return wrapper
+
+        return decorator
+
+    def timed_stream(self, name: str) -> Callable:
+        """
+        Decorator timing the generator function as the stage from the call to the last part,
+        and as the {name}_first_part stage to the first part. The time between the parts
+        is spent by the consumer too, so the stage is not put on the stack of the thread
+        :param name: The name of the stage
+        :return: The decorator
+        """
+
+        def decorator(func: Callable[..., Iterator]) -> Callable[..., Iterator]:
+            histogram = self.histogram(name)
+            first_part = self.histogram(f"{name}_first_part")
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs) -> Iterator:
+                if not self.enabled:
+                    yield from func(*args, **kwargs)
+                    return
+                started = time.perf_counter()
+                first = True
+                for part in func(*args, **kwargs):
+                    if first:
+                        first_part.observe(time.perf_counter() - started)
+                        first = False
+                    yield part
+                histogram.observe(time.perf_counter() - started)
+
+            return wrapper
+
+        return decorator
+
+    def current_stage(self, thread_id: int) -> Optional[str]:
+        stack = self.stages.get(thread_id)
+        return stack[-1] if stack else None
+
+    @property
+    def stats(self) -> dict[str, dict]:
+        return {name: histogram.stats for name, histogram in sorted(self.histograms.items())}
+
+    def render(self) -> str:
+        """
+        Render the histograms in the Prometheus text format
+        :return: The metrics page
+        """
+        lines = [
+            f"# HELP {METRIC_NAME} Duration of the voice pipeline stages",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        for name, histogram in sorted(self.histograms.items()):
+            with histogram.lock:
+                counts, count, total = list(histogram.counts), histogram.count, histogram.sum
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{METRIC_NAME}_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{METRIC_NAME}_bucket{{stage="{name}",le="+Inf"}} {count}')
+            lines.append(f'{METRIC_NAME}_sum{{stage="{name}"}} {total}')
+            lines.append(f'{METRIC_NAME}_count{{stage="{name}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def log_summary(self) -> None:
+        for name, stats in self.stats.items():
+            if stats["count"]:
+                logging.info(
+                    f"Stage {name}: {stats['count']} calls, mean {stats['mean_ms']:.2f} ms, "
+                    f"p50 <= {stats['p50_ms']:g} ms, p95 <= {stats['p95_ms']:g} ms"
+                )
+
+
+class SamplingProfiler(threading.Thread):
+    """
+    Opt-in sampling profiler. The stacks of the threads running a timed stage are sampled
+    periodically, and the samples are counted by the stage and the innermost function,
+    so a latency regression can be pinned to a stage and the code where it spends the time
+    """
+
+    def __init__(self, metrics: Metrics, interval: float = config.PROFILER_INTERVAL):
+        """
+        :param metrics: The metrics with the running stages
+        :param interval: Seconds between the samples
+        """
+        super().__init__(name="profiler", daemon=True)
+        self.metrics = metrics
+        self.interval = interval
+        self.samples: Counter[tuple[str, str]] = Counter()
+        self.stopped = threading.Event()
+
+    def sample(self) -> None:
+        for thread_id, frame in sys._current_frames().items():
+            stage = self.metrics.current_stage(thread_id)
+            if stage is None:
+                continue
+            code = frame.f_code
+            self.samples[(stage, f"{code.co_filename}:{frame.f_lineno} {code.co_name}")] += 1
+
+    def run(self) -> None:
+        logging.info(f"Sampling profiler started, interval {self.interval} s")
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def report(self, top: int = 20) -> str:
+        """
+        Get the most sampled locations of every stage
+        :param top: Number of the locations
+        :return: The report text
+        """
+        stages = Counter()
+        for (stage, _), count in self.samples.items():
+            stages[stage] += count
+        lines = [f"{stage}: {count} samples" for stage, count in stages.most_common()]
+        lines += [
+            f"{count:>6} {stage} {location}"
+            for (stage, location), count in self.samples.most_common(top)
+        ]
+        return "\n".join(lines) + "\n"
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+
+class MetricsServer:
+    """
+    Local HTTP endpoint with the metrics in the Prometheus format on /metrics
+    and the profiler report on /profile
+    """
+
+    def __init__(
+        self,
+        metrics: Metrics,
+        profiler: Optional[SamplingProfiler] = None,
+        host: str = config.METRICS_HOST,
+        port: int = config.METRICS_PORT,
+    ):
+        self.metrics = metrics
+        self.profiler = profiler
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="metrics_server", daemon=True
+        )
+
+    def _make_handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path == "/metrics":
+                    body = server.metrics.render()
+                elif self.path == "/profile" and server.profiler is not None:
+                    body = server.profiler.report()
+                else:
+                    self.send_error(404)
+                    return
+                content = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        return Handler
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MetricsServer":
+        self.thread.start()
+        logging.info(f"Metrics are served on {self.url}/metrics")
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsReporter(threading.Thread):
+    """
+    Logs the summary of the stages, and the profiler report if it is running, periodically
+    """
+
+    def __init__(
+        self,
+        metrics: Metrics,
+        profiler: Optional[SamplingProfiler] = None,
+        interval: float = config.METRICS_LOG_INTERVAL,
+    ):
+        super().__init__(name="metrics_reporter", daemon=True)
+        self.metrics = metrics
+        self.profiler = profiler
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.metrics.log_summary()
+            if self.profiler is not None:
+                logging.info(f"Profiler samples:\n{self.profiler.report(top=10)}")
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+
+metrics = Metrics()
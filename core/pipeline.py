@@ -0,0 +1,132 @@
+"""Building blocks of the staged voice pipeline"""
+
+import logging
+import queue
+import struct
+import threading
+from collections import deque
+from typing import Any, Callable, Optional
+
+# Marker passed through the queues to stop the stages
+STOP = object()
+
+
+class RingBuffer:
+    """
+    Bounded FIFO of the audio frames.
+    When it is full the oldest frame is dropped, so the capture never blocks on slow consumers.
+    With overwrite=False the producer waits for the free space instead, which suits the sources
+    that are read faster than real time
+    """
+
+    def __init__(self, maxlen: int, overwrite: bool = True):
+        self.frames = deque(maxlen=maxlen)
+        self.overwrite = overwrite
+        self.changed = threading.Condition()
+        self.dropped = 0
+
+    def put(self, frame: Any) -> None:
+        with self.changed:
+            if len(self.frames) == self.frames.maxlen:
+                if self.overwrite:
+                    self.dropped += 1
+                else:
+                    self.changed.wait_for(lambda: len(self.frames) < self.frames.maxlen)
+            self.frames.append(frame)
+            self.changed.notify_all()
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """
+        Get the oldest frame, waiting for it if the buffer is empty
+        :param timeout: Seconds to wait
+        :return: The frame
+        :raises queue.Empty: If there is no frame after the timeout
+        """
+        with self.changed:
+            if not self.changed.wait_for(lambda: self.frames, timeout=timeout):
+                raise queue.Empty
+            frame = self.frames.popleft()
+            self.changed.notify_all()
+            return frame
+
+    def clear(self) -> None:
+        with self.changed:
+            self.frames.clear()
+            self.changed.notify_all()
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+
+class PcmBuffer:
+    """
+    Preallocated int16 buffer aggregating the audio frames into larger chunks.
+    Frames are packed in place with a precompiled struct, and the same memory is reused
+    for every chunk and exposed as a byte view without copying
+    """
+
+    def __init__(self, frame_length: int, frames_per_chunk: int):
+        self.frame = struct.Struct(f"{frame_length}h")
+        self.data = bytearray(self.frame.size * frames_per_chunk)
+        self.bytes = memoryview(self.data)
+        self.offset = 0
+
+    def append(self, frame: list[int]) -> bool:
+        """
+        Pack the frame to the buffer
+        :param frame: The audio samples
+        :return: True if the buffer is full and should be flushed
+        """
+        self.frame.pack_into(self.data, self.offset, *frame)
+        self.offset += self.frame.size
+        return self.offset + self.frame.size > len(self.data)
+
+    def view(self) -> memoryview:
+        """
+        Get the filled part of the buffer
+        :return: The byte view of the samples
+        """
+        return self.bytes[: self.offset]
+
+    def clear(self) -> None:
+        self.offset = 0
+
+
+class Stage(threading.Thread):
+    """
+    Pipeline stage: takes the items from the inbox, handles them in its own thread and puts
+    the results that are not None to the outbox. Putting to a full bounded outbox blocks,
+    so a slow stage holds back the previous ones.
+    When the stage is stopped, the flush function can return the last result
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], Any],
+        inbox: queue.Queue | RingBuffer,
+        outbox: Optional[queue.Queue] = None,
+        flush: Optional[Callable[[], Any]] = None,
+    ):
+        super().__init__(name=name, daemon=True)
+        self.handler = handler
+        self.inbox = inbox
+        self.outbox = outbox
+        self.flush = flush
+
+    def _emit(self, call: Callable, *args) -> None:
+        try:
+            result = call(*args)
+        except Exception as e:
+            logging.error(f"An error occurred in the {self.name} stage: {e}", exc_info=True)
+            return
+        if result is not None and self.outbox is not None:
+            self.outbox.put(result)
+
+    def run(self) -> None:
+        while (item := self.inbox.get()) is not STOP:
+            self._emit(self.handler, item)
+        if self.flush is not None:
+            self._emit(self.flush)
+        if self.outbox is not None:
+            self.outbox.put(STOP)
@@ -0,0 +1,509 @@
+"""
+Server mode: one process serving the audio streams of many clients, e.g. rooms and devices.
+
+The Vosk model, the Silero model and the command catalog are loaded once and shared
+by the sessions. Every session has its own speech recognizer and the state of the phrase.
+The frames of the sessions are handled by a bounded pool of worker threads, and the commands
+with their responses by another one, so the slow commands don't delay the audio of the sessions.
+
+Protocol: TCP messages of a one-byte kind, a 4-byte big-endian length and the payload.
+The client sends "S" with the session id (optional, the first message), "A" with
+little-endian int16 mono PCM at STT_SAMPLE_RATE and "E" when its audio is over.
+The server sends "J" with the JSON events (the recognized phrases, the text responses,
+the end of the session) and "A" with the responses as int16 PCM at TTS_SAMPLE_RATE.
+The sessions recognize all the speech: the client streams only when it is spoken to.
+
+Usage: python -m core.server --port 8765
+       python -m core.server --client command.wav
+"""
+
+import argparse
+import json
+import logging
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Iterable, Optional
+
+import numpy as np
+import vosk
+
+import config
+from core.audio_source import FileSource, PushSource
+from core.metrics import Histogram, metrics
+from core.speech_to_text import FRAME_LENGTH, STT
+from core.text_to_speech import TTS
+
+HEADER = struct.Struct(">cI")
+# Largest message accepted from the clients
+MAX_MESSAGE = 1 << 20
+SESSION = b"S"
+AUDIO = b"A"
+END = b"E"
+EVENT = b"J"
+
+
+def send_message(sock: socket.socket, kind: bytes, payload: bytes = b"") -> None:
+    sock.sendall(HEADER.pack(kind, len(payload)) + payload)
+
+
+def read_message(stream: BinaryIO) -> Optional[tuple[bytes, bytes]]:
+    """
+    Read the next message
+    :param stream: The stream of the socket
+    :return: The kind and the payload of the message or None when the connection is closed
+    """
+    header = stream.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    kind, size = HEADER.unpack(header)
+    if size > MAX_MESSAGE:
+        raise ValueError(f"Message of {size} bytes is too large")
+    payload = stream.read(size)
+    if len(payload) < size:
+        return None
+    return kind, payload
+
+
+class SessionSpeaker:
+    """
+    Text to speech of a session: the responses are synthesized by the shared model
+    and sent to the client instead of being played
+    """
+
+    is_speaking = False
+
+    def __init__(self, session: "Session", synthesizer):
+        """
+        :param session: The session to send the audio to
+        :param synthesizer: The shared TTS, its synthesize() is used
+        """
+        self.session = session
+        self.synthesizer = synthesizer
+
+    def _send(self, chunks: Iterable[str]) -> str:
+        """
+        Synthesize the chunks one by one and send their audio
+        :param chunks: The chunks of the response
+        :return: The sent text
+        """
+        spoken = []
+        for chunk in chunks:
+            self.session.send_audio(self.synthesizer.synthesize(chunk))
+            spoken.append(chunk)
+        return " ".join(spoken)
+
+    def speak(self, phrase: str) -> None:
+        self.session.send_event("response", text=phrase)
+        self._send(TTS.split_phrase(phrase))
+
+    def speak_stream(self, parts: Iterable[str]) -> str:
+        text = self._send(TTS.split_stream(parts))
+        if text:
+            self.session.send_event("response", text=text)
+        return text
+
+    def cancel(self) -> None:
+        pass
+
+
+class Session:
+    """
+    Session of a client. Its frames are handled by the pool workers, one worker at a time,
+    by batches of SERVER_BATCH_FRAMES, so the busy sessions don't starve the others.
+    The recognized phrases are executed in the order they come by the command workers,
+    and the session ends when the last response is sent
+    """
+
+    def __init__(self, server: "AssistantServer", session_id: str, sock: socket.socket):
+        self.server = server
+        self.session_id = session_id
+        self.sock = sock
+        self.send_lock = threading.Lock()
+        self.source = PushSource(FRAME_LENGTH)
+        self.stt = STT(
+            source=self.source,
+            recognizer=server.recognizer_factory(),
+            vad=server.vad_factory() if server.vad_factory else None,
+            listen_always=True,
+        )
+        if server.vad_factory is None:
+            self.stt.vad = None
+        self.speaker = SessionSpeaker(self, server.synthesizer)
+        self.lock = threading.Lock()
+        self.scheduled = False
+        # Phrases waiting for the command workers
+        self.phrases_queue: deque[str] = deque()
+        self.responding = False
+        # All the frames are handled, the session ends after the responses
+        self.frames_done = False
+        self.ended = False
+        self.finished = threading.Event()
+        # Seconds between receiving a frame and handling it
+        self.frame_lag = Histogram()
+        self.phrases = 0
+        self.started = time.perf_counter()
+
+    def push(self, data: bytes) -> None:
+        self.source.push(data)
+        self.schedule()
+
+    def close(self) -> None:
+        self.source.close()
+        self.schedule()
+
+    def schedule(self) -> None:
+        with self.lock:
+            if self.scheduled or self.finished.is_set():
+                return
+            self.scheduled = True
+        self.server.pool.submit(self.process)
+
+    def process(self) -> None:
+        """
+        Handle the next batch of the frames in the pool worker
+        :return:
+        """
+        try:
+            for _ in range(self.server.batch_frames):
+                if not self.source.available():
+                    break
+                frame, received = self.source.read_frame()
+                self.stt.process_frame(frame, self.respond)
+                lag = time.perf_counter() - received
+                self.frame_lag.observe(lag)
+                metrics.observe("server_frame_lag", lag)
+            else:
+                # More frames are waiting, the other sessions go first
+                self.server.pool.submit(self.process)
+                return
+            if self.source.closed and not self.source.available():
+                self.stt.finish(self.respond)
+                self.frames_done = True
+                self.end()
+        except Exception as e:
+            logging.error(f"Error in the session {self.session_id}: {e}", exc_info=True)
+            with self.lock:
+                self.frames_done = self.ended = True
+            self.finished.set()
+        with self.lock:
+            self.scheduled = False
+        # The frames pushed while the batch was finishing
+        if self.source.available() or (self.source.closed and not self.frames_done):
+            self.schedule()
+
+    def respond(self, text: str) -> bool:
+        """
+        Queue the recognized phrase for the command workers
+        :param text: The recognized text
+        :return: True, the phrase is always accepted
+        """
+        self.phrases += 1
+        self.send_event("phrase", text=text)
+        with self.lock:
+            self.phrases_queue.append(text)
+            if self.responding:
+                return True
+            self.responding = True
+        try:
+            self.server.command_pool.submit(self.execute_phrases)
+        except RuntimeError as e:
+            logging.warning(f"Session {self.session_id} phrase is dropped: {e}")
+            with self.lock:
+                self.phrases_queue.clear()
+                self.responding = False
+        return True
+
+    def execute_phrases(self) -> None:
+        """
+        Execute the queued phrases one by one in the command worker
+        :return:
+        """
+        while True:
+            with self.lock:
+                if not self.phrases_queue:
+                    self.responding = False
+                    break
+                text = self.phrases_queue.popleft()
+            try:
+                self.server.processor.respond(text, tts=self.speaker, session=self.session_id)
+            except Exception as e:
+                logging.error(
+                    f"Error responding in the session {self.session_id}: {e}", exc_info=True
+                )
+        self.end()
+
+    def end(self) -> None:
+        """
+        End the session when all its frames are handled and all its phrases are responded
+        :return:
+        """
+        with self.lock:
+            if not self.frames_done or self.responding or self.ended:
+                return
+            self.ended = True
+        self.send_event("end", stats=self.stats)
+        self.finished.set()
+
+    def send_event(self, event: str, **fields) -> None:
+        self._send(EVENT, json.dumps({"event": event, **fields}).encode())
+
+    def send_audio(self, audio: np.ndarray) -> None:
+        samples = (np.clip(audio, -1, 1) * 32767).astype("<i2")
+        self._send(AUDIO, samples.tobytes())
+
+    def _send(self, kind: bytes, payload: bytes) -> None:
+        with self.send_lock:
+            try:
+                send_message(self.sock, kind, payload)
+            except OSError as e:
+                logging.warning(f"Session {self.session_id} is disconnected: {e}")
+
+    @property
+    def stats(self) -> dict:
+        lag = self.frame_lag.stats
+        return {
+            "session": self.session_id,
+            "audio_s": self.source.position,
+            "phrases": self.phrases,
+            "frame_lag_mean_ms": lag["mean_ms"],
+            "frame_lag_p95_ms": lag["p95_ms"],
+        }
+
+
+class SessionHandler(socketserver.StreamRequestHandler):
+    """
+    Reads the messages of a client connection and passes its audio to the session
+    """
+
+    server: "AssistantServer"
+
+    def handle(self) -> None:
+        session_id = "{}:{}".format(*self.client_address[:2])
+        session = None
+        try:
+            message = read_message(self.rfile)
+            if message is not None and message[0] == SESSION:
+                session_id = message[1].decode() or session_id
+                message = None
+
+            session = self.server.open_session(session_id, self.request)
+            if session is None:
+                return
+            message = message or read_message(self.rfile)
+            while message is not None and message[0] != END:
+                if message[0] == AUDIO:
+                    session.push(message[1])
+                message = read_message(self.rfile)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Session {session_id} is interrupted: {e}")
+        finally:
+            if session is not None:
+                session.close()
+                session.finished.wait()
+                self.server.close_session(session)
+
+
+class AssistantServer(socketserver.ThreadingTCPServer):
+    """
+    Server of the audio streams. The connections are read by their own threads,
+    the speech recognition runs in the bounded pool of workers and the commands in another one
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        processor,
+        recognizer_factory: Callable,
+        synthesizer,
+        host: str = config.SERVER_HOST,
+        port: int = config.SERVER_PORT,
+        workers: int = config.SERVER_WORKERS,
+        command_workers: int = config.SERVER_COMMAND_WORKERS,
+        max_sessions: int = config.SERVER_MAX_SESSIONS,
+        batch_frames: int = config.SERVER_BATCH_FRAMES,
+        vad_factory: Optional[Callable] = None,
+    ):
+        """
+        :param processor: The command processor shared by the sessions
+        :param recognizer_factory: The function creating the speech recognizer of a session
+        :param synthesizer: The TTS shared by the sessions
+        :param host: The address to listen on
+        :param port: The port to listen on, 0 for any free one
+        :param workers: Number of the worker threads handling the frames
+        :param command_workers: Number of the worker threads executing the commands
+        :param max_sessions: Number of the concurrent sessions, the other clients are refused
+        :param batch_frames: Frames handled by a worker before switching to another session
+        :param vad_factory: The function creating the voice activity detector of a session
+        """
+        super().__init__((host, port), SessionHandler)
+        self.processor = processor
+        self.recognizer_factory = recognizer_factory
+        self.synthesizer = synthesizer
+        self.vad_factory = vad_factory
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="session")
+        self.command_pool = ThreadPoolExecutor(
+            max_workers=command_workers, thread_name_prefix="command"
+        )
+        self.max_sessions = max_sessions
+        self.batch_frames = batch_frames
+        self.sessions: dict[int, Session] = {}
+        self.sessions_lock = threading.Lock()
+        self.finished_sessions: list[dict] = []
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self.server_address[:2]
+
+    def open_session(self, session_id: str, sock: socket.socket) -> Optional[Session]:
+        with self.sessions_lock:
+            refused = len(self.sessions) >= self.max_sessions
+            if not refused:
+                session = Session(self, session_id, sock)
+                self.sessions[id(session)] = session
+        # Sent without the lock, so a slow client doesn't block the other sessions
+        if refused:
+            logging.warning(f"Session {session_id} is refused: too many sessions")
+            send_message(sock, EVENT, json.dumps({"event": "refused"}).encode())
+            return None
+        logging.info(f"Session {session_id} started, {len(self.sessions)} sessions")
+        return session
+
+    def close_session(self, session: Session) -> None:
+        with self.sessions_lock:
+            self.sessions.pop(id(session), None)
+            self.finished_sessions.append(session.stats)
+        logging.info(f"Session {session.session_id} finished: {session.stats}")
+
+    def start(self) -> "AssistantServer":
+        threading.Thread(target=self.serve_forever, name="server", daemon=True).start()
+        logging.info("Serving the audio streams on {}:{}".format(*self.address))
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.command_pool.shutdown(wait=False, cancel_futures=True)
+
+
+class SessionClient:
+    """
+    Client streaming the audio to the server and collecting its events and audio
+    """
+
+    def __init__(self, host: str, port: int, session_id: str = ""):
+        self.sock = socket.create_connection((host, port))
+        self.events: list[dict] = []
+        self.audio = bytearray()
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+        if session_id:
+            send_message(self.sock, SESSION, session_id.encode())
+
+    def _read(self) -> None:
+        with self.sock.makefile("rb") as stream:
+            while (message := read_message(stream)) is not None:
+                kind, payload = message
+                if kind == AUDIO:
+                    self.audio += payload
+                    continue
+                event = json.loads(payload)
+                self.events.append(event)
+                if event["event"] in ("end", "refused"):
+                    return
+
+    def send_audio(self, samples: list[int]) -> None:
+        send_message(self.sock, AUDIO, struct.pack(f"<{len(samples)}h", *samples))
+
+    def finish(self, timeout: Optional[float] = None) -> list[dict]:
+        """
+        Tell the server the audio is over and wait for the end of the session
+        :param timeout: Seconds to wait
+        :return: The events of the session
+        """
+        send_message(self.sock, END)
+        self.reader.join(timeout)
+        self.sock.close()
+        return self.events
+
+
+def serve(args: argparse.Namespace) -> None:
+    """
+    Load the shared models and the commands and serve the clients
+    :param args: The command line arguments
+    :return:
+    """
+    from commands.processor import CommandProcessor
+    from commands.watcher import CatalogWatcher
+    from core.startup import Startup
+    from core.text_to_speech import tts
+    from core.vad import VoiceActivityDetector
+
+    startup = Startup()
+    model = startup.submit("vosk_model", vosk.Model, model_path=config.MODEL_PATH)
+    startup.submit("tts_model", tts.load)
+    processor = startup.submit("commands", CommandProcessor, tts=tts).result()
+    if config.CMD_RELOAD_INTERVAL > 0:
+        CatalogWatcher(processor).start()
+    model = model.result()
+    startup.log_report()
+
+    server = AssistantServer(
+        processor,
+        lambda: vosk.KaldiRecognizer(model, config.STT_SAMPLE_RATE),
+        tts,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        command_workers=args.command_workers,
+        vad_factory=(
+            (lambda: VoiceActivityDetector(config.STT_SAMPLE_RATE)) if config.VAD_ENABLED else None
+        ),
+    )
+    logging.info("Serving the audio streams on {}:{}".format(*server.address))
+    server.serve_forever()
+
+
+def send_file(args: argparse.Namespace) -> None:
+    """
+    Stream the audio file to the server at the microphone pace and print the events
+    :param args: The command line arguments
+    :return:
+    """
+    client = SessionClient(args.host, args.port, args.session)
+    source = FileSource(args.client, FRAME_LENGTH, realtime=True)
+    source.start()
+    try:
+        while True:
+            client.send_audio(source.read())
+    except EOFError:
+        pass
+    for event in client.finish(timeout=60):
+        print(json.dumps(event))
+    print(f"{len(client.audio) // 2 / config.TTS_SAMPLE_RATE:.1f} s of the response audio")
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve the audio streams of many clients.")
+    parser.add_argument("--host", default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=config.SERVER_WORKERS)
+    parser.add_argument("--command-workers", type=int, default=config.SERVER_COMMAND_WORKERS)
+    parser.add_argument("--client", help="Stream the WAV file to the server instead of serving")
+    parser.add_argument("--session", default="", help="Session id of the client")
+    args = parser.parse_args(argv)
+    if args.client:
+        send_file(args)
+    else:
+        serve(args)
+
+
+if __name__ == "__main__":
+    main()
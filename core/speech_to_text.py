@@ -1,68 +1,232 @@
 import json
 import logging
 import queue
-import struct
 import sys
+import threading
 import time
+from typing import Callable, Optional
 
 import pvporcupine
 import vosk
-from pvrecorder import PvRecorder
+from vosk.vosk_cffi import ffi as vosk_ffi
 
 import config
+from core.audio_source import AudioSource, EndOfStream, RecorderSource
+from core.metrics import metrics
+from core.pipeline import STOP, PcmBuffer, RingBuffer, Stage
+from core.vad import END_OF_SPEECH, SILENCE, VoiceActivityDetector
+from core.wake_word import FRAME_LENGTH, UNKNOWN_WORD, WakeWordDetector, create_detector
 
 
 class STT:
     """
-    Speech to text class
+    Speech to text class.
+    The audio source, the wake word engine and the speech recognizer can be replaced,
+    e.g. to replay recorded audio or to run with stubs. The wake word engine should have
+    `frame_length` and `process(frame)` like WakeWordDetector, the recognizer should have
+    the KaldiRecognizer methods.
+    With the voice activity detector the silence is not passed to the recognizer.
+    The Vosk model is loaded by load_recognizer(), which can run in the background while
+    the wake word is already listened to. The vosk wake word engine shares the model,
+    so its detector is created by load_wake_word() in the background too.
+    In the grammar mode the phrases are decoded against the command aliases only.
+    A phrase with the words out of the grammar, e.g. the arguments of a command,
+    is decoded again by the open vocabulary recognizer.
+    The frames can also be handled one by one by process_frame() in the calling thread
+    instead of the pipeline threads of va_listen()
     """
 
-    def __init__(self):
-        self.model = vosk.Model(model_path=config.MODEL_PATH)
+    def __init__(
+        self,
+        source: Optional[AudioSource] = None,
+        wake_word: Optional[WakeWordDetector] = None,
+        recognizer: Optional[vosk.KaldiRecognizer] = None,
+        vad: Optional[VoiceActivityDetector] = None,
+        grammar: Optional[Callable[[], list[str]]] = None,
+        listen_always: bool = False,
+    ):
+        """
+        :param source: The audio source. The microphone by default
+        :param wake_word: The wake word engine. The one of WAKE_WORD_ENGINE by default,
+            the vosk one is created by load_wake_word()
+        :param recognizer: The speech recognizer. The Vosk recognizer is loaded if omitted
+        :param vad: The voice activity detector. The default one if VAD_ENABLED
+        :param grammar: The function returning the phrases of the recognizer grammar.
+            It is called when the model is loaded, so the phrases can be loaded concurrently
+        :param listen_always: Recognize all the speech without the wake word,
+            e.g. when the client detects it itself
+        """
         self.sample_rate = config.STT_SAMPLE_RATE
-        self.q = queue.Queue()
-        self.porcupine = self._init_porcupine()
-        self.recorder = self._init_recorder()
-        self.vosk = self._init_vosk()
+        self.model = None
+        self.listening = True
+        self.draining = False
+        self.stages = []
+        self.on_keyword = lambda: None
+        self.is_muted = lambda: False
+        self.on_partial = None
+        self.reset_requested = threading.Event()
+        self.listen_always = listen_always
+        self.wake_word = wake_word
+        self.wake_word_ready = threading.Event()
+        if wake_word is None and not listen_always and config.WAKE_WORD_ENGINE != "vosk":
+            self.wake_word = self._init_wake_word()
+        if self.wake_word is not None or listen_always:
+            self.wake_word_ready.set()
+        self.frame_length = self.wake_word.frame_length if self.wake_word else FRAME_LENGTH
+        self.recorder = source or self._init_recorder()
+        self.vosk = recognizer
+        self.grammar = grammar
+        self.open_vosk: Optional[vosk.KaldiRecognizer] = None
+        # Recognizers with the grammar of the reloaded commands, swapped in between the phrases
+        self.next_recognizers: Optional[tuple[vosk.KaldiRecognizer, vosk.KaldiRecognizer]] = None
+        # Audio of the current phrase to decode it again without the grammar
+        self.phrase_audio = bytearray()
+        self.recognizer_lock = threading.Lock()
+        self.model_lock = threading.Lock()
+        self.wake_word_lock = threading.Lock()
+        self.recognizer_ready = threading.Event()
+        # Set with recognizer_ready when the model fails to load
+        self.recognizer_error: Optional[Exception] = None
+        if recognizer:
+            self.recognizer_ready.set()
+        # Captured audio frames waiting for the wake word detection
+        self.q = RingBuffer(config.STT_BUFFER_FRAMES, overwrite=self.recorder.live)
+        # Frames are aggregated to larger chunks to call the recognizer less often
+        self.pcm = PcmBuffer(self.frame_length, config.STT_CHUNK_FRAMES)
+        self.pcm_chunk = vosk_ffi.from_buffer(self.pcm.data)
+        self.vad = vad or (VoiceActivityDetector(self.sample_rate) if config.VAD_ENABLED else None)
+        # The last silent chunk is kept to pass the beginning of the speech to the recognizer
+        self.pre_roll = bytearray(len(self.pcm.data))
+        self.pre_roll_chunk = vosk_ffi.from_buffer(self.pre_roll)
+        self.has_pre_roll = False
         self.last_detection_time = time.time() - config.INITIAL_DETECTION_DELAY
 
-    def _init_porcupine(self) -> pvporcupine.Porcupine:
+    def _init_wake_word(self, model: Optional[vosk.Model] = None) -> WakeWordDetector:
         """
-        Initialize the Porcupine wake word engine to detect the keyword
+        Initialize the wake word engine to detect the keyword
         and start the voice recognition
+        :param model: The Vosk model of the vosk engine
         :return:
         """
         try:
-            return pvporcupine.create(
-                access_key=config.PICOVOICE_API_KEY,
-                keyword_paths=[config.PICOVOICE_KEYWORD_PATH],
-                sensitivities=[1],
-            )
+            return create_detector(model=model)
         except pvporcupine.PorcupineActivationError as e:
             logging.error(f"An error occurred while activating Porcupine: {e}", exc_info=True)
             sys.exit(1)
 
-    def _init_recorder(self) -> PvRecorder:
+    def _init_recorder(self) -> RecorderSource:
         """
         Initialize the recorder
         :return:
         """
         try:
-            # TODO: refactor to remove hardcoded device index
-            return PvRecorder(
-                device_index=1,
-                frame_length=self.porcupine.frame_length,
-            )
+            return RecorderSource(frame_length=self.frame_length)
         except Exception as e:
             logging.error(f"An error occurred while initializing the recorder: {e}", exc_info=True)
             sys.exit(1)
 
-    def _init_vosk(self) -> vosk.KaldiRecognizer:
+    def load_model(self) -> vosk.Model:
+        """
+        Load the Vosk model shared by the recognizers and the vosk wake word engine.
+        Concurrent calls wait for the same model
+        :return: The model
+        """
+        with self.model_lock:
+            if self.model is None:
+                self.model = vosk.Model(model_path=config.MODEL_PATH)
+        return self.model
+
+    def load_wake_word(self) -> Optional[WakeWordDetector]:
+        """
+        Create the vosk wake word engine with the speech recognition model,
+        or with its own one if WAKE_WORD_MODEL_PATH is set.
+        Concurrent calls wait for the same engine. If it fails, the listening is stopped
+        :return: The wake word engine
+        """
+        with self.wake_word_lock:
+            if self.wake_word_ready.is_set():
+                return self.wake_word
+            try:
+                model = None if config.WAKE_WORD_MODEL_PATH else self.load_model()
+                self.wake_word = self._init_wake_word(model)
+            except Exception as e:
+                logging.critical(f"Error creating the wake word engine: {e}")
+                self._stop_listening("the wake word engine is not created")
+                raise
+            finally:
+                self.wake_word_ready.set()
+        return self.wake_word
+
+    def load_recognizer(self) -> vosk.KaldiRecognizer:
+        """
+        Load the Vosk model and initialize the recognizer to recognize the speech
+        and convert it to text. Concurrent calls wait for the same recognizer.
+        If the model fails to load, the waiting stages are released and the listening is stopped
+        :return: The recognizer
+        """
+        with self.recognizer_lock:
+            if self.vosk is None and self.recognizer_error is None:
+                try:
+                    self._create_recognizer()
+                except Exception as e:
+                    self.recognizer_error = e
+                    logging.critical(f"Error loading the Vosk model {config.MODEL_PATH}: {e}")
+                    self._stop_listening("the speech recognizer is not loaded")
+                    raise
+                finally:
+                    self.recognizer_ready.set()
+        return self.vosk
+
+    def _create_recognizer(self) -> None:
+        """
+        Load the Vosk model and create the recognizers
+        :return:
+        """
+        self.vosk, self.open_vosk = self._build_recognizers(self.load_model())
+
+    def _build_recognizers(
+        self, model: vosk.Model, open_vosk: Optional[vosk.KaldiRecognizer] = None
+    ) -> tuple[vosk.KaldiRecognizer, Optional[vosk.KaldiRecognizer]]:
+        """
+        Create the recognizer with the current grammar
+        :param model: The Vosk model
+        :param open_vosk: The open vocabulary recognizer to reuse. Created if None
+        :return: The recognizer and the open vocabulary one in the grammar mode, otherwise None
+        """
+        open_vosk = open_vosk or vosk.KaldiRecognizer(model, self.sample_rate)
+        phrases = self.grammar() if self.grammar else None
+        if not phrases:
+            return open_vosk, None
+        logging.info(f"Using the grammar with {len(phrases)} phrases")
+        recognizer = vosk.KaldiRecognizer(
+            model, self.sample_rate, json.dumps([*phrases, UNKNOWN_WORD])
+        )
+        return recognizer, open_vosk
+
+    def update_grammar(self) -> None:
         """
-        Initialize the Vosk recognizer to recognize the speech and convert it to text
+        Rebuild the grammar recognizer from the current phrases, e.g. when the commands
+        are reloaded. The recognition stage swaps it in before the next phrase.
+        The recognizer that is not loaded yet reads the current phrases when it is loaded
         :return:
         """
-        return vosk.KaldiRecognizer(self.model, self.sample_rate)
+        if self.grammar is None:
+            return
+        with self.recognizer_lock:
+            # The recognizer passed to the constructor is not rebuilt
+            if self.vosk is None or self.model is None:
+                return
+            self.next_recognizers = self._build_recognizers(self.model, self.open_vosk or self.vosk)
+
+    def _swap_recognizers(self) -> None:
+        """
+        Start using the rebuilt recognizers. Called between the phrases in the recognition stage
+        :return:
+        """
+        if self.next_recognizers is not None:
+            self.vosk, self.open_vosk = self.next_recognizers
+            self.next_recognizers = None
+            self.phrase_audio.clear()
 
     def _start_listening(self) -> None:
         """
@@ -73,53 +237,291 @@ class STT:
         logging.info("Started listening to the user input")
         logging.info(f"Using device: {self.recorder.selected_device}")
 
-    def _detect_keyword(self) -> bool:
+    def _in_detection_window(self) -> bool:
+        """
+        Check if the keyword was detected recently and the speech should be recognized
+        :return: True if the detection window is open
+        """
+        return time.time() - self.last_detection_time <= config.KEYWORD_DETECTION_TIMEOUT
+
+    @metrics.timed("stt_detect_keyword")
+    def _detect_keyword(self, voice_input: list[int]) -> bool:
         """
         Detect the exact keyword
+        :param voice_input: The audio frame
         :return: True if the keyword was detected, False otherwise
         """
-        voice_input = self.recorder.read()
-        keyword_index = self.porcupine.process(voice_input)
+        keyword_index = self.wake_word.process(voice_input)
         if keyword_index >= 0:
             logging.info("Keyword detected")
             self.last_detection_time = time.time()
             return True
         return False
 
-    def _process_voice_input(self, callback: callable) -> bool:
+    @metrics.timed("stt_process_voice_input")
+    def _process_voice_input(self, voice_input: list[int]) -> Optional[str]:
+        """
+        Feed the audio frame to the recognizer.
+        The frame is packed to the preallocated buffer, and the recognizer gets the whole chunk
+        when the buffer is full, without copying it to a new bytes object.
+        Silent chunks are skipped, and the phrase is finished as soon as the speech has ended
+        instead of waiting for the recognizer endpointing
+        :param voice_input: The audio frame
+        :return: The recognized text when the phrase is finished, None otherwise
+        """
+        # The frames wait in the queues until the model is loaded
+        self.recognizer_ready.wait()
+        if self.recognizer_error is not None:
+            self._stop_listening("the speech recognizer is not loaded")
+            return None
+        if self.reset_requested.is_set():
+            self.reset_requested.clear()
+            self.vosk.Reset()
+            self._reset_chunks()
+            self._swap_recognizers()
+        if self.is_muted():
+            self._reset_chunks()
+            return None
+        if not self.pcm.append(voice_input):
+            return None
+
+        state = self.vad.update(self.pcm.data) if self.vad else None
+        if state == SILENCE:
+            self.pre_roll[:] = self.pcm.data
+            self.has_pre_roll = True
+            self.pcm.clear()
+            return None
+        if self.has_pre_roll:
+            self._accept_waveform(self.pre_roll_chunk, self.pre_roll)
+            self.has_pre_roll = False
+
+        # The chunk spans the whole buffer, because it is passed only when the buffer is full
+        accepted = self._accept_waveform(self.pcm_chunk, self.pcm.data)
+        self.pcm.clear()
+        if accepted:
+            return self._finish_phrase(self.vosk.Result())
+        if state == END_OF_SPEECH:
+            return self._finish_phrase(self.vosk.FinalResult())
+        if self.on_partial:
+            return self._process_partial_result()
+        return None
+
+    def _stop_listening(self, reason: str) -> None:
+        """
+        Stop listening, because the speech recognizer or the wake word engine failed to load
+        :param reason: The failure
+        :return:
         """
-        Process the voice input and call the function to process the recognized text
+        if self.listening:
+            logging.error(f"Stopping the listening: {reason}")
+            self.stop()
+
+    def _accept_waveform(self, chunk, data: bytes | bytearray) -> bool:
+        """
+        Feed the chunk to the recognizer, keeping its audio in the grammar mode
+        :param chunk: The chunk passed to the recognizer
+        :param data: The audio of the chunk
+        :return: True if the phrase is finished
+        """
+        if self.open_vosk:
+            self.phrase_audio += data
+        return self.vosk.AcceptWaveform(chunk)
+
+    def _finish_phrase(self, result: str) -> Optional[str]:
+        """
+        Get the text of the finished phrase and prepare for the next one.
+        The phrase that is not covered by the grammar is decoded by the open recognizer
+        :param result: The recognizer result in JSON
+        :return: The recognized text or None
+        """
+        if self.vad:
+            self.vad.reset()
+        if self.on_partial:
+            self.on_partial("")
+        text = json.loads(result)["text"]
+        if self.open_vosk and UNKNOWN_WORD in text.split():
+            logging.info(f"Recognizing the phrase without the grammar: {text}")
+            self.open_vosk.AcceptWaveform(bytes(self.phrase_audio))
+            text = json.loads(self.open_vosk.FinalResult())["text"]
+        self.phrase_audio.clear()
+        self._swap_recognizers()
+        return text or None
+
+    def _process_partial_result(self) -> Optional[str]:
+        """
+        Check if the partial result is already a complete command.
+        The recognizer is reset then, so the rest of the phrase is not recognized again
+        :return: The partial text if it is complete, None otherwise
+        """
+        partial = json.loads(self.vosk.PartialResult())["partial"]
+        if not partial or not self.on_partial(partial):
+            return None
+        self.vosk.Reset()
+        self.phrase_audio.clear()
+        self._swap_recognizers()
+        if self.vad:
+            self.vad.reset()
+        return partial
+
+    def _reset_chunks(self) -> None:
+        """
+        Drop the buffered audio and the state of the voice activity detector
+        :return:
+        """
+        self.pcm.clear()
+        self.phrase_audio.clear()
+        self.has_pre_roll = False
+        if self.vad:
+            self.vad.reset()
+
+    def _flush_voice_input(self) -> Optional[str]:
+        """
+        Get the rest of the speech when the audio source is exhausted
+        :return: The recognized text or None
+        """
+        if not self.draining:
+            return None
+        self.recognizer_ready.wait()
+        if self.recognizer_error is not None:
+            return None
+        if self.pcm.offset:
+            chunk = bytes(self.pcm.view())
+            self._accept_waveform(chunk, chunk)
+            self.pcm.clear()
+        return self._finish_phrase(self.vosk.FinalResult())
+
+    def _wake_word_stage(self, voice_input: list[int]) -> Optional[list[int]]:
+        """
+        Run the wake word detection on every frame and pass the frames
+        to the speech recognition while the detection window is open.
+        Detecting the keyword while the assistant speaks interrupts it (barge-in)
+        :param voice_input: The audio frame
+        :return: The frame to recognize or None
+        """
+        if self.listen_always:
+            return voice_input
+        # The frames wait in the queue until the engine is created
+        self.wake_word_ready.wait()
+        if self.wake_word is None:
+            return None
+        if self._detect_keyword(voice_input):
+            logging.info("Listening to the user input")
+            # The recognizer is used by its own stage, so it is reset there
+            self.reset_requested.set()
+            self.on_keyword()
+            return None
+        if self._in_detection_window():
+            return voice_input
+        return None
+
+    def _command_stage(self, text: str, callback: callable) -> None:
+        """
+        Call the callback with the recognized text. A successful command extends
+        the detection window, so the user can give the next command without the keyword
+        :param text: The recognized text
         :param callback: The callback function to call
-        :return: True if the voice input was processed, False otherwise
-        """
-        # TODO: refactor to remove bool return
-        voice_input = self.recorder.read()
-        if voice_input:
-            data = struct.pack("h" * len(voice_input), *voice_input)
-            if self.vosk.AcceptWaveform(data):
-                self.recorder.stop()
-                recognized = callback(json.loads(self.vosk.Result())["text"])
-                self.recorder.start()
-                return recognized
-        return False
+        :return:
+        """
+        if callback(text):
+            self.last_detection_time = time.time()
 
-    def va_listen(self, callback: callable) -> None:
+    def process_frame(self, voice_input: list[int], callback: callable) -> None:
         """
-        Listen to the user input, recognize the speech and call the callback function
-        :param callback:
+        Handle the audio frame by all the stages in the calling thread
+        :param voice_input: The audio frame
+        :param callback: The function to call with the recognized text
         :return:
         """
-        self._start_listening()
+        voice_input = self._wake_word_stage(voice_input)
+        if voice_input is None:
+            return
+        text = self._process_voice_input(voice_input)
+        if text is not None:
+            self._command_stage(text, callback)
 
+    def finish(self, callback: callable) -> None:
+        """
+        Recognize the rest of the speech after the last frame passed to process_frame()
+        :param callback: The function to call with the recognized text
+        :return:
+        """
+        self.draining = True
+        text = self._flush_voice_input()
+        if text is not None:
+            self._command_stage(text, callback)
+
+    def va_listen(
+        self,
+        callback: callable,
+        on_keyword: Optional[callable] = None,
+        is_muted: Optional[callable] = None,
+        on_partial: Optional[callable] = None,
+    ) -> None:
+        """
+        Listen to the user input, recognize the speech and call the callback function.
+        The audio is captured continuously to the ring buffer and handled by the pipeline stages
+        running in their own threads: wake word -> speech recognition -> command.
+        The stages are connected with bounded queues, so the capture is never blocked by a command.
+        Returns when the audio source is exhausted and all its audio is handled
+        :param callback: The function to call with the recognized text
+        :param on_keyword: The function to call when the keyword is detected
+        :param is_muted: The function telling that the assistant speaks and the speech
+            should not be recognized
+        :param on_partial: The function telling that the partial text is a complete command,
+            so it is passed to the callback before the end of the phrase.
+            It is called with an empty text when the phrase is finished
+        :return:
+        """
+        self.on_keyword = on_keyword or (lambda: None)
+        self.is_muted = is_muted or (lambda: False)
+        self.on_partial = on_partial
+        frames = queue.Queue(maxsize=config.STT_QUEUE_SIZE)
+        texts = queue.Queue(maxsize=config.STT_QUEUE_SIZE)
+        self.stages = [
+            Stage("wake_word", self._wake_word_stage, self.q, frames),
+            Stage(
+                "speech_recognition",
+                self._process_voice_input,
+                frames,
+                texts,
+                flush=self._flush_voice_input,
+            ),
+            Stage("command", lambda text: self._command_stage(text, callback), texts),
+        ]
+        for stage in self.stages:
+            stage.start()
+        if not self.recognizer_ready.is_set():
+            threading.Thread(target=self.load_recognizer, name="vosk_model", daemon=True).start()
+        if not self.wake_word_ready.is_set():
+            threading.Thread(target=self.load_wake_word, name="wake_word", daemon=True).start()
+
+        self._start_listening()
         try:
-            while True:
-                if self._detect_keyword():
-                    logging.info("Listening to the user input")
-                    while time.time() - self.last_detection_time <= config.KEYWORD_DETECTION_TIMEOUT:
-                        success = self._process_voice_input(callback)
-                        if success:
-                            self.last_detection_time = time.time()
+            while self.listening:
+                self.q.put(self.recorder.read())
+        except EndOfStream:
+            logging.info("The audio source is exhausted")
+            self.stop(drain=True)
+            for stage in self.stages:
+                stage.join()
         except Exception as e:
+            if not self.listening:
+                return
             logging.error(f"An error occurred while listening to the user input: {e}", exc_info=True)
             self.recorder.stop()
             sys.exit(1)
+
+    def stop(self, drain: bool = False) -> None:
+        """
+        Stop the capture and the pipeline stages
+        :param drain: Handle the captured audio before stopping instead of dropping it
+        :return:
+        """
+        self.listening = False
+        self.draining = drain
+        self.recorder.stop()
+        if not drain:
+            self.q.clear()
+        self.q.put(STOP)
+        if self.q.dropped:
+            logging.warning(f"{self.q.dropped} audio frames were dropped")
@@ -0,0 +1,117 @@
+"""Concurrent startup of the assistant components"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+
+@dataclass
+class Phase:
+    """
+    Timing of a startup phase. Times are in seconds from the start of the startup
+    """
+
+    name: str
+    thread: str
+    started: float
+    finished: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        return None if self.finished is None else self.finished - self.started
+
+
+class Startup:
+    """
+    Startup orchestrator. The phases run concurrently in their own threads,
+    so slow model loading doesn't delay the components that are ready.
+    Every phase is timed, and the report is logged when all the phases are finished
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.started = time.perf_counter()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="startup")
+        self.lock = threading.Lock()
+        self.phases: list[Phase] = []
+        self.futures: list[Future] = []
+
+    def run(self, name: str, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run the phase in the current thread
+        :param name: The name of the phase
+        :param func: The function to run
+        :return: The result of the function
+        """
+        phase = Phase(name, threading.current_thread().name, time.perf_counter() - self.started)
+        with self.lock:
+            self.phases.append(phase)
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            phase.error = str(e)
+            logging.error(f"Startup phase {name} failed: {e}", exc_info=True)
+            raise
+        finally:
+            phase.finished = time.perf_counter() - self.started
+            logging.info(f"Startup phase {name} finished in {phase.duration:.3f} s")
+
+    def submit(self, name: str, func: Callable, *args, **kwargs) -> Future:
+        """
+        Run the phase in a background thread
+        :param name: The name of the phase
+        :param func: The function to run
+        :return: The future with the result of the function
+        """
+        future = self.executor.submit(self.run, name, func, *args, **kwargs)
+        self.futures.append(future)
+        return future
+
+    def wait(self) -> None:
+        """
+        Wait for all the submitted phases
+        :return:
+        """
+        wait(self.futures)
+        self.executor.shutdown(wait=False)
+
+    def report(self) -> dict:
+        """
+        Get the timing report of the phases
+        :return: The phases sorted by the start time and the time when all of them were finished
+        """
+        with self.lock:
+            phases = sorted(self.phases, key=lambda phase: phase.started)
+        finished = [phase.finished for phase in phases if phase.finished is not None]
+        return {
+            "phases": [
+                {
+                    "name": phase.name,
+                    "thread": phase.thread,
+                    "started_s": phase.started,
+                    "duration_s": phase.duration,
+                    "error": phase.error,
+                }
+                for phase in phases
+            ],
+            "ready_s": max(finished, default=0.0),
+        }
+
+    def log_report(self) -> None:
+        """
+        Wait for all the phases and log the timing report
+        :return:
+        """
+        self.wait()
+        report = self.report()
+        lines = [
+            f"  {phase['name']:<20} {phase['started_s']:7.3f} s +{phase['duration_s'] or 0:7.3f} s"
+            f"  [{phase['thread']}]" + (f" failed: {phase['error']}" if phase["error"] else "")
+            for phase in report["phases"]
+        ]
+        logging.info(
+            f"Startup finished in {report['ready_s']:.3f} s:\n" + "\n".join(lines),
+        )
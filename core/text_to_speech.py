@@ -1,29 +1,358 @@
+import logging
+import queue
+import re
+import textwrap
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Iterable, Iterator, Optional
+
+import numpy as np
 import sounddevice as sd
-import torch
 
 import config
+from core.audio_cache import AudioCache
+from core.metrics import metrics
+from core.tts_model import model_variant
+
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+CLAUSE_END = re.compile(r"(?<=[,;:])\s+")
+
+
+class SynthesisCoalescer:
+    """
+    Coalesces the requests of the concurrent callers: while a phrase is synthesized
+    for one caller, the other callers of the same phrase wait for its audio instead of
+    synthesizing it again. The Silero model takes one text per call, so the different
+    phrases are still synthesized one by one
+    """
+
+    def __init__(self, synthesize: Callable[[str], np.ndarray]):
+        """
+        :param synthesize: The function synthesizing the phrase
+        """
+        self.synthesize_phrase = synthesize
+        # Futures of the phrases being synthesized
+        self.pending: dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.coalesced = 0
+
+    def synthesize(self, phrase: str) -> np.ndarray:
+        """
+        Synthesize the phrase or wait for the audio of the same phrase requested by another caller.
+        The error of the synthesis is raised to every caller of the phrase
+        :param phrase: The phrase to synthesize
+        :return: The float32 audio samples
+        """
+        with self.lock:
+            self.requests += 1
+            future = self.pending.get(phrase)
+            if future is not None:
+                self.coalesced += 1
+            else:
+                self.pending[phrase] = Future()
+        if future is not None:
+            return future.result()
+
+        future = self.pending[phrase]
+        try:
+            audio = self.synthesize_phrase(phrase)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(audio)
+        finally:
+            with self.lock:
+                del self.pending[phrase]
+        return audio
+
+    @property
+    def stats(self) -> dict:
+        return {"requests": self.requests, "coalesced": self.coalesced}
 
 
 class TTS:
+    """
+    Silero text to speech. The model is loaded on the first use or by load(),
+    so creating the TTS is cheap and the model can be loaded in the background
+    """
+
     def __init__(self):
-        self.model, _ = torch.hub.load(
-            repo_or_dir="snakers4/silero-models",
-            model="silero_tts",
-            language=config.LANGUAGE,
-            speaker=config.MODEL_ID,
-            trust_repo=True,
+        self._model = None
+        self.load_lock = threading.Lock()
+        # Responses of the script commands are spoken from the worker threads
+        self.lock = threading.Lock()
+        self.model_lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.cache = AudioCache()
+        # The audio of the other variants of the model is not served from the cache
+        self.variant = model_variant()
+        # The same phrase requested by the concurrent callers, e.g. the server sessions,
+        # is synthesized once
+        self.coalescer: Optional[SynthesisCoalescer] = SynthesisCoalescer(self.run_model)
+
+    def load(self):
+        """
+        Load the Silero model, the optimized local one if TTS_MODEL_PATH is set.
+        Concurrent calls wait for the same model
+        :return: The model
+        """
+        with self.load_lock:
+            if self._model is None:
+                # Torch takes seconds to import, so it is imported only when the model is needed
+                import torch
+
+                if config.TTS_MODEL_PATH:
+                    from core.tts_model import load_model
+
+                    model = load_model(config.TTS_MODEL_PATH, config.TTS_DEVICE)
+                else:
+                    model, _ = torch.hub.load(
+                        repo_or_dir="snakers4/silero-models",
+                        model="silero_tts",
+                        language=config.LANGUAGE,
+                        speaker=config.MODEL_ID,
+                        trust_repo=True,
+                    )
+                    model.to(config.TTS_DEVICE)
+                if config.TTS_THREADS > 0:
+                    torch.set_num_threads(config.TTS_THREADS)
+                self._model = model
+        return self._model
+
+    @property
+    def model(self):
+        return self._model or self.load()
+
+    @staticmethod
+    def split_phrase(phrase: str, max_chars: int = config.TTS_CHUNK_CHARS) -> list[str]:
+        """
+        Split the phrase into chunks at the sentence boundaries.
+        Sentences longer than max_chars are split at the clause boundaries,
+        and clauses that are still too long are split between the words
+        :param phrase: The phrase to split
+        :param max_chars: Maximum length of a chunk
+        :return: The chunks of the phrase
+        """
+        chunks = []
+        for sentence in SENTENCE_END.split(phrase.strip()):
+            if len(sentence) <= max_chars:
+                chunks.append(sentence)
+                continue
+            current = ""
+            for clause in CLAUSE_END.split(sentence):
+                if current and len(current) + len(clause) + 1 > max_chars:
+                    chunks.append(current)
+                    current = clause
+                else:
+                    current = f"{current} {clause}".strip()
+            chunks.append(current)
+        return [part for chunk in chunks for part in textwrap.wrap(chunk, max_chars)]
+
+    @classmethod
+    def split_stream(
+        cls, parts: Iterable[str], max_chars: int = config.TTS_CHUNK_CHARS
+    ) -> Iterator[str]:
+        """
+        Split the text arriving by parts, e.g. generated by ChatGPT, into chunks.
+        A chunk is returned as soon as its sentence is complete or it is longer than max_chars
+        :param parts: The parts of the text
+        :param max_chars: Maximum length of a chunk
+        :return: The chunks of the text
+        """
+        pending = ""
+        for part in parts:
+            pending += part
+            *sentences, pending = SENTENCE_END.split(pending)
+            for sentence in sentences:
+                yield from cls.split_phrase(sentence, max_chars)
+            if len(pending) > max_chars:
+                *chunks, tail = cls.split_phrase(pending, max_chars)
+                yield from chunks
+                # The next part may continue the last word or start a new one
+                pending = tail + " " if pending[-1].isspace() else tail
+        if pending.strip():
+            yield from cls.split_phrase(pending, max_chars)
+
+    def cache_key(self, phrase: str) -> tuple:
+        return self.cache.make_key(
+            phrase, config.SPEAKER, config.TTS_SAMPLE_RATE, config.MODEL_ID, self.variant
         )
-        self.model.to(config.TTS_DEVICE)
 
+    def synthesize(self, phrase: str) -> np.ndarray:
+        """
+        Synthesize the audio for the phrase or take it from the cache
+        :param phrase: The phrase to synthesize
+        :return: The float32 audio samples
+        """
+        key = self.cache_key(phrase)
+        audio = self.cache.get(key)
+        if audio is not None:
+            return audio
+
+        if self.coalescer is not None:
+            audio = self.coalescer.synthesize(phrase)
+        else:
+            audio = self.run_model(phrase)
+        self.cache.put(key, audio)
+        return audio
+
+    def run_model(self, phrase: str) -> np.ndarray:
+        """
+        Synthesize the phrase by the model, without the cache,
+        in the inference mode without autograd tracking
+        :param phrase: The phrase to synthesize
+        :return: The float32 audio samples
+        """
+        import torch
+
+        model = self.model
+        with self.model_lock, torch.inference_mode():
+            return model.apply_tts(
+                text=phrase,
+                speaker=config.SPEAKER,
+                sample_rate=config.TTS_SAMPLE_RATE,
+            ).numpy()
+
+    def prewarm(self, phrases: list[str]) -> None:
+        """
+        Synthesize the phrases in advance, so they are played from the cache.
+        Phrases are cached by the same chunks as they are spoken
+        :param phrases: The phrases to cache
+        :return:
+        """
+        for phrase in phrases:
+            chunks = self.split_phrase(phrase) if config.TTS_STREAMING else [phrase]
+            for chunk in chunks:
+                try:
+                    self.synthesize(chunk)
+                except Exception as e:
+                    logging.error(f"Error pre-warming the phrase '{chunk}': {e}", exc_info=True)
+        logging.info(f"TTS cache pre-warmed: {self.cache.stats}")
+
+    @property
+    def is_speaking(self) -> bool:
+        return self.lock.locked()
+
+    @metrics.timed("tts_speak")
     def speak(self, phrase: str) -> None:
-        audio = self.model.apply_tts(
-            text=phrase,
-            speaker=config.SPEAKER,
-            sample_rate=config.TTS_SAMPLE_RATE,
+        with self.lock:
+            self.cancelled.clear()
+            if config.TTS_STREAMING:
+                self._speak_streaming(self.split_phrase(phrase))
+                return
+            audio = self.synthesize(phrase)
+            if self.cancelled.is_set():
+                return
+            sd.play(audio, config.TTS_SAMPLE_RATE)
+            sd.wait()
+            sd.stop()
+
+    @metrics.timed("tts_speak_stream")
+    def speak_stream(self, parts: Iterable[str]) -> str:
+        """
+        Speak the text while it is still generated.
+        Every sentence is synthesized as soon as it is complete, and played while
+        the next ones are generated and synthesized
+        :param parts: The parts of the text
+        :return: The spoken text
+        """
+        spoken = []
+
+        def chunks() -> Iterator[str]:
+            for chunk in self.split_stream(parts):
+                spoken.append(chunk)
+                yield chunk
+
+        with self.lock:
+            self.cancelled.clear()
+            self._speak_streaming(chunks())
+        return " ".join(spoken)
+
+    def cancel(self) -> None:
+        """
+        Stop the current playback and drop the chunks that are not played yet
+        :return:
+        """
+        self.cancelled.set()
+        if not config.TTS_STREAMING:
+            sd.stop()
+
+    def _synthesize_chunks(self, chunks: Iterable[str], buffer: queue.Queue) -> None:
+        """
+        Synthesize the chunks one by one and put the audio to the buffer.
+        None is put to the buffer when all the chunks are synthesized
+        :param chunks: The chunks of the phrase, can be generated while they are spoken
+        :param buffer: The buffer with the audio to play
+        :return:
+        """
+        try:
+            for chunk in chunks:
+                if self.cancelled.is_set():
+                    break
+                audio = self.synthesize(chunk)
+                # Blocks while the previous chunk is waiting to be played
+                while not self.cancelled.is_set():
+                    try:
+                        buffer.put(audio, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+        except Exception as e:
+            logging.error(f"An error occurred while synthesizing the speech: {e}", exc_info=True)
+        finally:
+            # Stops the generation of the chunks that won't be spoken
+            if hasattr(chunks, "close"):
+                chunks.close()
+            buffer.put(None)
+
+    def _speak_streaming(self, chunks: Iterable[str]) -> None:
+        """
+        Speak the phrase chunk by chunk: the next chunk is synthesized while the current one
+        is playing, so the first words are heard after only the first chunk is synthesized
+        :param chunks: The chunks of the phrase
+        :return:
+        """
+        started = time.perf_counter()
+        # One chunk is playing and one is waiting in the buffer
+        buffer = queue.Queue(maxsize=1)
+        synthesizer = threading.Thread(
+            target=self._synthesize_chunks,
+            args=(chunks, buffer),
+            daemon=True,
         )
-        sd.play(audio, config.TTS_SAMPLE_RATE)
-        sd.wait()
-        sd.stop()
+        synthesizer.start()
+
+        block_size = config.TTS_SAMPLE_RATE // 10
+        first_audio = True
+        try:
+            with sd.OutputStream(
+                samplerate=config.TTS_SAMPLE_RATE, channels=1, dtype="float32"
+            ) as stream:
+                while (audio := buffer.get()) is not None:
+                    if first_audio:
+                        logging.info(f"First audio after {time.perf_counter() - started:.3f} s")
+                        first_audio = False
+                    audio = audio.reshape(-1, 1)
+                    # Write by small blocks to be able to stop the playback in the middle of a chunk
+                    for start in range(0, len(audio), block_size):
+                        if self.cancelled.is_set():
+                            break
+                        stream.write(audio[start : start + block_size])
+                    if self.cancelled.is_set():
+                        stream.abort()
+                        break
+        finally:
+            # Stops the synthesizer and the generation of the chunks also when the playback fails
+            self.cancelled.set()
+            # Release the synthesizer if it waits for the free buffer
+            while synthesizer.is_alive():
+                try:
+                    buffer.get(timeout=0.1)
+                except queue.Empty:
+                    continue
 
 
 tts = TTS()
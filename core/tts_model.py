@@ -0,0 +1,214 @@
+"""
+Optimized local variants of the Silero TTS model.
+
+The stock model is a torch package downloaded by torch.hub and run in float32.
+A variant is exported once to a directory with a copy of the package and its TorchScript
+networks optimized for the inference, and is loaded from there without the network:
+- float32: the stock networks, only the loading is local
+- frozen: the networks frozen, with the weights inlined as constants, and fused for the inference
+- int8: the linear and recurrent layers dynamically quantized to int8, CPU only
+
+Usage: python -m core.tts_model --precision int8 --output models/silero-int8
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Optional
+
+import config
+
+PRECISIONS = ("float32", "frozen", "int8")
+MANIFEST = "manifest.json"
+PACKAGE = "package.pt"
+SAMPLE_PHRASE = "The quick brown fox jumps over the lazy dog."
+
+
+def find_package(model_id: str = config.MODEL_ID) -> Optional[str]:
+    """
+    Find the stock model package in the torch hub cache
+    :param model_id: The Silero model id, e.g. v3_en
+    :return: The path to the package or None if the model was never downloaded
+    """
+    import torch
+
+    packages = sorted(Path(torch.hub.get_dir()).rglob(f"{model_id}.pt"))
+    return str(packages[0]) if packages else None
+
+
+def load_package(path: str):
+    """
+    Load the model from the torch package, the same way torch.hub does
+    :param path: The path to the package
+    :return: The model
+    """
+    from torch.package import PackageImporter
+
+    return PackageImporter(path).load_pickle("tts_models", "model")
+
+
+def script_modules(model) -> dict:
+    """
+    Get the TorchScript networks of the model
+    :param model: The model
+    :return: The networks by the attribute names
+    """
+    import torch
+
+    return {
+        name: value
+        for name, value in vars(model).items()
+        if isinstance(value, torch.jit.ScriptModule)
+    }
+
+
+def optimize(module, precision: str):
+    """
+    Optimize the TorchScript network for the inference
+    :param module: The network
+    :param precision: One of PRECISIONS
+    :return: The optimized network
+    """
+    import torch
+    from torch.ao import quantization
+
+    module = module.eval()
+    # Freezing drops all the methods but forward, and the model calls the others too
+    methods = [name for name in module._c._method_names() if name != "forward"]
+    if precision == "frozen":
+        return torch.jit.optimize_for_inference(torch.jit.freeze(module, methods))
+    if precision == "int8":
+        module = quantization.prepare_dynamic_jit(module, {"": quantization.default_dynamic_qconfig})
+        return quantization.convert_dynamic_jit(module, preserved_attrs=methods)
+    return module
+
+
+def export_model(package_path: str, output: str, precision: str) -> dict:
+    """
+    Export the optimized variant of the model
+    :param package_path: The path to the stock model package
+    :param output: The directory of the variant
+    :param precision: One of PRECISIONS
+    :return: The manifest of the variant
+    """
+    import torch
+
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision}, expected one of {PRECISIONS}")
+    model = load_package(package_path)
+    modules = script_modules(model)
+    if not modules:
+        raise ValueError(f"No TorchScript networks found in {package_path}")
+
+    os.makedirs(output, exist_ok=True)
+    shutil.copyfile(package_path, os.path.join(output, PACKAGE))
+    for name, module in modules.items():
+        optimized = optimize(module, precision)
+        torch.jit.save(optimized, os.path.join(output, f"{name}.jit.pt"))
+        setattr(model, name, optimized)
+
+    # The variant must still speak before it is used by the assistant
+    with torch.inference_mode():
+        model.apply_tts(
+            text=SAMPLE_PHRASE, speaker=config.SPEAKER, sample_rate=config.TTS_SAMPLE_RATE
+        )
+
+    manifest = {
+        "precision": precision,
+        "model_id": config.MODEL_ID,
+        "language": config.LANGUAGE,
+        "modules": sorted(modules),
+        "torch": torch.__version__,
+    }
+    with open(os.path.join(output, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_manifest(path: str) -> dict:
+    """
+    Read the manifest of the exported variant
+    :param path: The directory of the variant
+    :return: The manifest
+    """
+    with open(os.path.join(path, MANIFEST)) as f:
+        return json.load(f)
+
+
+def model_variant(path: str = config.TTS_MODEL_PATH) -> str:
+    """
+    Get the precision of the model used by the assistant, a part of the audio cache key.
+    The float32 variant runs the stock networks, so it shares the audio with the stock model
+    :param path: The directory of the variant, empty for the stock model
+    :return: The precision, or the path if the manifest can't be read
+    """
+    if not path:
+        return "float32"
+    try:
+        return read_manifest(path)["precision"]
+    except (OSError, ValueError, KeyError):
+        return path
+
+
+def load_model(path: str, device: str = config.TTS_DEVICE):
+    """
+    Load the exported variant of the model
+    :param path: The directory of the variant
+    :param device: The device to run the model on
+    :return: The model
+    :raises ValueError: If the variant is exported from another model or can't run on the device
+    """
+    import torch
+
+    manifest = read_manifest(path)
+    if (manifest["model_id"], manifest["language"]) != (config.MODEL_ID, config.LANGUAGE):
+        raise ValueError(
+            f"The model {path} is exported from {manifest['model_id']} ({manifest['language']}), "
+            f"MODEL_ID is {config.MODEL_ID} ({config.LANGUAGE})"
+        )
+    if manifest["precision"] == "int8" and device != "cpu":
+        raise ValueError(f"The int8 model {path} runs on the CPU only, TTS_DEVICE is {device}")
+    if manifest["torch"] != torch.__version__:
+        logging.warning(
+            f"The model {path} is exported with torch {manifest['torch']}, "
+            f"running with {torch.__version__}"
+        )
+
+    model = load_package(os.path.join(path, PACKAGE))
+    for name in manifest["modules"]:
+        setattr(
+            model, name, torch.jit.load(os.path.join(path, f"{name}.jit.pt"), map_location=device)
+        )
+    model.to(device)
+    logging.info(f"TTS model {manifest['model_id']} ({manifest['precision']}) loaded from {path}")
+    return model
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Export an optimized variant of the TTS model.")
+    parser.add_argument("--precision", choices=PRECISIONS, default="int8")
+    parser.add_argument("--output", required=True, help="Directory of the variant")
+    parser.add_argument(
+        "--package", help="Stock model package. Searched in the torch hub cache if omitted"
+    )
+    args = parser.parse_args(argv)
+
+    package_path = args.package or find_package()
+    if package_path is None:
+        parser.error(
+            f"the {config.MODEL_ID} package is not found, run the assistant once or pass --package"
+        )
+    started = time.perf_counter()
+    manifest = export_model(package_path, args.output, args.precision)
+    print(
+        f"Model {manifest['model_id']} ({args.precision}) exported to {args.output} "
+        f"in {time.perf_counter() - started:.3f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Voice activity detection in front of the speech recognizer"""
+
+import numpy as np
+
+import config
+
+SILENCE = "silence"
+SPEECH = "speech"
+END_OF_SPEECH = "end_of_speech"
+
+# Length of the analysis sub-frames
+SUB_FRAME_MS = 10
+# How fast the noise floor rises to the level of the quietest sub-frames of a chunk.
+# It falls to a lower level at once
+NOISE_FLOOR_ADAPTATION = 0.02
+# Percentile of the sub-frame levels taken as the noise level of a chunk
+NOISE_PERCENTILE = 10
+
+
+class VoiceActivityDetector:
+    """
+    Energy-based voice activity detector.
+    Every chunk is split into 10 ms sub-frames, and their levels are computed at once with NumPy.
+    A sub-frame is voiced when its level is above the noise floor by the margin and above
+    the minimal level. The noise floor follows the quietest sub-frames.
+    The utterance ends when the voiced sub-frames are followed by the hangover of silence
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = config.STT_SAMPLE_RATE,
+        margin_db: float = config.VAD_MARGIN_DB,
+        min_level_db: float = config.VAD_MIN_LEVEL_DB,
+        min_speech_ms: int = config.VAD_MIN_SPEECH_MS,
+        hangover_ms: int = config.VAD_HANGOVER_MS,
+    ):
+        self.sub_frame = sample_rate * SUB_FRAME_MS // 1000
+        self.margin_db = margin_db
+        self.min_level_db = min_level_db
+        self.min_speech_sub_frames = max(min_speech_ms // SUB_FRAME_MS, 1)
+        self.hangover_ms = hangover_ms
+        self.noise_floor_db = None
+        self.in_speech = False
+        self.silence_ms = 0
+
+    def reset(self) -> None:
+        """
+        Forget the current utterance. The noise floor is kept
+        :return:
+        """
+        self.in_speech = False
+        self.silence_ms = 0
+
+    def levels(self, pcm) -> np.ndarray:
+        """
+        Get the levels of the sub-frames of the chunk
+        :param pcm: The int16 audio chunk as a bytes-like object
+        :return: The levels in dBFS
+        """
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        usable = len(samples) - len(samples) % self.sub_frame
+        sub_frames = samples[:usable].reshape(-1, self.sub_frame).astype(np.float32)
+        rms = np.sqrt(np.mean(np.square(sub_frames), axis=1))
+        return 20 * np.log10(np.maximum(rms, 1.0) / 32768)
+
+    def update(self, pcm) -> str:
+        """
+        Update the detector with the next chunk
+        :param pcm: The int16 audio chunk as a bytes-like object
+        :return: SPEECH while the utterance goes on, END_OF_SPEECH once it has ended,
+            SILENCE otherwise
+        """
+        levels = self.levels(pcm)
+        # The same value as np.percentile, which costs more than the rest of the update
+        # for the few sub-frames of a chunk
+        ordered = np.sort(levels)
+        position = NOISE_PERCENTILE / 100 * (len(ordered) - 1)
+        lower = int(position)
+        upper = min(lower + 1, len(ordered) - 1)
+        noise_db = float(ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower))
+        if self.noise_floor_db is None or noise_db < self.noise_floor_db:
+            self.noise_floor_db = noise_db
+        else:
+            self.noise_floor_db += NOISE_FLOOR_ADAPTATION * (noise_db - self.noise_floor_db)
+
+        threshold = max(self.noise_floor_db + self.margin_db, self.min_level_db)
+        voiced = np.flatnonzero(levels > threshold)
+        if len(voiced) < self.min_speech_sub_frames and not self.in_speech:
+            return SILENCE
+
+        if len(voiced):
+            self.in_speech = True
+            self.silence_ms = (len(levels) - 1 - voiced[-1]) * SUB_FRAME_MS
+        else:
+            self.silence_ms += len(levels) * SUB_FRAME_MS
+
+        if self.silence_ms >= self.hangover_ms:
+            self.reset()
+            return END_OF_SPEECH
+        return SPEECH
@@ -1,17 +1,66 @@
+import logging
+import threading
+
 import config
 from commands.processor import CommandProcessor
+from commands.watcher import CatalogWatcher
+from core.metrics import MetricsReporter, MetricsServer, SamplingProfiler, metrics
 from core.speech_to_text import STT
+from core.startup import Startup
+from core.text_to_speech import tts
 
 
 class VoiceAssistant:
     """
-    The voice assistant class
+    The voice assistant class.
+    The wake word engine is initialized first, and the Vosk model, the Silero model and
+    the commands are loaded concurrently, so the keyword is listened to while they are loading.
+    The vosk wake word engine shares the Vosk model, so it is created after the model is loaded
     """
 
     def __init__(self) -> None:
-        self.stt = STT()
-        self.cmd_processor = CommandProcessor()
+        self.startup = Startup()
+        self.tts = tts
+        self.stt = self.startup.run(
+            "wake_word", STT, grammar=self.read_grammar if config.STT_GRAMMAR else None
+        )
+        self.startup.submit("vosk_model", self.stt.load_recognizer)
+        if not self.stt.wake_word_ready.is_set():
+            self.startup.submit("vosk_wake_word", self.stt.load_wake_word)
+        self.startup.submit("tts_model", self.tts.load)
+        self._cmd_processor = self.startup.submit("commands", self._load_commands)
+        # Responses are synthesized in the background to be played from the cache
+        self.startup.submit("tts_prewarm", self._prewarm)
         self.microphone = config.STT_DEVICE
+        threading.Thread(target=self.startup.log_report, daemon=True).start()
+        self._start_metrics()
+
+    @staticmethod
+    def _start_metrics() -> None:
+        """
+        Start the profiler, the metrics endpoint and the periodic summary if they are enabled
+        :return:
+        """
+        if not config.METRICS_ENABLED:
+            return
+        profiler = SamplingProfiler(metrics) if config.PROFILER_ENABLED else None
+        if profiler is not None:
+            profiler.start()
+        if config.METRICS_PORT:
+            try:
+                MetricsServer(metrics, profiler).start()
+            except OSError as e:
+                logging.error(f"Error starting the metrics server: {e}")
+        if config.METRICS_LOG_INTERVAL > 0:
+            MetricsReporter(metrics, profiler).start()
+
+    @property
+    def cmd_processor(self) -> CommandProcessor:
+        """
+        The command processor, waiting for the commands to be loaded
+        :return:
+        """
+        return self._cmd_processor.result()
 
     @property
     def aliases(self):
@@ -21,12 +70,45 @@ class VoiceAssistant:
     def commands(self):
         return self.cmd_processor.commands
 
+    def _load_commands(self) -> CommandProcessor:
+        """
+        Load the commands and start watching their configs
+        :return: The command processor
+        """
+        processor = CommandProcessor(tts=self.tts)
+        if config.CMD_RELOAD_INTERVAL > 0:
+            # The grammar of the recognizer is rebuilt from the aliases of the reloaded commands
+            on_reload = self.stt.update_grammar if config.STT_GRAMMAR else None
+            CatalogWatcher(processor, on_reload=on_reload).start()
+        return processor
+
+    def read_grammar(self) -> list[str]:
+        return self.cmd_processor.read_commands_grammar()
+
+    def _prewarm(self) -> None:
+        """
+        Synthesize the responses of the commands when the commands and the model are loaded
+        :return:
+        """
+        self.tts.prewarm(self.cmd_processor.read_commands_responses())
+
+    def respond(self, text: str) -> bool:
+        return self.cmd_processor.respond(text)
+
+    def match_partial(self, text: str) -> bool:
+        return self.cmd_processor.partial_matcher.update(text)
+
     def listen(self):
         """
         Listen to the user input
         :return:
         """
-        self.stt.va_listen(self.cmd_processor.respond)
+        self.stt.va_listen(
+            self.respond,
+            on_keyword=self.tts.cancel,
+            is_muted=lambda: self.tts.is_speaking,
+            on_partial=self.match_partial if config.CMD_EARLY_DISPATCH else None,
+        )
 
     def run(self):
         self.listen()
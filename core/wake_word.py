@@ -0,0 +1,227 @@
+"""Wake word detectors: Porcupine, the offline Vosk keyword spotter and the energy-gated cascade"""
+
+import json
+import logging
+import struct
+from collections import deque
+from typing import Optional
+
+import pvporcupine
+import vosk
+
+import config
+from core.vad import END_OF_SPEECH, SILENCE, VoiceActivityDetector
+
+ENGINES = ("porcupine", "vosk")
+# Word returned by the grammar recognizer for the speech out of the grammar
+UNKNOWN_WORD = "[unk]"
+# Frame length of Porcupine, also used by the other detectors and without the wake word engine
+FRAME_LENGTH = 512
+
+
+class WakeWordDetector:
+    """
+    Base of the wake word detectors. Like Porcupine, a detector takes the audio frames
+    of frame_length int16 samples and returns the index of the detected keyword or -1.
+    The frames and the detections are counted for the stats
+    """
+
+    frame_length = FRAME_LENGTH
+
+    def __init__(self):
+        self.frames = 0
+        self.detections = 0
+
+    def process(self, frame: list[int]) -> int:
+        """
+        Detect the keyword in the frame
+        :param frame: The audio samples
+        :return: The index of the keyword or -1 if it is not detected
+        """
+        self.frames += 1
+        keyword_index = self._process(frame)
+        if keyword_index >= 0:
+            self.detections += 1
+        return keyword_index
+
+    def _process(self, frame: list[int]) -> int:
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        """
+        Forget the audio of the current utterance
+        :return:
+        """
+
+    def delete(self) -> None:
+        """
+        Release the resources of the engine
+        :return:
+        """
+
+    @property
+    def stats(self) -> dict:
+        return {"frames": self.frames, "detections": self.detections}
+
+
+class PorcupineDetector(WakeWordDetector):
+    """
+    Porcupine wake word engine with the keyword file from the Picovoice console
+    """
+
+    def __init__(
+        self,
+        access_key: str = config.PICOVOICE_API_KEY,
+        keyword_path: str = config.PICOVOICE_KEYWORD_PATH,
+        sensitivity: float = config.WAKE_WORD_SENSITIVITY,
+    ):
+        super().__init__()
+        self.porcupine = pvporcupine.create(
+            access_key=access_key, keyword_paths=[keyword_path], sensitivities=[sensitivity]
+        )
+        self.frame_length = self.porcupine.frame_length
+
+    def _process(self, frame: list[int]) -> int:
+        return self.porcupine.process(frame)
+
+    def delete(self) -> None:
+        self.porcupine.delete()
+
+
+class VoskKeywordDetector(WakeWordDetector):
+    """
+    Offline keyword spotter without an API key. The Vosk recognizer decodes the audio against
+    the grammar of the wake phrase only, and any other speech is decoded as the unknown word,
+    so a small model is enough. The phrase is looked for in the partial results,
+    so the detection doesn't wait for the endpointing
+    """
+
+    def __init__(
+        self,
+        phrase: str = config.WAKE_WORD_PHRASE,
+        model: Optional[vosk.Model] = None,
+        model_path: str = config.WAKE_WORD_MODEL_PATH or config.MODEL_PATH,
+        sample_rate: int = config.STT_SAMPLE_RATE,
+        frame_length: int = FRAME_LENGTH,
+    ):
+        """
+        :param phrase: The wake phrase
+        :param model: The Vosk model, e.g. shared with the speech recognizer.
+            Loaded from model_path if omitted
+        :param model_path: Path to the Vosk model
+        :param sample_rate: The sample rate of the audio
+        :param frame_length: Samples in a frame
+        """
+        super().__init__()
+        self.phrase = " ".join(phrase.lower().split())
+        if not self.phrase:
+            raise ValueError("The wake phrase is empty, set WAKE_WORD_PHRASE")
+        self.frame_length = frame_length
+        self.frame = struct.Struct(f"{frame_length}h")
+        self.model = model or vosk.Model(model_path=model_path)
+        self.recognizer = vosk.KaldiRecognizer(
+            self.model, sample_rate, json.dumps([self.phrase, UNKNOWN_WORD])
+        )
+
+    def _process(self, frame: list[int]) -> int:
+        if self.recognizer.AcceptWaveform(self.frame.pack(*frame)):
+            text = json.loads(self.recognizer.Result())["text"]
+        else:
+            text = json.loads(self.recognizer.PartialResult())["partial"]
+        if f" {self.phrase} " not in f" {text} ":
+            return -1
+        self.recognizer.Reset()
+        return 0
+
+    def reset(self) -> None:
+        self.recognizer.Reset()
+
+
+class EnergyGatedDetector(WakeWordDetector):
+    """
+    Cascade running the wrapped detector on the speech only. Every frame is checked by
+    the energy-based voice activity detector, which costs a fraction of the keyword model,
+    so the idle CPU is spent mostly on the silence check. The frames before the speech onset
+    are kept and passed to the detector when the speech starts, so the beginning
+    of the keyword is not lost
+    """
+
+    def __init__(
+        self,
+        detector: WakeWordDetector,
+        vad: Optional[VoiceActivityDetector] = None,
+        pre_roll_frames: int = config.WAKE_WORD_PRE_ROLL_FRAMES,
+    ):
+        """
+        :param detector: The wake word detector
+        :param vad: The voice activity detector. The default one if omitted
+        :param pre_roll_frames: Frames before the speech onset passed to the detector
+        """
+        super().__init__()
+        self.detector = detector
+        self.frame_length = detector.frame_length
+        self.frame = struct.Struct(f"{self.frame_length}h")
+        self.vad = vad or VoiceActivityDetector()
+        self.pre_roll: deque[list[int]] = deque(maxlen=pre_roll_frames)
+        self.in_speech = False
+        # Frames passed to the wrapped detector
+        self.gated_frames = 0
+
+    def _process(self, frame: list[int]) -> int:
+        state = self.vad.update(self.frame.pack(*frame))
+        if state == SILENCE:
+            self.pre_roll.append(frame)
+            return -1
+
+        frames = [frame]
+        if not self.in_speech:
+            self.in_speech = True
+            frames = [*self.pre_roll, frame]
+            self.pre_roll.clear()
+        keyword_index = -1
+        for speech_frame in frames:
+            self.gated_frames += 1
+            keyword_index = self.detector.process(speech_frame)
+            if keyword_index >= 0:
+                break
+        if state == END_OF_SPEECH:
+            self.reset()
+        return keyword_index
+
+    def reset(self) -> None:
+        self.in_speech = False
+        self.vad.reset()
+        self.detector.reset()
+
+    def delete(self) -> None:
+        self.detector.delete()
+
+    @property
+    def stats(self) -> dict:
+        return {
+            **super().stats,
+            "gated_frames": self.gated_frames,
+            "duty_cycle": self.gated_frames / self.frames if self.frames else None,
+        }
+
+
+def create_detector(
+    engine: str = config.WAKE_WORD_ENGINE,
+    gated: bool = config.WAKE_WORD_GATE,
+    model: Optional[vosk.Model] = None,
+) -> WakeWordDetector:
+    """
+    Create the wake word detector
+    :param engine: One of ENGINES
+    :param gated: Run the detector on the speech only
+    :param model: The Vosk model of the vosk engine. Loaded from WAKE_WORD_MODEL_PATH if omitted
+    :return: The detector
+    """
+    if engine == "porcupine":
+        detector = PorcupineDetector()
+    elif engine == "vosk":
+        detector = VoskKeywordDetector(model=model)
+    else:
+        raise ValueError(f"Unknown wake word engine {engine}, expected one of {ENGINES}")
+    logging.info(f"Using the {engine} wake word engine{' on the speech only' if gated else ''}")
+    return EnergyGatedDetector(detector) if gated else detector